@@ -0,0 +1,12 @@
+"""
+Benchmark suite of ExoRad.
+
+It times the :mod:`exorad.utils.exolib` kernels, the channel build of the example payload,
+the observation of a target with Planck and custom seds and the observation
+of synthetic target lists of growing size with a growing number of workers.
+The inputs are synthetic, so the suite runs offline, from the repository.
+The results are saved as JSON, to be compared between commits::
+
+    exorad-bench -o before.json
+    exorad-bench -o after.json -c before.json
+"""
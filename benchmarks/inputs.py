@@ -0,0 +1,153 @@
+"""
+Synthetic inputs of the benchmarks. They are built from the example payload
+and from generated targets and spectra only, so that the benchmarks run offline.
+"""
+import os
+import pathlib
+
+import astropy.units as u
+import numpy as np
+from astropy.table import QTable
+from astropy.table import Table
+
+from exorad.utils.exolib import planck
+
+root_dir = pathlib.Path(__file__).parent.parent.absolute()
+examples_dir = os.path.join(root_dir, "examples")
+
+
+def example_payload(destination, working_R=None):
+    """
+    writes the example payload with the configuration path set to the repository
+    and returns the file name
+
+    Parameters
+    ----------
+    destination: str
+        output directory
+    working_R: float
+        if given, it replaces the working resolution of the payload. Default is None
+    """
+    name = "payload_example.xml"
+    if working_R is not None:
+        name = "payload_example_R{:g}.xml".format(working_R)
+    payload_file = os.path.join(destination, name)
+    with open(os.path.join(examples_dir, "payload_example.xml")) as old:
+        with open(payload_file, "w") as new:
+            for line in old:
+                if "<ConfigPath>" in line:
+                    line = "    <ConfigPath> {}\n".format(root_dir)
+                elif "<working_R>" in line and working_R is not None:
+                    line = "        <working_R> {:g} </working_R>\n".format(
+                        working_R
+                    )
+                new.write(line)
+    return payload_file
+
+
+def synthetic_catalog(n, seed=0, planets=True):
+    """
+    Generates a catalog of main sequence stars, each hosting a transiting planet,
+    in the schema of :class:`~exorad.models.targetlist.QTableTargetList`.
+
+    The star masses are drawn from a power law favouring low mass stars and the other
+    star parameters follow the main sequence relations :math:`R \\propto M^{0.8}`
+    and :math:`L \\propto M^4`. The stars are uniformly distributed in the volume within 100 pc.
+    The planet periods are log-uniform between 0.5 and 50 days, the radii log-uniform between
+    1 Earth radius and 1.5 Jupiter radii, and the equilibrium temperatures follow from the orbit.
+
+    Parameters
+    ----------
+    n: int
+        number of targets
+    seed: int
+        seed of the random generator. Default is 0
+    planets: bool
+        if True, the catalog lists a planet for each star. Default is True
+
+    Returns
+    -------
+    QTable:
+        catalog. See :func:`to_csv_table` to write it in csv format
+    """
+    rng = np.random.default_rng(seed)
+    # power law dN/dM ~ M^-2.3 between 0.4 and 1.5 solar masses
+    alpha, m_min, m_max = -1.3, 0.4, 1.5
+    mass = (
+        m_min**alpha
+        + rng.uniform(size=n) * (m_max**alpha - m_min**alpha)
+    ) ** (1 / alpha)
+    radius = mass**0.8
+    teff = np.round(5772 * (mass**4 / radius**2) ** 0.25)
+    distance = 100 * rng.uniform(0.05**3, 1, n) ** (1 / 3)
+    # absolute K magnitude from the luminosity, with the solar bolometric correction
+    magk = 3.27 - 2.5 * np.log10(mass**4) + 5 * np.log10(distance / 10)
+
+    table = QTable()
+    table["star name"] = ["synthetic-{}".format(i) for i in range(n)]
+    table["star M"] = mass * u.M_sun
+    table["star Teff"] = teff * u.K
+    table["star R"] = radius * u.R_sun
+    table["star D"] = distance * u.pc
+    table["star magk"] = np.round(magk, 3) * u.Unit("")
+    table["star ra"] = rng.uniform(0, 360, n) * u.deg
+    table["star dec"] = np.degrees(np.arcsin(rng.uniform(-1, 1, n))) * u.deg
+    if not planets:
+        return table
+
+    period = np.exp(rng.uniform(np.log(0.5), np.log(50), n))
+    # Kepler's third law in solar units: a [AU] = (M [M_sun] P^2 [yr])^(1/3)
+    semi_major_axis = (mass * (period / 365.25) ** 2) ** (1 / 3)
+    planet_radius = np.exp(
+        rng.uniform(np.log(u.R_earth.to(u.R_jup)), np.log(1.5), n)
+    )
+    t_eq = teff * np.sqrt(
+        (radius * u.R_sun).to_value(u.AU) / (2 * semi_major_axis)
+    )
+    table["planet name"] = ["synthetic-{} b".format(i) for i in range(n)]
+    table["planet R"] = planet_radius * u.R_jup
+    table["planet P"] = period * u.day
+    table["planet a"] = semi_major_axis * u.AU
+    table["planet T"] = np.round(t_eq) * u.K
+    return table
+
+
+def to_csv_table(catalog):
+    """
+    converts a catalog from :func:`synthetic_catalog` into the schema of
+    :class:`~exorad.models.targetlist.CSVTargetList`, with the units in the column names
+    """
+    table = Table()
+    for key in catalog.keys():
+        column = catalog[key]
+        unit = getattr(column, "unit", None)
+        if unit is None:
+            table[key] = column
+        elif unit == u.Unit(""):
+            table[key] = column.value
+        else:
+            table["{} [{}]".format(key, unit.to_string())] = column.value
+    return table
+
+
+def write_catalog(n, destination, seed=0, planets=True):
+    """writes a synthetic catalog of n targets in csv format and returns the file name"""
+    filename = os.path.join(destination, "catalog_{}.csv".format(n))
+    to_csv_table(synthetic_catalog(n, seed, planets)).write(
+        filename, format="csv", overwrite=True
+    )
+    return filename
+
+
+def custom_sed(destination, T=5000 * u.K):
+    """
+    writes a black body sed in the format read by :class:`~exorad.models.source.CustomSed`
+    and returns the file name
+    """
+    wl = np.linspace(0.3, 10, 20000) * u.um
+    table = QTable()
+    table["Wavelength"] = wl
+    table["Sed"] = (np.pi * u.sr * planck(wl, T)).to(u.W / u.m**2 / u.um)
+    filename = os.path.join(destination, "custom_sed.ecsv")
+    table.write(filename, format="ascii.ecsv", overwrite=True)
+    return filename
@@ -0,0 +1,116 @@
+"""
+Per-target cost of the debug log messages.
+
+The log messages are formatted only when a handler emits them.
+This benchmark observes the same target with the debug messages disabled,
+and with a handler that formats the arguments of every debug message and discards them,
+which is the cost paid on every target when the messages were formatted in the logging calls.
+The payload is the example payload and the target is a Planck star, so the benchmark runs offline.
+
+Run it from the repository with::
+
+    python -m benchmarks.logging_overhead -n 20
+
+It is also part of the benchmark suite run by `exorad-bench`.
+"""
+import argparse
+import copy
+import logging
+import os
+import tempfile
+import time
+
+import exorad.tasks as tasks
+from benchmarks.inputs import example_payload
+from benchmarks.inputs import examples_dir
+from exorad.log import disableLogging
+from exorad.log.logger import root_logger
+
+
+class FormattingHandler(logging.Handler):
+    """
+    formats the message arguments with `str.format`, as the logging calls did, and discards them
+    """
+
+    def emit(self, record):
+        for arg in record.args or ():
+            "{}".format(arg)
+
+
+def time_targets(target, payload, channels, wl_range, n):
+    observeTarget = tasks.ObserveTarget()
+    start = time.perf_counter()
+    for _ in range(n):
+        observeTarget(
+            target=copy.deepcopy(target),
+            payload=payload,
+            channels=channels,
+            wl_range=wl_range,
+        )
+    return (time.perf_counter() - start) / n
+
+
+def measure_overhead(target, payload, channels, wl_range, n):
+    """
+    Returns
+    -------
+    (float, float):
+        time per target [s] with the debug messages disabled and with the debug messages formatted
+    """
+    disableLogging()
+    # warm up the caches
+    time_targets(target, payload, channels, wl_range, 1)
+
+    disabled = time_targets(target, payload, channels, wl_range, n)
+
+    handler = FormattingHandler(level=logging.DEBUG)
+    root_logger.addHandler(handler)
+    root_logger.setLevel(logging.DEBUG)
+    try:
+        formatted = time_targets(target, payload, channels, wl_range, n)
+    finally:
+        root_logger.removeHandler(handler)
+        disableLogging()
+    return disabled, formatted
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="per-target cost of the debug log messages"
+    )
+    parser.add_argument(
+        "-n",
+        "--number",
+        dest="number",
+        default=20,
+        type=int,
+        help="number of observed targets",
+    )
+    args = parser.parse_args()
+
+    disableLogging()
+    with tempfile.TemporaryDirectory() as tmp:
+        payload, channels, wl_range = tasks.PreparePayload()(
+            payload_file=example_payload(tmp), output=None
+        )
+    payload["common"]["sourceSpectrum"] = {"value": "Planck"}
+    target = tasks.LoadTargetList()(
+        target_list=os.path.join(examples_dir, "test_target.csv")
+    ).target[0]
+    disabled, formatted = measure_overhead(
+        target, payload, channels, wl_range, args.number
+    )
+
+    print("debug messages disabled  : {:.2f} ms/target".format(disabled * 1e3))
+    print(
+        "debug messages formatted : {:.2f} ms/target".format(formatted * 1e3)
+    )
+    print(
+        "saved per target         : {:.2f} ms ({:.0%})".format(
+            (formatted - disabled) * 1e3, 1 - disabled / formatted
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Runs the benchmark suite and saves the results as JSON, so that runs can be compared between commits.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+from benchmarks.suite import BENCHMARKS
+from benchmarks.suite import Inputs
+
+
+def _default_workers():
+    workers, n = [], 1
+    while n <= (os.cpu_count() or 1):
+        workers.append(n)
+        n *= 2
+    return workers
+
+
+def _git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def silenced_console():
+    """
+    discards the log messages printed on screen.
+    The pipeline logs each target as in a standard run, but the messages would bury the report
+    """
+    from exorad.log import disableLogging
+    from exorad.log.logger import root_logger
+
+    disableLogging()
+    with open(os.devnull, "w") as devnull:
+        stream = root_logger.handlers[0].setStream(devnull)
+        try:
+            yield
+        finally:
+            root_logger.handlers[0].setStream(stream)
+
+
+def metadata():
+    """describes the code and the machine running the benchmarks"""
+    import numpy
+    import astropy
+    import exorad.__version__ as version
+
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "exorad": version.__version__,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "astropy": astropy.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run(names, options, destination):
+    """
+    Runs the benchmarks.
+
+    Parameters
+    ----------
+    names: list
+        names of the benchmarks to run
+    options: argparse.Namespace
+        run options
+    destination: str
+        directory of the input and output files
+
+    Returns
+    -------
+    list:
+        a record for each benchmark and set of parameters
+    """
+    data = Inputs(destination)
+    results = []
+    for name in names:
+        for record in BENCHMARKS[name](data, options):
+            record = dict(name=name, **record)
+            print(_format(record), flush=True)
+            results.append(record)
+    return results
+
+
+def _key(record):
+    return record["name"], json.dumps(record["params"], sort_keys=True)
+
+
+def _format(record, reference=None):
+    params = ", ".join("{}={}".format(*p) for p in record["params"].items())
+    line = "{:<32} {:<40} {:>12.3f} ms".format(
+        record["name"], params, record["min"] * 1e3
+    )
+    if "targets_per_s" in record:
+        line += " {:>10.1f} targets/s".format(record["targets_per_s"])
+    if reference is not None:
+        line += " {:>8.2f}x".format(reference["min"] / record["min"])
+    return line
+
+
+def compare(results, reference):
+    """prints the results with the speed-up over the reference results"""
+    reference = {_key(r): r for r in reference}
+    print("speed-up over the reference run:")
+    for record in results:
+        print(_format(record, reference.get(_key(record))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ExoRad benchmark suite")
+    parser.add_argument(
+        "-k",
+        "--select",
+        dest="select",
+        nargs="+",
+        default=None,
+        help="run only the benchmarks whose name contains one of these strings",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default=None,
+        help="output JSON file. Default is exorad-bench-<date>.json",
+    )
+    parser.add_argument(
+        "-c",
+        "--compare",
+        dest="compare",
+        default=None,
+        help="JSON file of a previous run to compare with",
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        dest="repeat",
+        default=5,
+        type=int,
+        help="number of measures of each benchmark",
+    )
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        default=[10, 1000, 10000],
+        type=int,
+        help="catalog sizes of the target list benchmarks",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        nargs="+",
+        default=_default_workers(),
+        type=int,
+        help="numbers of workers of the target list benchmarks. Default is the powers of 2 up to the cpu count",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        dest="batch",
+        default=1,
+        type=int,
+        help="batch size of the target list benchmarks",
+    )
+    parser.add_argument(
+        "--quick",
+        dest="quick",
+        default=False,
+        action="store_true",
+        help="smoke run: one measure of each benchmark and a catalog of 10 targets",
+    )
+    parser.add_argument(
+        "-l",
+        "--list",
+        dest="list",
+        default=False,
+        action="store_true",
+        help="list the benchmarks and exit",
+    )
+    options = parser.parse_args()
+
+    if options.list:
+        print("\n".join(BENCHMARKS))
+        return
+    if options.quick:
+        options.repeat = 1
+        options.sizes = [10]
+    names = [
+        name
+        for name in BENCHMARKS
+        if options.select is None
+        or any(s.lower() in name.lower() for s in options.select)
+    ]
+    if not names:
+        parser.error("no benchmark selected")
+
+    with silenced_console():
+        with tempfile.TemporaryDirectory() as destination:
+            results = run(names, options, destination)
+
+    output = options.output or "exorad-bench-{}.json".format(
+        datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    )
+    with open(output, "w") as f:
+        json.dump(
+            {
+                "metadata": metadata(),
+                "options": vars(options),
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    print("results saved in {}".format(output))
+
+    if options.compare is not None:
+        with open(options.compare) as f:
+            compare(results, json.load(f)["results"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""
+Scaling curves of the target list observation.
+
+It observes synthetic catalogs with :class:`~exorad.tasks.targetHandler.ObserveTargetlist`
+for every combination of catalog size, number of workers and working resolution,
+and reports the throughput, the peak memory of the main process and of the workers,
+the parallel efficiency and the spread of the intervals between completed targets.
+Each combination runs in a fresh process, so that the memory peaks and the caches
+of a run do not affect the others. Run it from the repository with::
+
+    exorad-bench-scaling --sizes 100 1000 --workers 1 2 4 --resolutions 1000 6000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks import inputs
+
+
+def _peak_rss():
+    """peak resident memory [MiB] of this process and of the largest of its terminated children"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # the peak is in kiB on Linux and in bytes on macOS
+    scale = 1024**2 if sys.platform == "darwin" else 1024
+    return tuple(
+        resource.getrusage(who).ru_maxrss / scale
+        for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN)
+    )
+
+
+class _CompletionWriter:
+    """stands for the target writer, recording when each target is completed"""
+
+    def __init__(self):
+        self.completed = []
+
+    def put(self, target):
+        self.completed.append(time.perf_counter())
+
+
+def observe(payload_file, catalog_file, workers, batch):
+    """
+    Observes a catalog and measures the run.
+
+    Parameters
+    ----------
+    payload_file: str
+        payload description file
+    catalog_file: str
+        target list file
+    workers: int
+        number of worker processes
+    batch: int
+        number of targets observed together
+
+    Returns
+    -------
+    dict:
+        run time [s], throughput [targets/s], peak memory [MiB] of the main process and of the workers,
+        time to the first target [s] and percentiles of the intervals between completed targets [s]
+    """
+    import exorad.tasks as tasks
+
+    payload, channels, wl_range = tasks.PreparePayload()(
+        payload_file=payload_file, output=None
+    )
+    payload["common"]["sourceSpectrum"] = {"value": "Planck"}
+    targets = tasks.LoadTargetList()(target_list=catalog_file).target
+
+    writer = _CompletionWriter()
+    start = time.perf_counter()
+    tasks.ObserveTargetlist()(
+        targets=targets,
+        payload=payload,
+        channels=channels,
+        wl_range=wl_range,
+        plot=False,
+        out_dir=None,
+        n_thread=workers,
+        batch_size=batch,
+        writer=writer,
+    )
+    run_time = time.perf_counter() - start
+    main_rss, worker_rss = _peak_rss()
+    completed = np.asarray(writer.completed) - start
+    intervals = np.diff(completed) if completed.size > 1 else completed
+    return {
+        "time": run_time,
+        "observed": int(completed.size),
+        "targets_per_s": completed.size / run_time,
+        "main_rss": main_rss,
+        # the main process is the only worker of serial runs
+        "worker_rss": worker_rss if workers > 1 else main_rss,
+        "first_target": float(completed[0]) if completed.size else None,
+        "interval_p50": float(np.percentile(intervals, 50)),
+        "interval_p99": float(np.percentile(intervals, 99)),
+        "interval_max": float(intervals.max()),
+    }
+
+
+def _observe_in_process(payload_file, catalog_file, workers, batch):
+    """runs :func:`observe` in a fresh python process"""
+    with tempfile.NamedTemporaryFile(suffix=".json") as result:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.scaling",
+                "--child",
+                json.dumps([payload_file, catalog_file, workers, batch]),
+                result.name,
+            ],
+            check=True,
+            cwd=inputs.root_dir,
+        )
+        with open(result.name) as f:
+            return json.load(f)
+
+
+def sweep(sizes, workers, resolutions, batch=1, seed=0, destination=None):
+    """
+    Observes synthetic catalogs for every combination of size, number of workers and resolution.
+
+    Parameters
+    ----------
+    sizes: list
+        catalog sizes
+    workers: list
+        numbers of worker processes
+    resolutions: list
+        working resolutions. None stands for the resolution of the example payload
+    batch: int
+        number of targets observed together. Default is 1
+    seed: int
+        seed of the catalogs. Default is 0
+    destination: str
+        directory of the payload and catalog files. Default is a temporary directory
+
+    Returns
+    -------
+    list:
+        a record of the measures of :func:`observe` for each combination,
+        with the parallel efficiency relative to the serial run, if measured
+    """
+    if destination is None:
+        with tempfile.TemporaryDirectory() as tmp:
+            return sweep(sizes, workers, resolutions, batch, seed, tmp)
+
+    results = []
+    for working_R in resolutions:
+        payload_file = inputs.example_payload(destination, working_R)
+        for size in sizes:
+            catalog_file = inputs.write_catalog(size, destination, seed)
+            serial = None
+            for n in workers:
+                record = {
+                    "working_R": working_R,
+                    "targets": size,
+                    "workers": n,
+                    "batch": batch,
+                }
+                record.update(
+                    _observe_in_process(payload_file, catalog_file, n, batch)
+                )
+                if n == 1:
+                    serial = record["targets_per_s"]
+                record["efficiency"] = (
+                    record["targets_per_s"] / (n * serial) if serial else None
+                )
+                print(_format(record), flush=True)
+                results.append(record)
+    return results
+
+
+def _format(record):
+    def value(key, fmt):
+        return "-" if record[key] is None else fmt.format(record[key])
+
+    return (
+        "R={:<6} targets={:<7} workers={:<3} {:>9.1f} targets/s "
+        "efficiency={:>5}  rss main/worker={}/{} MiB  "
+        "interval p50/p99={:.1f}/{:.1f} ms".format(
+            value("working_R", "{:g}"),
+            record["targets"],
+            record["workers"],
+            record["targets_per_s"],
+            value("efficiency", "{:.0%}"),
+            value("main_rss", "{:.0f}"),
+            value("worker_rss", "{:.0f}"),
+            record["interval_p50"] * 1e3,
+            record["interval_p99"] * 1e3,
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="scaling curves of the target list observation"
+    )
+    parser.add_argument(
+        "--sizes",
+        dest="sizes",
+        nargs="+",
+        default=[100, 1000],
+        type=int,
+        help="catalog sizes",
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        nargs="+",
+        default=[1, 2, 4],
+        type=int,
+        help="numbers of worker processes",
+    )
+    parser.add_argument(
+        "--resolutions",
+        dest="resolutions",
+        nargs="+",
+        default=[None],
+        type=float,
+        help="working resolutions. Default is the one of the example payload",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        dest="batch",
+        default=1,
+        type=int,
+        help="number of targets observed together",
+    )
+    parser.add_argument(
+        "-s", "--seed", dest="seed", default=0, type=int, help="catalog seed"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        default=None,
+        help="output JSON file",
+    )
+    parser.add_argument("--child", nargs=2, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child is not None:
+        arguments, result = options.child
+        from benchmarks.run import silenced_console
+
+        with silenced_console():
+            record = observe(*json.loads(arguments))
+        with open(result, "w") as f:
+            json.dump(record, f)
+        return
+
+    results = sweep(
+        options.sizes,
+        options.workers,
+        options.resolutions,
+        options.batch,
+        options.seed,
+    )
+    if options.output is not None:
+        from benchmarks.run import metadata
+
+        with open(options.output, "w") as f:
+            json.dump(
+                {
+                    "metadata": metadata(),
+                    "options": vars(options),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
+        print("results saved in {}".format(options.output))
+
+
+if __name__ == "__main__":
+    main()
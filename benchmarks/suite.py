@@ -0,0 +1,381 @@
+"""
+Benchmarks of the ExoRad kernels and pipeline.
+
+Each benchmark is a generator registered with :func:`benchmark`:
+it receives the shared :class:`Inputs` and the run options, and yields a record
+for each set of parameters it measures.
+"""
+import copy
+import statistics
+import time
+from collections import OrderedDict
+
+import astropy.units as u
+import numpy as np
+
+import exorad.tasks as tasks
+from benchmarks import inputs
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(name):
+    """registers a benchmark under the given name"""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+def measure(func, repeat=5, number=1):
+    """
+    Times a function.
+
+    Parameters
+    ----------
+    func: callable
+        function to time, called without arguments
+    repeat: int
+        number of measures. Default is 5
+    number: int
+        number of calls in each measure. Default is 1
+
+    Returns
+    -------
+    dict:
+        minimum, median, mean and standard deviation of the time of a call [s], with the number of measures and calls
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return {
+        "repeat": repeat,
+        "number": number,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if repeat > 1 else 0.0,
+    }
+
+
+class Inputs:
+    """
+    Inputs shared by the benchmarks, built the first time they are used.
+
+    Parameters
+    ----------
+    destination: str
+        directory of the input and output files
+    """
+
+    def __init__(self, destination):
+        self.destination = destination
+        self._payload = None
+        self._catalogs = {}
+
+    @property
+    def payload_file(self):
+        return inputs.example_payload(self.destination)
+
+    @property
+    def payload(self):
+        """payload, channels and wavelength range of the example payload"""
+        if self._payload is None:
+            self._payload = tasks.PreparePayload()(
+                payload_file=self.payload_file, output=None
+            )
+        return self._payload
+
+    def source(self, kind):
+        """source description of the payload, for 'planck' or 'custom' seds"""
+        if kind == "custom":
+            return {
+                "value": "custom",
+                "CustomSed": {"value": inputs.custom_sed(self.destination)},
+            }
+        return {"value": "Planck"}
+
+    def catalog(self, n):
+        """synthetic catalog of n targets"""
+        if n not in self._catalogs:
+            self._catalogs[n] = tasks.LoadTargetList()(
+                target_list=inputs.write_catalog(n, self.destination)
+            ).target
+        return self._catalogs[n]
+
+
+@benchmark("exolib.rebin")
+def bench_rebin(data, options):
+    from exorad.utils.exolib import rebin
+
+    xp = np.linspace(0.3, 10, 100000) * u.um
+    fp = np.exp(-xp.value)
+    x = np.linspace(0.5, 8, 5000) * u.um
+    yield dict(
+        measure(lambda: rebin(x, xp, fp), repeat=options.repeat, number=10),
+        params={"size": xp.size, "new_size": x.size},
+    )
+
+
+@benchmark("exolib.planck")
+def bench_planck(data, options):
+    from exorad.utils.exolib import planck
+
+    wl = np.linspace(0.3, 10, 100000) * u.um
+    yield dict(
+        measure(
+            lambda: planck(wl, 5000 * u.K), repeat=options.repeat, number=10
+        ),
+        params={"size": wl.size},
+    )
+
+
+# optics of the photometer of the example payload
+_psf_args = (30, 50, 0.55 * u.um, 18 * u.um)
+
+
+@benchmark("exolib.binnedPSF")
+def bench_binned_psf(data, options):
+    from exorad.utils.exolib import binnedPSF
+
+    yield dict(
+        measure(
+            lambda: binnedPSF(*_psf_args),
+            repeat=options.repeat,
+        ),
+        params={"Fnum_x": 30, "Fnum_y": 50, "wl": 0.55},
+    )
+
+
+@benchmark("exolib.OmegaPix")
+def bench_omega_pix(data, options):
+    from exorad.utils.exolib import OmegaPix
+
+    yield dict(
+        measure(lambda: OmegaPix(20, 25), repeat=options.repeat, number=100),
+        params={"Fnum_x": 20, "Fnum_y": 25},
+    )
+
+
+@benchmark("exolib.find_aperture_radius")
+def bench_find_aperture_radius(data, options):
+    from exorad.utils.exolib import binnedPSF
+    from exorad.utils.exolib import find_aperture_radius
+
+    prf, _, _ = binnedPSF(*_psf_args)
+    yield dict(
+        measure(
+            lambda: find_aperture_radius(prf, 0.91, *_psf_args[:3]),
+            repeat=options.repeat,
+        ),
+        params={"EnE": 0.91},
+    )
+
+
+@benchmark("BuildChannels")
+def bench_build_channels(data, options):
+    payload = tasks.LoadOptions()(filename=data.payload_file)
+    buildChannels = tasks.BuildChannels()
+    for n_thread in options.workers:
+        yield dict(
+            measure(
+                lambda: buildChannels(
+                    payload=payload,
+                    write=False,
+                    output=None,
+                    n_thread=n_thread,
+                ),
+                repeat=max(1, options.repeat // 2),
+            ),
+            params={"payload": "payload_example.xml", "workers": n_thread},
+        )
+
+
+@benchmark("OpticalPath.signal")
+def bench_optical_path(data, options):
+    from exorad.models.optics.opticalPath import OpticalPath
+    from exorad.utils.passVal import PassVal
+
+    payload, channels, _ = data.payload
+    for name, channel in channels.items():
+        description = channel.description
+        wl_grid = (
+            np.logspace(
+                np.log10(description["detector"]["wl_min"]["value"].value),
+                np.log10(description["detector"]["cut_off"]["value"].value),
+                PassVal.working_R,
+            )
+            * u.um
+        )
+        table = channel.table.copy()
+        table.remove_columns(
+            ["instrument_signal", "instrument_MaxSignal_inPixel"]
+        )
+
+        def signal():
+            common = OpticalPath(wl=wl_grid, description=payload)
+            path = OpticalPath(wl=wl_grid, description=description)
+            path.prepend_optical_elements(common.optical_element_dict)
+            path.chain()
+            path.compute_signal(table, channel.built_instr)
+
+        yield dict(
+            measure(signal, repeat=options.repeat),
+            params={"channel": name, "size": wl_grid.size},
+        )
+
+
+@benchmark("ObserveTarget")
+def bench_observe_target(data, options):
+    payload, channels, wl_range = data.payload
+    target = data.catalog(1)[0]
+    observeTarget = tasks.ObserveTarget()
+    for kind in ("planck", "custom"):
+        payload = dict(payload)
+        payload["common"] = dict(
+            payload["common"], sourceSpectrum=data.source(kind)
+        )
+
+        def observe():
+            observeTarget(
+                target=copy.deepcopy(target),
+                payload=payload,
+                channels=channels,
+                wl_range=wl_range,
+            )
+
+        # the first target fills the caches
+        observe()
+        yield dict(
+            measure(observe, repeat=options.repeat, number=5),
+            params={"sed": kind},
+        )
+
+
+@benchmark("noise.sweep")
+def bench_noise_sweep(data, options):
+    from exorad.models.noise import channel_noise
+    from exorad.models.noise import noise_sweep
+
+    payload, channels, wl_range = data.payload
+    payload = dict(payload)
+    payload["common"] = dict(
+        payload["common"], sourceSpectrum=data.source("planck")
+    )
+    target = tasks.ObserveTarget()(
+        target=data.catalog(1)[0],
+        payload=payload,
+        channels=channels,
+        wl_range=wl_range,
+    )
+    for name, channel in channels.items():
+        rows = target.table["chName"] == name
+        table = {
+            key: target.table[key][rows]
+            for key in target.table.keys()
+            if "noise" not in key
+        }
+        grid = OrderedDict(
+            read_noise=np.linspace(5, 30, 5) * u.ct,
+            dark_current=np.logspace(-1, 2, 5) * u.ct / u.s,
+            freqNDR=np.logspace(-2, 1, 5) * u.Hz,
+            well_depth=np.linspace(5e4, 2e5, 5) * u.ct,
+        )
+
+        def sweep():
+            noise_sweep(
+                table,
+                channel.description,
+                channel.payload,
+                read_noise=grid["read_noise"],
+                dark_current=grid["dark_current"],
+                freq_ndr=grid["freqNDR"],
+                well_depth=grid["well_depth"],
+            )
+
+        def loop():
+            description = copy.deepcopy(channel.description)
+            for point in np.ndindex(*(q.size for q in grid.values())):
+                for key, i in zip(grid, point):
+                    description["detector"][key]["value"] = grid[key][i]
+                channel_noise(table, description, channel.payload)
+
+        size = int(np.prod([q.size for q in grid.values()]))
+        for mode, func in (("sweep", sweep), ("loop", loop)):
+            record = dict(
+                measure(func, repeat=options.repeat),
+                params={"channel": name, "grid": size, "mode": mode},
+            )
+            record["points_per_s"] = size / record["min"]
+            yield record
+
+
+@benchmark("ObserveTargetlist")
+def bench_observe_target_list(data, options):
+    import os
+    from exorad.output.hdf5 import HDF5TargetWriter
+
+    payload, channels, wl_range = data.payload
+    payload = dict(payload)
+    payload["common"] = dict(
+        payload["common"], sourceSpectrum=data.source("planck")
+    )
+    observeTargetList = tasks.ObserveTargetlist()
+    output = os.path.join(data.destination, "targets.h5")
+    for size in options.sizes:
+        targets = data.catalog(size)
+        for workers in options.workers:
+            # the targets are updated by the observation
+            fresh = copy.deepcopy(targets)
+
+            def observe():
+                # the targets are written as in a standard run,
+                # so that they are not retained in memory
+                with HDF5TargetWriter(output, append=False) as writer:
+                    observeTargetList(
+                        targets=fresh,
+                        payload=payload,
+                        channels=channels,
+                        wl_range=wl_range,
+                        plot=False,
+                        out_dir=None,
+                        n_thread=workers,
+                        batch_size=options.batch,
+                        writer=writer,
+                    )
+
+            record = dict(
+                measure(observe, repeat=1),
+                params={
+                    "targets": size,
+                    "workers": workers,
+                    "batch": options.batch,
+                },
+            )
+            record["targets_per_s"] = size / record["min"]
+            yield record
+
+
+@benchmark("logging.debug_overhead")
+def bench_logging_overhead(data, options):
+    from benchmarks.logging_overhead import measure_overhead
+
+    payload, channels, wl_range = data.payload
+    payload = dict(payload)
+    payload["common"] = dict(
+        payload["common"], sourceSpectrum=data.source("planck")
+    )
+    disabled, formatted = measure_overhead(
+        data.catalog(1)[0], payload, channels, wl_range, 5 * options.repeat
+    )
+    yield {
+        "params": {"targets": 5 * options.repeat},
+        "disabled": disabled,
+        "formatted": formatted,
+        "min": disabled,
+    }
@@ -36,6 +36,7 @@ __title__ = "ExoRad2"
 __copyright__ = "2020-{:d}, {}".format(date.today().year, __author__)
 __citation__ = "Mugnai et al., 2023, 'ExoRad 2.0: The generic point source radiometric model'. Journal of Open Source Software, 8(89), 5348,"
 
+from .exorad import renoise_pipeline
 from .exorad import standard_pipeline
 
 
@@ -2,14 +2,27 @@ import logging
 import os
 import pathlib
 import shutil
+import sys
 
+import h5py
 import matplotlib.pyplot as plt
 
 import exorad.__version__ as version
 import exorad.tasks as tasks
 from exorad.log import addLogFile
 from exorad.log import setLogLevel
+from exorad.output.hdf5 import completed_targets
+from exorad.output.hdf5 import same_payload
 from exorad.output.hdf5 import HDF5Output
+from exorad.output.hdf5 import HDF5TargetWriter
+from exorad.output.hdf5.hdf5 import HDF5OutputGroup
+from exorad.output.hdf5.util import load_table
+from exorad.output.hdf5.util import load_table_columns
+from exorad.output.hdf5.util import update_table_columns
+from exorad.utils import profiling
+from exorad.utils.mpi import gather
+from exorad.utils.mpi import get_rank
+from exorad.utils.mpi import nprocs
 from exorad.utils.plotter import Plotter
 
 logger = logging.getLogger("exorad")
@@ -20,6 +33,8 @@ loadTargetList = tasks.LoadTargetList()
 loadSource = tasks.LoadSource()
 observeTarget = tasks.ObserveTarget()
 observeTargetList = tasks.ObserveTargetlist()
+loadOptions = tasks.LoadOptions()
+estimateTargetsNoise = tasks.EstimateTargetsNoise()
 
 
 def efficiency_plot(channels, output_dir=None):
@@ -46,11 +61,16 @@ def standard_pipeline(
     debug=False,
     log=False,
     replace=True,
+    resume=False,
+    batch_size=1,
+    timing=False,
+    timing_memory=False,
+    profile=None,
 ):
     from exorad.utils.ascii_art import ascii_art
 
     logger.info(ascii_art)
-    logger.info("code version {}".format(version.__version__))
+    logger.info("code version %s", version.__version__)
 
     if debug:
         setLogLevel(logging.DEBUG)
@@ -59,8 +79,41 @@ def standard_pipeline(
     elif log:
         addLogFile()
 
+    if get_rank() != 0:
+        # when run with MPI, only the root process prepares the run and writes the output.
+        # The other processes receive payload, channels and targets from it
+        observeTargetList(
+            targets=[],
+            payload=None,
+            channels=None,
+            wl_range=None,
+            plot=plot,
+            out_dir=None,
+            n_thread=n_thread,
+            debug=debug,
+            batch_size=batch_size,
+        )
+        if profiling.disable_code_profiling() is not None:
+            # the root process merges the stats once all are written
+            gather(None)
+        return
+
+    if timing or timing_memory:
+        # the worker processes are enabled by ObserveTargetlist
+        profiling.enable_profiling(memory=timing_memory)
+    if profile is not None:
+        profiling.enable_code_profiling(profile)
+
+    completed = set()
+    payload_output = output
+    resuming = output is not None and resume and os.path.exists(output)
     if output is not None:
-        if replace:
+        if resuming:
+            # the payload is not written again: it is checked once built
+            with h5py.File(output, "r") as fd:
+                if "payload" in fd:
+                    payload_output = None
+        elif replace:
             if os.path.exists(output):
                 os.remove(output)
 
@@ -68,22 +121,40 @@ def standard_pipeline(
         if not os.path.exists(out_dir):
             os.makedirs(out_dir)
             logger.info("output directory created")
-        logger.info("output directory set as {}".format(out_dir))
-        try:
-            shutil.copy(options, out_dir)
-        except shutil.SameFileError:
-            pass
-        try:
-            shutil.copy(target_list, out_dir)
-        except shutil.SameFileError:
-            pass
+        logger.info("output directory set as %s", out_dir)
     else:
         out_dir = None
 
     # step 1 load payload
     payload, channels, (wl_min, wl_max) = preparePayload(
-        payload_file=options, output=output
+        payload_file=options, output=payload_output, n_thread=n_thread
     )
+    if resuming:
+        if not same_payload(output, payload):
+            logger.error(
+                "the payload of %s is not %s: it cannot be resumed",
+                output,
+                options,
+            )
+            raise ValueError(
+                "the payload stored in {} differs from {}: "
+                "run without resume to replace the output file".format(
+                    output, options
+                )
+            )
+        # the targets already written are skipped
+        completed = completed_targets(output)
+        logger.info(
+            "resuming from %s: %s targets already observed",
+            output,
+            len(completed),
+        )
+    if output is not None:
+        for filename in (options, target_list):
+            try:
+                shutil.copy(filename, out_dir)
+            except shutil.SameFileError:
+                pass
     if full_contrib:
         from astropy.table import hstack
 
@@ -101,11 +172,15 @@ def standard_pipeline(
         efficiency_plot(channels=channels, output_dir=out_dir)
 
     # step 2 load targetlist
-    targets = loadTargetList(target_list=target_list)
+    targets = loadTargetList(target_list=target_list).target
+    if completed:
+        targets = [t for t in targets if str(t.name) not in completed]
+        logger.info("%s targets left to observe", len(targets))
 
     # step 3 observe targetlist
-    targets = observeTargetList(
-        targets=targets.target,
+    # step 4 save to output: each target is written as soon as it is observed
+    observe_kwargs = dict(
+        targets=targets,
         payload=payload,
         channels=channels,
         wl_range=(wl_min, wl_max),
@@ -113,18 +188,219 @@ def standard_pipeline(
         out_dir=out_dir,
         n_thread=n_thread,
         debug=debug,
+        batch_size=batch_size,
     )
-    # step 4 save to output
     if output is not None:
-        for target in targets:
+        with HDF5TargetWriter(output, append=True) as writer:
+            observeTargetList(writer=writer, **observe_kwargs)
+    else:
+        observeTargetList(**observe_kwargs)
+
+    profiler = profiling.disable_profiling()
+    if profiler is not None:
+        profiler.log_summary()
+        if output is not None:
             with HDF5Output(output, append=True) as out:
-                targets[target].write(out)
+                profiler.write(out)
+
+    if profiling.disable_code_profiling() is not None:
+        if nprocs() > 1:
+            gather(None)
+        files = profiling.merge_code_profiles(profile)
+        logger.info(
+            "code profile written to %s, flame graph stacks to %s, hotspots to %s",
+            files["stats"],
+            files["stacks"],
+            files["hotspots"],
+        )
+
+
+def renoise_pipeline(
+    options, input_file, output, batch_size=1000, debug=False, log=False
+):
+    """
+    Estimates again the noise of the targets in an output file for the detector and noise
+    parameters of a payload description, and writes them in a new output file.
+    The light is not propagated again: the noise columns of the target tables are computed
+    from their signal columns with :class:`~exorad.tasks.noiseHandler.EstimateTargetsNoise`.
+    The rest of the file is copied, with the payload description replaced by the new one.
+    The target tables are read without their metadata, which is parsed only if a table
+    has different noise columns than before, as for a new custom noise, and has to be written again.
+
+    Parameters
+    ----------
+    options: str
+        payload description file with the new detector and noise parameters
+    input_file: str
+        output file of a previous run
+    output: str
+        new output file. It is replaced if it exists
+    batch_size: int
+        number of targets read and estimated together. Default is 1000
+    debug: bool
+        if True the log is printed on screen at debug level. Default is False
+    log: bool or str
+        if True, or a file name, the log is written on file. Default is False
+
+    Raises
+    ------
+    ValueError:
+        if the new output file is the input file
+    """
+    if debug:
+        setLogLevel(logging.DEBUG)
+    if isinstance(log, str):
+        addLogFile(fname=log)
+    elif log:
+        addLogFile()
+
+    if os.path.abspath(output) == os.path.abspath(input_file):
+        logger.error("the new output file cannot replace the input file")
+        raise ValueError("the new output file cannot replace the input file")
+    out_dir = pathlib.Path(output).parent.absolute()
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+        logger.info("output directory created")
+
+    payload = loadOptions(filename=options)
+    shutil.copyfile(input_file, output)
+    logger.info("estimating the noise of %s in %s", input_file, output)
+
+    completed = completed_targets(output, clean=False)
+    with HDF5Output(output, append=True) as out:
+        if "payload" in out.fd:
+            _replace_payload_description(out, payload)
+        targets = out.fd["targets"]
+        names = [name for name in targets if name in completed]
+        for start in range(0, len(names), batch_size):
+            batch = names[start : start + batch_size]
+            tables = estimateTargetsNoise(
+                tables=[
+                    load_table_columns(targets[name]["table"], "table")
+                    for name in batch
+                ],
+                payload=payload,
+            )
+            for name, table in zip(batch, tables):
+                if update_table_columns(
+                    targets[name]["table"], "table", table
+                ):
+                    continue
+                # the noise columns are not the same as before:
+                # the table is written again, with its metadata
+                table.meta = load_table(targets[name]["table"], "table").meta
+                del targets[name]["table"]
+                HDF5OutputGroup(targets[name]).create_group(
+                    "table"
+                ).write_table("table", table)
+            out.fd.flush()
+            logger.info(
+                "%s of %s targets done", start + len(batch), len(names)
+            )
+
+
+def _replace_payload_description(output, payload):
+    """replaces the payload and the channel descriptions in the payload group of an output"""
+    from exorad.models.instruments.cache import channel_descriptions
+
+    group = output.fd["payload"]
+    if "payload description" in group:
+        del group["payload description"]
+    output.create_group("payload").store_dictionary(
+        payload, group_name="payload description"
+    )
+    descriptions = channel_descriptions(payload)
+    for name in group.get("channels", {}):
+        if name in descriptions:
+            del group["channels"][name]["description"]
+            HDF5OutputGroup(group["channels"][name]).store_dictionary(
+                descriptions[name], group_name="description"
+            )
+
+
+def renoise_main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="exorad renoise",
+        description="estimates again the noise of the targets in an ExoRad output file "
+        "for new detector and noise parameters, without propagating the light",
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        dest="input",
+        type=str,
+        required=True,
+        help="output file of a previous run",
+    )
+    parser.add_argument(
+        "-p",
+        "--payload",
+        dest="opt",
+        type=str,
+        required=True,
+        help="payload description file with the new detector and noise parameters",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        dest="output",
+        type=str,
+        required=True,
+        help="new output file",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        dest="batch_size",
+        default=1000,
+        type=int,
+        required=False,
+        help="number of targets estimated together",
+    )
+    parser.add_argument(
+        "-d",
+        "--debug",
+        dest="debug",
+        default=False,
+        required=False,
+        help="log output on screen",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-l",
+        "--log",
+        dest="log",
+        default=False,
+        required=False,
+        help="log output on file",
+        action="store_true",
+    )
+    args = parser.parse_args(argv)
+
+    renoise_pipeline(
+        options=args.opt,
+        input_file=args.input,
+        output=args.output,
+        batch_size=args.batch_size,
+        debug=args.debug,
+        log=args.log,
+    )
 
 
 def main():
     import argparse
 
-    parser = argparse.ArgumentParser(description="ExoRad {}".format(version))
+    if len(sys.argv) > 1 and sys.argv[1] == "renoise":
+        renoise_main(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        description="ExoRad {}".format(version),
+        epilog="use 'exorad renoise' to estimate again the noise of an output file "
+        "for new detector and noise parameters",
+    )
     parser.add_argument(
         "-p",
         "--payload",
@@ -166,7 +442,7 @@ def main():
         default=1,
         type=int,
         required=False,
-        help="number of threads for parallel processing",
+        help="number of processes observing the targets and building the channels",
     )
     parser.add_argument(
         "-d",
@@ -195,6 +471,52 @@ def main():
         help="save target plots",
         action="store_true",
     )
+    parser.add_argument(
+        "-r",
+        "--resume",
+        dest="resume",
+        default=False,
+        required=False,
+        help="resume from an existing output file of the same payload, skipping the targets already observed",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "-b",
+        "--batch",
+        dest="batch_size",
+        default=1,
+        type=int,
+        required=False,
+        help="number of targets observed together by the vectorized engine",
+    )
+
+    parser.add_argument(
+        "-T",
+        "--timing",
+        dest="timing",
+        default=False,
+        required=False,
+        help="record the time spent in each task and report it in the log and in the output file",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--timing-memory",
+        dest="timing_memory",
+        default=False,
+        required=False,
+        help="as --timing, recording also the memory allocated by each task",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        default=None,
+        type=str,
+        required=False,
+        help="profile the code with cProfile and write the stats, the flame graph stacks and a hotspot report in this directory",
+    )
 
     args = parser.parse_args()
 
@@ -207,4 +529,9 @@ def main():
         debug=args.debug,
         n_thread=args.numberOfThreads,
         log=args.log,
+        resume=args.resume,
+        batch_size=args.batch_size,
+        timing=args.timing,
+        timing_memory=args.timing_memory,
+        profile=args.profile,
     )
@@ -58,10 +58,20 @@ def setLogLevel(level):
     from .logger import root_logger
 
     root_logger.handlers[0].setLevel(level)
-    #    root_logger.setLevel(level)
+    _update_root_level()
     last_log = level
 
 
+def _update_root_level():
+    """
+    sets the root logger level to the lowest of its handlers,
+    so that the messages no handler would emit are discarded before being formatted
+    """
+    from .logger import root_logger
+
+    root_logger.setLevel(min(h.level for h in root_logger.handlers))
+
+
 def disableLogging():
     # import logging
     # from .logger import root_logger
@@ -90,3 +100,4 @@ def addLogFile(fname="exorad.log"):
     file_handler.setFormatter(formatter)
     file_handler.setLevel(logging.DEBUG)
     root_logger.addHandler(file_handler)
+    _update_root_level()
@@ -51,7 +51,8 @@ import logging
 __all__ = ["Logger"]
 
 root_logger = logging.getLogger("exorad")
-root_logger.setLevel(logging.DEBUG)
+# the level follows the handlers: see setLogLevel
+root_logger.setLevel(logging.INFO)
 
 root_logger.propagate = False
 
@@ -83,7 +84,10 @@ root_logger.addHandler(ch)
 
 class Logger:
     """
-    Standard logging using logger library
+    Standard logging using logger library.
+
+    Messages are formatted only if they are emitted: pass the values as arguments,
+    as in `self.debug("signal: %s", signal)`, rather than formatting the message in the call.
     """
 
     def __init__(self):
@@ -1,10 +1,26 @@
+from functools import lru_cache
+
 import astropy.units as u
+import numpy as np
 
 from exorad.log import Logger
 from exorad.models.signal import Radiance
 from exorad.utils.exolib import planck
 
 
+class ZodiacalRadiance(Radiance):
+    """
+    Zodiacal radiance
+
+    Attributes
+    ----------
+    coefficient: float
+        coefficient scaling the zodiacal light model
+    """
+
+    coefficient = None
+
+
 class ZodiacalFrg(Logger):
     """
     Produce the zodiacal radiance.
@@ -29,6 +45,9 @@ class ZodiacalFrg(Logger):
 
     """
 
+    # unit coefficient model on the last wavelength grid used, shared by all the targets
+    _unit_model_cache = (None, None)
+
     def __init__(self, wl, description, coordinates=None):
         super().__init__()
         self.wl = wl
@@ -56,7 +75,7 @@ class ZodiacalFrg(Logger):
         elif "zodiacFactor" in self.description:
             self.debug(" model used for zodiacal foreground")
             A = self.description["zodiacFactor"]["value"]
-            self.debug("zodiac factor : {}".format(A))
+            self.debug("zodiac factor : %s", A)
         else:
             self.warning("zodiacal description uncompleted")
             A = 0
@@ -68,26 +87,39 @@ class ZodiacalFrg(Logger):
         returns the zodiacal Radiance for the zodiacal light model presented in Glasse et al. 2010,
         scaled by coefficient fitted over Kelsall et al. 1998 model
         """
-        units = u.W / (u.m**2 * u.um * u.sr)
-        zodi_emission = A * (
-            3.5e-14 * planck(self.wl, 5500.0 * u.K)
-            + 3.58e-8 * planck(self.wl, 270.0 * u.K)
-        ).to(units)
-        return Radiance(self.wl, zodi_emission)
+        zodi_emission = A * self.unit_model()
+        radiance = ZodiacalRadiance(self.wl, zodi_emission)
+        radiance.coefficient = A
+        return radiance
+
+    def unit_model(self):
+        """
+        returns the zodiacal light model for a unit coefficient.
+        It is evaluated once for each wavelength grid.
+        """
+        key = (self.wl.unit.to_string(), self.wl.value.tobytes())
+        if ZodiacalFrg._unit_model_cache[0] != key:
+            units = u.W / (u.m**2 * u.um * u.sr)
+            zodi_emission = (
+                3.5e-14 * planck(self.wl, 5500.0 * u.K)
+                + 3.58e-8 * planck(self.wl, 270.0 * u.K)
+            ).to(units)
+            ZodiacalFrg._unit_model_cache = (key, zodi_emission)
+        return ZodiacalFrg._unit_model_cache[1]
 
     def zodiacal_fit_direction(self, coord, map_file=None):
         """
         returns the fitted coefficient for the zodiacal model given the target position.
         It's based on Kelsall et al. 1998 model
         """
+        zodi_map = load_zodiacal_map(self.map_file(map_file))
+        return zodi_map.query(coord[0], coord[1])
+
+    def map_file(self, map_file=None):
+        """returns the zodiacal map file: the custom one if given, otherwise the default one"""
         import os
-        from astropy.io.misc.hdf5 import read_table_hdf5
-        import numpy as np
         from pathlib import Path
 
-        ra_input = coord[0]
-        dec_input = coord[1]
-
         exorad_path = Path(__file__).parent.parent.parent.absolute()
         zodi_map_file = (
             map_file
@@ -113,19 +145,78 @@ class ZodiacalFrg(Logger):
             data_path = os.path.join(dir_path.absolute().as_posix(), "data")
             zodi_map_file = os.path.join(data_path, "Zodi_map.hdf5")
 
-        self.debug("map data:{}".format(zodi_map_file))
+        self.debug("map data:%s", zodi_map_file)
+        return zodi_map_file
 
-        try:
-            zodi_table = read_table_hdf5(zodi_map_file)
-            self.debug(zodi_table)
-            distance = (zodi_table["ra_icrs"] * u.deg - ra_input) ** 2 + (
-                zodi_table["dec_icrs"] * u.deg - dec_input
-            ) ** 2
-            idx = np.argmin(distance)
-            self.debug("selected line {}".format(idx))
-            self.debug(zodi_table[idx])
-            return zodi_table["zodi_coeff"][idx]
 
+class ZodiacalMap(Logger):
+    """
+    Map of the zodiacal model coefficients over the sky, indexed for nearest neighbour queries.
+    The nearest map point is the one at the minimum squared distance in (ra, dec),
+    as in the original row by row search.
+
+    Parameters
+    ----------
+    filename: str
+        zodiacal map file. It's an hdf5 table with `ra_icrs`, `dec_icrs` (in deg) and `zodi_coeff` columns
+
+    Attributes
+    ----------
+    table: Table
+        zodiacal map table
+    tree: cKDTree
+        spatial index of the map points
+
+    Examples
+    --------
+    >>> zodi_map = load_zodiacal_map('Zodi_map.hdf5')
+    >>> zodi_map.query([10, 20] * u.deg, [-30, 5] * u.deg)
+    """
+
+    def __init__(self, filename):
+        from astropy.io.misc.hdf5 import read_table_hdf5
+        from scipy.spatial import cKDTree
+
+        super().__init__()
+        try:
+            self.table = read_table_hdf5(filename)
         except OSError:
             self.error("Zodi map file not found")
             raise OSError("Zodi map file not found")
+        self.debug(self.table)
+        self.tree = cKDTree(
+            np.column_stack(
+                [
+                    np.asarray(self.table["ra_icrs"], dtype=float),
+                    np.asarray(self.table["dec_icrs"], dtype=float),
+                ]
+            )
+        )
+
+    def query(self, ra, dec):
+        """
+        returns the zodiacal coefficients of the map points nearest to the given directions
+
+        Parameters
+        ----------
+        ra: Quantity
+            right ascension. It can be a scalar or an array
+        dec: Quantity
+            declination, with the same shape of ra
+
+        Returns
+        -------
+        float or array:
+            zodiacal coefficients, with the shape of ra
+        """
+        ra = u.Quantity(ra, u.deg).value
+        dec = u.Quantity(dec, u.deg).value
+        _, idx = self.tree.query(np.stack([ra, dec], axis=-1))
+        self.debug("selected line %s", idx)
+        return np.asarray(self.table["zodi_coeff"])[idx]
+
+
+@lru_cache(maxsize=4)
+def load_zodiacal_map(filename):
+    """returns the :class:`ZodiacalMap` of the file, loaded once per process"""
+    return ZodiacalMap(filename)
@@ -1,3 +1,4 @@
+from .cache import PayloadCache
 from .instrument import Instrument
 from .photometer import Photometer
 from .spectrometer import Spectrometer
@@ -0,0 +1,413 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+from .instrument import Instrument
+from exorad.__version__ import __version__
+from exorad.log import Logger
+from exorad.utils.passVal import PassVal
+
+# payload entries not used to build the channels: the configuration path is the root of the
+# data directory and the source spectra are read for each target
+_ignored_keys = ("ConfigPath", "sourceSpectrum")
+
+# payload sections read only while observing the targets
+_observation_sections = (
+    "ConfigPath",
+    "fileName",
+    "common/sourceSpectrum",
+    "common/customNoise",
+    "common/PayloadCache",
+)
+
+# entries of a channel description, and of its detector, read only to estimate the noise
+_noise_keys = ("NoiseX", "customNoise")
+_detector_noise_keys = (
+    "well_depth",
+    "f_well_depth",
+    "frame_time",
+    "freqNDR",
+    "multiaccumM",
+    "dark_current",
+    "read_noise",
+)
+
+# first build step depending on each part of a channel description, besides the builder:
+# None if no step depends on it
+_channel_steps = OrderedDict(
+    [("qe", "qe"), ("optics", "optical_path"), ("noise", None)]
+)
+
+# first build step depending on each entry of the common section: any other entry
+# is assumed to change every channel
+_common_steps = {
+    "wl_min": "star_response",
+    "wl_max": "star_response",
+    "foreground": "foreground_response",
+}
+
+
+class PayloadCache(Logger):
+    """
+    On-disk cache of the channels built from a payload description.
+    Each entry is a pickle file of the payload description and of its built channels,
+    the same objects sent to the processes of an MPI run.
+    The entries are keyed by the content of the payload description file, the content of every data file
+    it references, the working resolution and the code version,
+    so that any change to the payload, its data or the code is a new entry.
+    The cache directory can be shared by the processes of a run and between runs.
+    Entries are unpickled when found, so the directory must be trusted as the payload files themselves.
+
+    Each entry also stores the fingerprints of the payload sections, from :func:`fingerprints`.
+    When a payload is not in cache, :meth:`closest` finds the entry that differs the least from it,
+    so that only the channels and the build steps affected by the differences are run again.
+
+    Parameters
+    ----------
+    path: str
+        cache directory. It is created if missing
+
+    Examples
+    --------
+    >>> cache = PayloadCache('payload_cache')
+    >>> key = cache.key('payload.xml', payload)
+    >>> cached = cache.get(key)
+    """
+
+    version = 2
+
+    def __init__(self, path):
+        self.set_log_name()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, payload_file, payload):
+        """
+        returns the cache key of the payload
+
+        Parameters
+        ----------
+        payload_file: str
+            xml file with the payload description
+        payload: dict
+            payload description parsed from the file
+        """
+        key = hashlib.sha256()
+        key.update(
+            "{}:{}:{}".format(
+                self.version, __version__, PassVal.working_R
+            ).encode()
+        )
+        _update_with_file(key, payload_file)
+        for entry, filename in _referenced_files(payload):
+            key.update(entry.encode())
+            _update_with_file(key, filename)
+        return key.hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, "{}.pickle".format(key))
+
+    def get(self, key):
+        """returns the payload description and its built channels, or None if not in cache"""
+        filename = self.filename(key)
+        try:
+            with open(filename, "rb") as fd:
+                payload, channels = pickle.load(fd)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        self.debug("cached payload found: %s", filename)
+        return payload, channels
+
+    def put(self, key, payload, channels, sections=None):
+        """
+        stores the payload description and its built channels, and returns the entry file
+
+        Parameters
+        ----------
+        key: str
+            cache key
+        payload: dict
+            payload description
+        channels: dict
+            channels built from the payload
+        sections: dict
+            fingerprints of the payload as parsed, before building the channels.
+            If None, the entry is not a base for :meth:`closest`. Default is None
+        """
+        filename = self.filename(key)
+        # the entry is written under a temporary name and moved, so that concurrent processes
+        # never read an incomplete entry
+        tmp = "{}.{}.tmp".format(filename, os.getpid())
+        try:
+            with open(tmp, "wb") as fd:
+                pickle.dump(
+                    (payload, channels), fd, protocol=pickle.HIGHEST_PROTOCOL
+                )
+            os.replace(tmp, filename)
+            if sections is not None:
+                with open(tmp, "w") as fd:
+                    json.dump(sections, fd)
+                os.replace(tmp, self._sections_file(key))
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.debug("payload cached in %s", filename)
+        return filename
+
+    def closest(self, sections):
+        """
+        finds the cached entry that turns into the payload with the fewest build steps
+
+        Parameters
+        ----------
+        sections: dict
+            fingerprints of the payload, from :func:`fingerprints`
+
+        Returns
+        -------
+        str:
+            key of the entry, or None if the channels are better built from scratch
+        dict:
+            rebuild plan from the entry, as returned by :func:`rebuild_plan`
+        """
+        best, best_plan, best_cost = None, None, None
+        # the most recent entries come first, and are preferred at the same cost
+        for filename in sorted(
+            glob.glob(os.path.join(self.path, "*.json")),
+            key=os.path.getmtime,
+            reverse=True,
+        ):
+            try:
+                with open(filename) as fd:
+                    previous = json.load(fd)
+            except (OSError, ValueError):
+                continue
+            plan = rebuild_plan(previous, sections)
+            if plan is None:
+                continue
+            cost = _plan_cost(plan)
+            if best_cost is None or cost < best_cost:
+                best = os.path.splitext(os.path.basename(filename))[0]
+                best_plan, best_cost = plan, cost
+        if best is None or best_cost >= _plan_cost(
+            {ch: "builder" for ch in best_plan}
+        ):
+            return None, None
+        self.debug("closest cached payload: %s %s", best, best_plan)
+        return best, best_plan
+
+    def _sections_file(self, key):
+        return os.path.join(self.path, "{}.json".format(key))
+
+
+def fingerprints(payload):
+    """
+    returns a digest of the content of each payload section used to build the channels.
+    The sections are the entries of the common section, the common optics
+    and, for each channel, its detector quantum efficiency, its optics, its noise parameters
+    and the rest of its description.
+    The files referenced by the payload are digested by content.
+
+    Parameters
+    ----------
+    payload: dict
+        payload description, as parsed before building the channels
+
+    Returns
+    -------
+    dict:
+        digest of each section, by section name
+    """
+    sections = OrderedDict(
+        build="{}:{}:{}".format(
+            PayloadCache.version, __version__, PassVal.working_R
+        )
+    )
+    for key, item in payload.items():
+        if key == "common":
+            for name, entry in item.items():
+                sections["common/{}".format(name)] = entry
+        elif key == "channel":
+            for name, description in channel_descriptions(payload).items():
+                for section, item in _channel_sections(description).items():
+                    sections["/".join(("channel", name) + section)] = item
+        else:
+            sections[key] = item
+    return OrderedDict(
+        (name, item if name == "build" else _digest(item))
+        for name, item in sections.items()
+        if name not in _observation_sections
+    )
+
+
+def rebuild_plan(previous, sections):
+    """
+    compares the fingerprints of two payloads and returns, for each channel,
+    the first build step affected by the differences
+
+    Parameters
+    ----------
+    previous: dict
+        fingerprints of the payload the channels were built from
+    sections: dict
+        fingerprints of the new payload
+
+    Returns
+    -------
+    dict:
+        first step of :attr:`~exorad.models.instruments.instrument.Instrument.build_steps` to run
+        for each channel of the new payload, or None if the channel is unchanged.
+        None if all the channels have to be built from scratch
+    """
+    steps = list(Instrument.build_steps)
+    changed = {
+        name
+        for name in set(previous) | set(sections)
+        if previous.get(name) != sections.get(name)
+    }
+
+    # first step affected by the payload sections shared by all the channels
+    common = None
+    for name in changed:
+        if name.startswith("channel/"):
+            continue
+        if name == "optics":
+            step = "optical_path"
+        elif name.startswith("common/"):
+            step = _common_steps.get(name.split("/", 1)[1], "builder")
+        else:
+            step = "builder"
+        if common is None or steps.index(step) < steps.index(common):
+            common = step
+    if common == "builder":
+        return None
+
+    plan = OrderedDict()
+    for name in sections:
+        if not name.startswith("channel/") or name.count("/") > 1:
+            continue
+        step = common
+        if name in changed:
+            step = "builder"
+        for part, part_step in _channel_steps.items():
+            if (
+                "{}/{}".format(name, part) in changed
+                and part_step is not None
+                and (
+                    step is None or steps.index(step) > steps.index(part_step)
+                )
+            ):
+                step = part_step
+        plan[name.split("/", 1)[1]] = step
+    return plan
+
+
+def _channel_sections(description):
+    """splits a channel description in the parts listed in _channel_steps and the rest"""
+    detector = description.get("detector", {})
+    rest = OrderedDict()
+    for key, item in description.items():
+        if key == "optics" or key in _noise_keys:
+            continue
+        if key == "detector":
+            item = OrderedDict(
+                (k, v)
+                for k, v in detector.items()
+                if k != "qe" and k not in _detector_noise_keys
+            )
+        rest[key] = item
+    noise = OrderedDict(
+        (k, v) for k, v in description.items() if k in _noise_keys
+    )
+    noise.update(
+        (k, v) for k, v in detector.items() if k in _detector_noise_keys
+    )
+    sections = OrderedDict([((), rest)])
+    if "qe" in detector:
+        sections[("qe",)] = detector["qe"]
+    if "optics" in description:
+        sections[("optics",)] = description["optics"]
+    if noise:
+        sections[("noise",)] = noise
+    return sections
+
+
+def channel_descriptions(payload):
+    """returns the description of each channel of the payload, by name"""
+    if isinstance(payload["channel"], OrderedDict):
+        return payload["channel"]
+    return OrderedDict([(payload["channel"]["value"], payload["channel"])])
+
+
+def _plan_cost(plan):
+    """number of build steps to run"""
+    steps = list(Instrument.build_steps)
+    return sum(
+        len(steps) - steps.index(step) for step in plan.values() if step
+    )
+
+
+def _digest(item):
+    key = hashlib.sha256()
+    _update_with_item(key, item)
+    return key.hexdigest()
+
+
+def _update_with_item(key, item):
+    """updates the key with the content of a payload entry and of the files it references"""
+    key.update(type(item).__name__.encode())
+    if isinstance(item, dict):
+        for k, v in item.items():
+            key.update(str(k).encode())
+            _update_with_item(key, v)
+    elif hasattr(item, "colnames"):
+        for name in item.colnames:
+            key.update(name.encode())
+            _update_with_item(key, item[name])
+    elif hasattr(item, "unit") or isinstance(item, np.ndarray):
+        key.update(str(getattr(item, "unit", "")).encode())
+        value = np.asarray(getattr(item, "value", item))
+        if value.dtype.kind == "O":
+            key.update(repr(value.tolist()).encode())
+        else:
+            key.update(value.dtype.str.encode())
+            key.update(str(value.shape).encode())
+            key.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(item, str):
+        key.update(item.encode())
+        if os.path.exists(os.path.expanduser(item)):
+            _update_with_file(key, os.path.expanduser(item))
+    else:
+        key.update(repr(item).encode())
+
+
+def _referenced_files(payload, entry=""):
+    """yields the entry and the name of each existing file or directory referenced by the payload"""
+    for k, v in payload.items():
+        if k in _ignored_keys:
+            continue
+        name = "{}/{}".format(entry, k)
+        if isinstance(v, dict):
+            yield from _referenced_files(v, name)
+        elif isinstance(v, str) and os.path.exists(os.path.expanduser(v)):
+            yield name, os.path.expanduser(v)
+
+
+def _update_with_file(key, filename):
+    """updates the key with the content of a file, or of all the files in a directory"""
+    if os.path.isdir(filename):
+        for root, dirs, files in os.walk(filename):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                key.update(os.path.relpath(path, filename).encode())
+                _update_with_file(key, path)
+        return
+    with open(filename, "rb") as fd:
+        for chunk in iter(lambda: fd.read(1 << 20), b""):
+            key.update(chunk)
@@ -1,19 +1,29 @@
 import copy
 from abc import abstractmethod
+from collections import OrderedDict
 
 import astropy.constants as const
 import astropy.units as u
 import numpy as np
 from astropy.table import QTable
 from scipy.interpolate import interp1d
+from scipy.sparse import csr_matrix
 
 from exorad.log.logger import Logger
+from exorad.models.foregrounds.skyForegrounds import SkyFilter
+from exorad.models.foregrounds.skyForegrounds import SkyForeground
+from exorad.models.foregrounds.zodiacalForeground import ZodiacalFrg
+from exorad.models.foregrounds.zodiacalForeground import ZodiacalRadiance
 from exorad.models.optics.opticalPath import OpticalPath
 from exorad.models.signal import Signal
 from exorad.models.utils import get_wl_col_name
+from exorad.utils.binning import BinningPlan
 from exorad.utils.diffuse_light_propagation import convolve_with_slit
 from exorad.utils.diffuse_light_propagation import integrate_light
+from exorad.utils.diffuse_light_propagation import integrate_radiance
 from exorad.utils.diffuse_light_propagation import prepare
+from exorad.utils.diffuse_light_propagation import slit_signal
+from exorad.utils.exolib import rebin
 from exorad.utils.passVal import PassVal
 
 
@@ -49,6 +59,28 @@ class Instrument(Logger):
         if you try to build a loaded payload.
     """
 
+    # the build steps in order, each with the table columns and the built_instr entries it produces.
+    # The builder step produces everything else
+    build_steps = OrderedDict(
+        [
+            ("builder", None),
+            ("qe", (("QE",), ("qe_data",))),
+            (
+                "optical_path",
+                (
+                    (
+                        "TR",
+                        "instrument_signal",
+                        "instrument_MaxSignal_inPixel",
+                    ),
+                    ("transmission_data", "slit_width", "optical_path"),
+                ),
+            ),
+            ("star_response", ((), ("star_response",))),
+            ("foreground_response", ((), ("foreground_response",))),
+        ]
+    )
+
     def __init__(self, name, description, payload=None):
         self.set_log_name()
         self.name = name
@@ -56,9 +88,11 @@ class Instrument(Logger):
         self.payload = payload
         self.table = QTable()
         self.built_instr = {}
-        self.debug("{} initialized".format(self.name))
+        self.debug("%s initialized", self.name)
         self.loaded = False
         self.opticalPath = None
+        self._star_response = None
+        self._binning_plans = {}
 
     def load(self, table, built_instr):
         """
@@ -66,8 +100,10 @@ class Instrument(Logger):
         """
         self.table = table
         self.built_instr = built_instr
+        self._star_response = None
+        self._binning_plans = {}
         self.loaded = True
-        self.info("{} loaded".format(self.name))
+        self.info("%s loaded", self.name)
 
     def write(self, output):
         """
@@ -96,7 +132,71 @@ class Instrument(Logger):
             raise ValueError("You cannot build a loaded instrument")
         else:
             self.builder()
+            self.build_qe()
             self.build_optical_path()
+            self.build_star_response()
+            self.build_foreground_response()
+
+    def rebuild(self, step, payload=None, description=None):
+        """
+        it builds the instrument again from a build step, keeping the products of the previous steps.
+        The products of the step and of the following ones are removed and built again.
+
+        Parameters
+        ----------
+        step: str
+            first build step to run, from :attr:`build_steps`
+        payload: dict
+            new main payload. Default is None, to keep the current one
+        description: dict
+            new instrument description dictionary. Default is None, to keep the current one
+        """
+        if self.loaded:
+            self.error("You cannot build a loaded instrument")
+            raise ValueError("You cannot build a loaded instrument")
+        if step not in self.build_steps:
+            self.error("invalid build step %s", step)
+            raise KeyError(step)
+        if payload is not None:
+            self.payload = payload
+        if description is not None:
+            self.description = description
+        self._star_response = None
+        self._binning_plans = {}
+        if step == "builder":
+            self.table = QTable()
+            self.built_instr = {}
+            self.opticalPath = None
+            self.build()
+            return
+
+        self.info("rebuilding %s from %s", self.name, step)
+        steps = list(self.build_steps)
+        for name in steps[steps.index(step) :]:
+            columns, entries = self.build_steps[name]
+            if columns:
+                # the photometers store the table of the builder, the one the optical path extends
+                table = self.built_instr.get("table", self.table)
+                table.remove_columns(
+                    [col for col in columns if col in table.colnames]
+                )
+                self.table = table
+            for entry in entries:
+                self.built_instr.pop(entry, None)
+            getattr(self, "build_{}".format(name))()
+
+    def build_qe(self):
+        """
+        it estimates the detector quantum efficiency in the spectral bins
+        """
+        self.info("building quantum efficiency")
+        qe, qe_data = self._get_qe()
+        # the QE column precedes the window sizes in the channel table
+        index = len(self.table.colnames)
+        if "WindowSize" in self.table.colnames:
+            index = self.table.colnames.index("WindowSize")
+        self.table.add_column(qe, name="QE", index=index)
+        self._add_data_to_built("qe_data", qe_data.to_dict())
 
     def build_optical_path(self):
         """
@@ -153,6 +253,275 @@ class Instrument(Logger):
         optical_path_dict["radiance_table"] = self.opticalPath.radiance_table
         self._add_data_to_built("optical_path", optical_path_dict)
 
+    def thermal_sweep(self, temperatures):
+        """
+        it computes the instrument self emission over a grid of temperatures of some optical elements,
+        reusing the optical path of the build.
+        See :func:`~exorad.models.optics.opticalPath.OpticalPath.thermal_sweep`
+
+        Parameters
+        ----------
+        temperatures: dict
+            temperatures of the optical elements to vary, by element name.
+            Each is a scalar or a 1-D array, assumed in Kelvin if without units
+
+        Returns
+        -------
+        OrderedDict:
+            the temperatures, the radiances and the signals of the swept elements,
+            and the `instrument_signal` and `instrument_MaxSignal_inPixel` columns
+            with an axis for each element and a last axis for the spectral bins
+
+        Raises
+        -------
+        ValueError:
+            if the instrument was loaded without its optical path
+
+        Examples
+        --------
+        >>> sweep = channel.thermal_sweep({'M1': np.linspace(40, 80, 9) * u.K,
+        ...                                'optics': [50, 60] * u.K})
+        >>> sweep['instrument_signal'].shape
+        (9, 2, n_bins)
+        """
+        if self.opticalPath is None:
+            self.error("the optical path of %s is not built", self.name)
+            raise ValueError("the optical path is not built")
+        return self.opticalPath.thermal_sweep(
+            temperatures, self.table, self.built_instr
+        )
+
+    def build_star_response(self):
+        """
+        it builds the linear operators propagating a target sed sampled on the working wavelength grid
+        to the star columns of :func:`propagate_target`,
+        so that the propagation of each target is reduced to sparse matrix products.
+        The operators are stored in `built_instr` under `star_response`.
+        """
+        if "common" not in self.payload:
+            self.debug("common payload not found: star response not built")
+            return
+        wl_min = self.payload["common"]["wl_min"]["value"]
+        wl_max = self.payload["common"]["wl_max"]["value"]
+        if wl_min > wl_max:
+            wl_min, wl_max = wl_max, wl_min
+        if not hasattr(wl_max, "unit"):
+            wl_min *= u.um
+            wl_max *= u.um
+        # same grid used by LoadSource
+        wl_grid = (
+            np.logspace(
+                np.log10(wl_min.value),
+                np.log10(wl_max.value),
+                PassVal.working_R,
+            )
+            * wl_max.unit
+        )
+        self.info("building star response")
+        response = {"wl_grid": {"value": wl_grid.to_value(u.um), "unit": "um"}}
+        for key, (matrix, unit) in self._star_response_matrices(
+            wl_grid.to(u.um)
+        ).items():
+            matrix = matrix.tocsr()
+            response[key] = {
+                "data": matrix.data,
+                "indices": matrix.indices,
+                "indptr": matrix.indptr,
+                "shape": np.array(matrix.shape),
+                "unit": unit.to_string(),
+            }
+        self._add_data_to_built("star_response", response)
+        self._star_response = None
+
+    def build_foreground_response(self):
+        """
+        it propagates through the instrument the payload foregrounds that do not depend on the target:
+        the sky foregrounds and the zodiacal light model for a unit coefficient.
+        The zodiacal signals of a target are then the unit ones scaled by its coefficient.
+        The signals are stored in `built_instr` under `foreground_response`.
+        """
+        if "foreground" not in self.payload.get("common", {}):
+            return
+        foregrounds = self.payload["common"]["foreground"]
+        if not isinstance(foregrounds, OrderedDict):
+            foregrounds = OrderedDict([(foregrounds["value"], foregrounds)])
+        wl_min = self.payload["common"]["wl_min"]["value"]
+        wl_max = self.payload["common"]["wl_max"]["value"]
+        # same grid used by EstimateForegrounds
+        wl_grid = (
+            np.logspace(
+                np.log10((wl_min.to(u.um)).value),
+                np.log10((wl_max.to(u.um)).value),
+                PassVal.working_R,
+            )
+            * u.um
+        )
+
+        self.info("building foreground response")
+        radiances = OrderedDict()
+        for name, description in foregrounds.items():
+            if name == "zodiacal":
+                zodi = ZodiacalFrg(wl=wl_grid, description=description)
+                radiances["zodi"] = zodi.model(1.0).data[np.newaxis]
+            else:
+                radiances[description["value"]] = SkyForeground(
+                    wl_grid, description
+                ).skyFilter.data[np.newaxis]
+        signals = self.propagate_diffuse_foregrounds(wl_grid, radiances)
+
+        response = {"wl_grid": {"value": wl_grid.value, "unit": "um"}}
+        for name in radiances:
+            response[name] = {}
+            for key in ["signal", "MaxSignal_inPixel"]:
+                signal = signals["{}_{}".format(name, key)][0]
+                response[name][key] = {
+                    "value": signal.value,
+                    "unit": signal.unit.to_string(),
+                }
+        self._add_data_to_built("foreground_response", response)
+
+    def _foreground_response(self, name, radiances):
+        """
+        returns the signal and the max signal in pixel, of shape (len(radiances), n_bins),
+        of the foreground radiances of many targets from the foreground response,
+        or None if the radiances are not in the response.
+        """
+        if "foreground_response" not in self.built_instr:
+            return None
+        response = self.built_instr["foreground_response"]
+        if name not in response:
+            return None
+        wl_grid = u.Quantity(
+            response["wl_grid"]["value"], response["wl_grid"]["unit"]
+        )
+        wl = radiances[0].wl_grid
+        if wl.size != wl_grid.size or not np.allclose(
+            wl.to_value(wl_grid.unit), wl_grid.value, rtol=1e-12, atol=0.0
+        ):
+            return None
+
+        if all(isinstance(r, ZodiacalRadiance) for r in radiances):
+            scale = np.array(
+                [
+                    u.Quantity(r.coefficient, u.dimensionless_unscaled).value
+                    for r in radiances
+                ]
+            )
+        elif all(isinstance(r, SkyFilter) for r in radiances):
+            scale = np.ones(len(radiances))
+        else:
+            return None
+        return [
+            scale[:, np.newaxis]
+            * u.Quantity(
+                response[name][key]["value"], response[name][key]["unit"]
+            )
+            for key in ["signal", "MaxSignal_inPixel"]
+        ]
+
+    def _star_response_matrices(self, wl):
+        """
+        returns a dictionary of (sparse matrix, output unit) acting on seds in W/m^2/um sampled on wl.
+        Instruments that do not implement it are propagated without response.
+        """
+        return {}
+
+    def _get_star_response(self, wl):
+        """
+        returns the star response matrices if they are built for the wavelength grid wl, otherwise None
+        """
+        if "star_response" not in self.built_instr:
+            return None
+        if self._star_response is None:
+            response = self.built_instr["star_response"]
+            matrices = OrderedDict()
+            for key, item in response.items():
+                if key == "wl_grid":
+                    continue
+                matrices[key] = (
+                    csr_matrix(
+                        (item["data"], item["indices"], item["indptr"]),
+                        shape=tuple(item["shape"]),
+                    ),
+                    u.Unit(item["unit"]),
+                )
+            wl_grid = u.Quantity(
+                response["wl_grid"]["value"], response["wl_grid"]["unit"]
+            )
+            self._star_response = (wl_grid, matrices)
+        wl_grid, matrices = self._star_response
+        if wl.size != wl_grid.size or not np.allclose(
+            wl.to_value(wl_grid.unit), wl_grid.value, rtol=1e-12, atol=0.0
+        ):
+            self.debug("star response not built for this wavelength grid")
+            return None
+        return matrices
+
+    def _star_columns(self, matrices, seds, sky_transmission=None):
+        """
+        propagates seds of shape (..., wl.size) with the star response matrices.
+        The sky transmission does not apply to the star flux.
+        """
+        seds = seds.to_value(u.W / u.m**2 / u.um)
+        transmitted = seds
+        if sky_transmission is not None:
+            transmitted = (
+                seds
+                * u.Quantity(sky_transmission, u.dimensionless_unscaled).value
+            )
+        out = OrderedDict()
+        for key, (matrix, unit) in matrices.items():
+            x = seds if key == "starFlux" else transmitted
+            out[key] = (matrix @ x.T).T * unit
+        return out
+
+    def _propagate_target_response(self, target):
+        """
+        propagates the target light with the star response, if available for the target wavelength grid.
+        Otherwise it returns None.
+        """
+        wl = target.star.sed.wl_grid
+        matrices = self._get_star_response(wl)
+        if matrices is None:
+            return None
+        out = QTable()
+        sky_transmission = self._get_sky_transmission(wl, target)
+        if "sky TR" in self.table.keys():
+            out["foreground_transmission"] = self.table["sky TR"]
+        for key, column in self._star_columns(
+            matrices, target.star.sed.data, sky_transmission
+        ).items():
+            out[key] = column
+        return out
+
+    def _propagate_targets_response(self, wl, seds, sky_transmission=None):
+        """
+        same as :func:`_propagate_target_response` for the arguments of :func:`propagate_targets`
+        """
+        matrices = self._get_star_response(wl)
+        if matrices is None:
+            return None
+        out = OrderedDict()
+        if sky_transmission is not None:
+            out["foreground_transmission"] = self._bin_transmission(
+                wl, sky_transmission
+            )
+        out.update(self._star_columns(matrices, seds, sky_transmission))
+        return out
+
+    def _outside_channel(self, wl):
+        """returns the mask of the wavelengths outside the channel edges"""
+        return np.logical_or(
+            wl
+            < self.description["wl_min"]["value"].to(
+                self.table["Wavelength"].unit
+            ),
+            wl
+            > self.description["wl_max"]["value"].to(
+                self.table["Wavelength"].unit
+            ),
+        )
+
     @abstractmethod
     def builder(self):
         """
@@ -167,6 +536,27 @@ class Instrument(Logger):
         """
         pass
 
+    @abstractmethod
+    def propagate_targets(self, wl, seds, sky_transmission=None):
+        """
+        propagates the light of many targets at once through the instrument
+
+        Parameters
+        ----------
+        wl: Quantity
+            wavelength grid of the seds
+        seds: Quantity
+            target seds stacked in an array of shape (n_targets, wl.size)
+        sky_transmission: Quantity
+            sky transmissions of the targets, with the same shape of seds. Default is None
+
+        Returns
+        -------
+        OrderedDict:
+            the columns of :func:`propagate_target`, each of shape (n_targets, n_bins)
+        """
+        pass
+
     def propagate_diffuse_foreground(self, target):
         """
         propagate diffuse foreground sources, starting from zodiacal background
@@ -175,26 +565,34 @@ class Instrument(Logger):
 
         self.debug("diffuse bkg propagation")
         out = QTable()
-        (
-            total_max_signal,
-            total_signal,
-            wl_table,
-            A,
-            qe,
-            omega_pix,
-            transmission,
-        ) = prepare(self.table, self.built_instr, self.description)
+        prepared = False
         foregrounds = list(target.foreground.keys())
         foregrounds = reversed(foregrounds)
         for i, frg in enumerate(foregrounds):
-            self.debug("propagating {}".format(frg))
+            self.debug("propagating %s", frg)
+            response = self._foreground_response(frg, [target.foreground[frg]])
+            if response is not None:
+                out["{}_signal".format(frg)] = response[0][0]
+                out["{}_MaxSignal_inPixel".format(frg)] = response[1][0]
+                continue
+            if not prepared:
+                (
+                    total_max_signal,
+                    total_signal,
+                    wl_table,
+                    A,
+                    qe,
+                    omega_pix,
+                    transmission,
+                ) = prepare(self.table, self.built_instr, self.description)
+                prepared = True
             radiance = copy.deepcopy(target.foreground[frg])
-            self.debug("{} radiance . {}".format(frg, radiance.data))
+            self.debug("%s radiance . %s", frg, radiance.data)
 
             if hasattr(frg, "transmission"):
                 frg.transmission.spectral_rebin(transmission.wl_grid)
                 transmission.data *= frg.transmission.data
-                self.debug("added {} transmission".format(frg))
+                self.debug("added %s transmission", frg)
 
             transmission.spectral_rebin(radiance.wl_grid)
             radiance.data *= transmission.data
@@ -230,21 +628,86 @@ class Instrument(Logger):
                     radiance, radiance.wl_grid, self.built_instr
                 )
             total_signal = copy.deepcopy(signal)
-            self.debug("sed : {}".format(total_signal))
+            self.debug("sed : %s", total_signal)
             total_max_signal = copy.deepcopy(max_signal_per_pix)
 
             out["{}_signal".format(frg)] = total_signal
             out["{}_MaxSignal_inPixel".format(frg)] = total_max_signal
         return out
 
+    def propagate_diffuse_foregrounds(self, wl, foregrounds):
+        """
+        propagates the diffuse foregrounds of many targets at once
+
+        Parameters
+        ----------
+        wl: Quantity
+            wavelength grid of the foreground radiances
+        foregrounds: OrderedDict
+            foreground radiances of the targets, each stacked in an array of shape (n_targets, wl.size)
+            or as a list of Radiance, one for each target.
+            Radiances in the foreground response are not propagated but scaled
+
+        Returns
+        -------
+        OrderedDict:
+            the columns of :func:`propagate_diffuse_foreground`, each of shape (n_targets, n_bins)
+        """
+        self.debug("diffuse bkg propagation")
+        out = OrderedDict()
+        prepared = False
+        for frg in reversed(list(foregrounds.keys())):
+            self.debug("propagating %s", frg)
+            radiance = foregrounds[frg]
+            if isinstance(radiance, list):
+                response = self._foreground_response(frg, radiance)
+                if response is not None:
+                    out["{}_signal".format(frg)] = response[0]
+                    out["{}_MaxSignal_inPixel".format(frg)] = response[1]
+                    continue
+                radiance = u.Quantity([r.data for r in radiance])
+            if not prepared:
+                (_, _, _, A, qe, omega_pix, transmission) = prepare(
+                    self.table, self.built_instr, self.description
+                )
+                transmission.spectral_rebin(wl)
+                qe.spectral_rebin(wl)
+                prepared = True
+            radiance = radiance * transmission.data
+            if "slit_width" in self.built_instr:
+                radiance = rebin(
+                    self.built_instr["wl_pix_center"], wl, radiance
+                )[1]
+                radiance[np.isnan(radiance)] = 0.0
+                max_signal_per_pix, signal = slit_signal(
+                    self.description,
+                    self.built_instr,
+                    A,
+                    self.table,
+                    omega_pix,
+                    qe,
+                    radiance,
+                )
+            else:
+                radiance = radiance * (
+                    omega_pix
+                    * A
+                    * qe.data
+                    * (wl / const.c / const.h).to(1.0 / u.W / u.s)
+                    * u.count
+                )
+                max_signal_per_pix, signal = integrate_radiance(
+                    radiance, wl, self.built_instr
+                )
+            out["{}_signal".format(frg)] = signal
+            out["{}_MaxSignal_inPixel".format(frg)] = max_signal_per_pix
+        return out
+
     def _bin_signal(self, wl, signal, leftbin, rightbin):
-        bsig = [
-            np.mean(signal[np.logical_and(wl >= wlow, wl < whigh)])
-            for wlow, whigh in zip(leftbin, rightbin)
-        ]
-        return u.Quantity(bsig)
+        # signals with leading axes are binned along the last one
+        return u.Quantity(BinningPlan(wl, leftbin, rightbin).mean(signal))
 
-    def _get_transmission(self, wl_grid, tr_data=None):
+    def _bin_transmission(self, wl_grid, tr_data):
         tr_func = interp1d(
             wl_grid,
             tr_data,
@@ -252,43 +715,29 @@ class Instrument(Logger):
             fill_value=0.0,
             bounds_error=False,
         )
-
-        transmission_data = Signal(wl_grid, tr_data)
-        # self.debug('transmission channel data : {} {}'.format(transmission_data.wl_grid, transmission_data.data))
-
         transmission = self._bin_signal(
             self.table["Wavelength"],
             tr_func(self.table["Wavelength"]),
             self.table["LeftBinEdge"],
             self.table["RightBinEdge"],
         )
+        if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
+            idx = self._outside_channel(self.table["Wavelength"])
+            transmission[..., idx] = 0.0
+        return transmission
+
+    def _get_transmission(self, wl_grid, tr_data=None):
+        transmission_data = Signal(wl_grid, tr_data)
+        # self.debug('transmission channel data : {} {}'.format(transmission_data.wl_grid, transmission_data.data))
+
+        transmission = self._bin_transmission(wl_grid, tr_data)
 
         if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
             self.debug("force channel wl edge enabled")
-            idx = np.logical_or(
-                self.table["Wavelength"]
-                < self.description["wl_min"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-                self.table["Wavelength"]
-                > self.description["wl_max"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-            )
-            transmission[idx] = 0.0
-            idx = np.logical_or(
-                transmission_data.wl_grid
-                < self.description["wl_min"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-                transmission_data.wl_grid
-                > self.description["wl_max"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-            )
+            idx = self._outside_channel(transmission_data.wl_grid)
             transmission_data.data[idx] = 0.0
 
-        self.debug("transmission in channel : {}".format(transmission))
+        self.debug("transmission in channel : %s", transmission)
         return transmission, transmission_data
 
     def _get_qe(self):
@@ -337,7 +786,7 @@ class Instrument(Logger):
             self.table["LeftBinEdge"],
             self.table["RightBinEdge"],
         )
-        self.debug("qe in channel : {}".format(qe))
+        self.debug("qe in channel : %s", qe)
         return qe, qe_data
 
     def _get_efficiency(self, wl, target):
@@ -346,6 +795,30 @@ class Instrument(Logger):
         # transmission = interp1d(wl, self.built_instr['transmission_data']['wl_grid'],
         #                         self.built_instr['transmission_data']['data'], left=0.0, right=0.0)
         # wave_window = np.ones(self.table['Wavelength'])
+        qe, transmission = self._get_throughput(wl)
+
+        sky_transmission = self._get_sky_transmission(wl, target)
+        if sky_transmission is not None:
+            transmission.data *= sky_transmission
+
+        wave_window = np.ones(wl.size)
+        return qe.data, transmission.data, wave_window
+
+    def _get_sky_transmission(self, wl, target):
+        """
+        returns the target sky transmission rebinned to wl, or None if the target has none.
+        The binned transmission is stored in the table as `sky TR`.
+        """
+        if not hasattr(target, "skyTransmission"):
+            return None
+        target_transmission = copy.deepcopy(target.skyTransmission)
+        self.table["sky TR"], _ = self._get_transmission(
+            target_transmission.wl_grid, target_transmission.data
+        )
+        target_transmission.spectral_rebin(wl)
+        return target_transmission.data
+
+    def _get_throughput(self, wl):
         qe = Signal(
             self.built_instr["qe_data"]["wl_grid"]["value"]
             * u.Unit(self.built_instr["qe_data"]["wl_grid"]["unit"]),
@@ -359,30 +832,13 @@ class Instrument(Logger):
             self.built_instr["transmission_data"]["data"]["value"],
         )
         transmission.spectral_rebin(wl)
-
-        if hasattr(target, "skyTransmission"):
-            target_transmission = copy.deepcopy(target.skyTransmission)
-            self.table["sky TR"], _ = self._get_transmission(
-                target_transmission.wl_grid, target_transmission.data
-            )
-            target_transmission.spectral_rebin(wl)
-            transmission.data *= target_transmission.data
-
-        wave_window = np.ones(wl.size)
-        return qe.data, transmission.data, wave_window
+        return qe, transmission
 
     def _add_data_to_built(self, name, data):
         self.built_instr[name] = data
 
-    def _window_function(self, signal):
-        window_function = []
-        for wld, wlu in zip(
-            self.table["LeftBinEdge"], self.table["RightBinEdge"]
-        ):
-            mask = np.logical_and(
-                signal.wl_grid >= wld, signal.wl_grid < wlu
-            ).astype(float)
-            window_function.append(mask)
-        window_function = np.array(window_function)
-        self.debug("window function: {}".format(window_function))
-        return window_function
+    def _binning_plan(self, wl_grid):
+        """returns the :class:`BinningPlan` of the channel spectral bins over wl_grid"""
+        return BinningPlan(
+            wl_grid, self.table["LeftBinEdge"], self.table["RightBinEdge"]
+        )
@@ -1,13 +1,17 @@
+from collections import OrderedDict
+
 import astropy.constants as const
 import astropy.units as u
 import numpy as np
 from astropy.table import QTable
+from scipy.sparse import csr_matrix
 
 from .instrument import Instrument
 from exorad.utils.exolib import binnedPSF
 from exorad.utils.exolib import find_aperture_radius
 from exorad.utils.exolib import paosPSF
 from exorad.utils.exolib import pixel_based_psf
+from exorad.utils.exolib import trapz_weights
 
 
 class Photometer(Instrument):
@@ -33,17 +37,14 @@ class Photometer(Instrument):
         self.table["RightBinEdge"] = [
             right_bin_edge.value
         ] * right_bin_edge.unit
-        self.debug("wavelength table: \n{}".format(self.table))
+        self.debug("wavelength table: \n%s", self.table)
 
     def builder(self):
-        self.info("building {}".format(self.name))
+        self.info("building %s", self.name)
         self._wavelength_table()
         # self.table['TR'], transmission_data = self._get_transmission()
         # self._add_data_to_built('transmission_data', transmission_data.to_dict())
 
-        self.table["QE"], qe_data = self._get_qe()
-        self._add_data_to_built("qe_data", qe_data.to_dict())
-
         psfFilename = None
         psf_format = None
 
@@ -81,7 +82,7 @@ class Photometer(Instrument):
         self._add_data_to_built("extent", extent)
 
         window_size_px = self._windows_size(prf, psf_format)
-        self.debug("window size : {}".format(window_size_px))
+        self.debug("window size : %s", window_size_px)
         self._add_data_to_built("window_size_px", window_size_px)
         self.table["WindowSize"] = window_size_px
 
@@ -131,7 +132,68 @@ class Photometer(Instrument):
                 )
         return window_size_px
 
+    def _star_response_matrices(self, wl):
+        qe, transmission = self._get_throughput(wl)
+        transmission = transmission.data
+        wave_window = np.ones(wl.size)
+        if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
+            idx = self._outside_channel(wl)
+            transmission[idx] = wave_window[idx] = 0.0
+
+        weights = trapz_weights(wl.to_value(u.um))
+        efficiency = (
+            self.payload["optics"]["Atel"]["value"]
+            * qe.data
+            * transmission
+            * wl.to(u.m)
+            / const.c
+            / const.h
+            * (u.W / u.m**2 / u.um)
+        ).to_value(1 / u.um / u.s)
+        star_signal = efficiency * weights
+
+        if "apertureCorrection" in self.description["aperture"].keys():
+            aperture = self.description["aperture"]["apertureCorrection"][
+                "value"
+            ]
+        elif "EnE" in self.description["aperture"].keys():
+            aperture = self.description["aperture"]["EnE"]["value"]
+        else:
+            aperture = 1.0
+        aperture = u.Quantity(aperture, u.dimensionless_unscaled).value
+
+        matrices = OrderedDict()
+        matrices["starFlux"] = (
+            csr_matrix(wave_window * weights),
+            u.W / u.m**2,
+        )
+        matrices["starSignal"] = (csr_matrix(star_signal), u.count / u.s)
+        matrices["star_signal_inAperture"] = (
+            csr_matrix(aperture * star_signal),
+            u.count / u.s,
+        )
+        matrices["star_MaxSignal_inPixel"] = (
+            csr_matrix(self.built_instr["PRF"].max() * star_signal),
+            u.count / u.s,
+        )
+        return matrices
+
+    def _star_columns(self, matrices, seds, sky_transmission=None):
+        products = super()._star_columns(matrices, seds, sky_transmission)
+        out = OrderedDict()
+        for key in [
+            "starFlux",
+            "starSignal",
+            "star_signal_inAperture",
+            "star_MaxSignal_inPixel",
+        ]:
+            out[key] = products[key]
+        return out
+
     def propagate_target(self, target):
+        out = self._propagate_target_response(target)
+        if out is not None:
+            return out
         out = QTable()
         wl = target.star.sed.wl_grid
         qe, transmission, wave_window = self._get_efficiency(wl, target)
@@ -140,23 +202,14 @@ class Photometer(Instrument):
 
         if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
             self.debug("force channel wl edge enabled")
-            idx = np.logical_or(
-                wl
-                < self.description["wl_min"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-                wl
-                > self.description["wl_max"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-            )
+            idx = self._outside_channel(wl)
             transmission[idx] = wave_window[idx] = 0.0
 
         star_flux = np.trapz(
             wave_window * target.star.sed.data, x=target.star.sed.wl_grid
         ).to(u.W / u.m**2)
         out["starFlux"] = [star_flux.value] * star_flux.unit
-        self.debug("star flux : {}".format(out["starFlux"]))
+        self.debug("star flux : %s", out["starFlux"])
 
         star_signal = (
             self.payload["optics"]["Atel"]["value"]
@@ -172,7 +225,7 @@ class Photometer(Instrument):
             * u.count
         )
         out["starSignal"] = [star_signal.value] * star_signal.unit
-        self.debug("star signal : {}".format(out["starSignal"]))
+        self.debug("star signal : %s", out["starSignal"])
 
         if "apertureCorrection" in self.description["aperture"].keys():
             star_signal_aperture = (
@@ -191,9 +244,7 @@ class Photometer(Instrument):
             star_signal_aperture.value
         ] * star_signal_aperture.unit
         self.debug(
-            "star signal in aperture : {}".format(
-                out["star_signal_inAperture"]
-            )
+            "star signal in aperture : %s", out["star_signal_inAperture"]
         )
 
         star_signal_in_pixel = self.built_instr["PRF"].max() * star_signal
@@ -201,8 +252,55 @@ class Photometer(Instrument):
             star_signal_in_pixel.value
         ] * star_signal_in_pixel.unit
         self.debug(
-            "star signal in pixel MAX : {}".format(
-                out["star_signal_inAperture"]
+            "star signal in pixel MAX : %s", out["star_signal_inAperture"]
+        )
+        return out
+
+    def propagate_targets(self, wl, seds, sky_transmission=None):
+        out = self._propagate_targets_response(wl, seds, sky_transmission)
+        if out is not None:
+            return out
+        out = OrderedDict()
+        qe, transmission = self._get_throughput(wl)
+        qe, transmission = qe.data, transmission.data
+        wave_window = np.ones(wl.size)
+        if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
+            idx = self._outside_channel(wl)
+            transmission[idx] = wave_window[idx] = 0.0
+        if sky_transmission is not None:
+            out["foreground_transmission"] = self._bin_transmission(
+                wl, sky_transmission
             )
+            transmission = transmission * sky_transmission
+
+        # the integrals over the wavelength grid are products with the trapezoidal weights
+        weights = trapz_weights(wl)
+        star_flux = ((wave_window * seds) @ weights).to(u.W / u.m**2)
+        out["starFlux"] = star_flux[..., np.newaxis]
+
+        star_signal = (
+            self.payload["optics"]["Atel"]["value"]
+            * (
+                (qe * seds * transmission * wl.to(u.m) / const.c / const.h)
+                @ weights
+            ).si
+            * u.count
         )
+        out["starSignal"] = star_signal[..., np.newaxis]
+
+        if "apertureCorrection" in self.description["aperture"].keys():
+            star_signal_aperture = (
+                star_signal
+                * self.description["aperture"]["apertureCorrection"]["value"]
+            )
+        elif "EnE" in self.description["aperture"].keys():
+            star_signal_aperture = (
+                star_signal * self.description["aperture"]["EnE"]["value"]
+            )
+        else:
+            star_signal_aperture = star_signal
+        out["star_signal_inAperture"] = star_signal_aperture[..., np.newaxis]
+
+        star_signal_in_pixel = self.built_instr["PRF"].max() * star_signal
+        out["star_MaxSignal_inPixel"] = star_signal_in_pixel[..., np.newaxis]
         return out
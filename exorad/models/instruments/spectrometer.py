@@ -1,4 +1,5 @@
 import os
+from collections import OrderedDict
 
 import astropy.constants as const
 import astropy.units as u
@@ -6,15 +7,20 @@ import numpy as np
 import pandas as pd
 from astropy.table import QTable
 from scipy.interpolate import interp1d
+from scipy.sparse import diags
 
 from .instrument import Instrument
 from exorad.models.signal import CountsPerSeconds
 from exorad.models.signal import CustomSignal
 from exorad.models.signal import Signal
+from exorad.utils.binning import BinningPlan
 from exorad.utils.exolib import binnedPSF
 from exorad.utils.exolib import find_aperture_radius
 from exorad.utils.exolib import paosPSF
 from exorad.utils.exolib import pixel_based_psf
+from exorad.utils.exolib import rebin
+from exorad.utils.exolib import rebin_matrix
+from exorad.utils.exolib import trapz_weights
 
 
 class Spectrometer(Instrument):
@@ -31,9 +37,8 @@ class Spectrometer(Instrument):
         # define the wavelength grid
         if "value" in self.description["targetR"].keys():
             self.debug(
-                "spectral resolution set to {}".format(
-                    self.description["targetR"]["value"]
-                )
+                "spectral resolution set to %s",
+                self.description["targetR"]["value"],
             )
             # native R
             if self.description["targetR"]["value"] == "native":
@@ -105,11 +110,11 @@ class Spectrometer(Instrument):
         self.table["RightBinEdge"] = (
             self.table["Wavelength"] + 0.5 * self.table["Bandwidth"]
         )
-        self.debug("wavelength table: \n{}".format(self.table))
+        self.debug("wavelength table: \n%s", self.table)
         return wl_bin
 
     def builder(self):
-        self.info("building {}".format(self.name))
+        self.info("building %s", self.name)
 
         # building pixel grid
         try:
@@ -147,9 +152,7 @@ class Spectrometer(Instrument):
             wl_sol_func_reverse(self.description["wl_max"]["value"])
             * wl_solution_data.data.unit
         )
-        self.debug(
-            "first pixel: {}, last pixel: {}".format(first_pixel, last_pixel)
-        )
+        self.debug("first pixel: %s, last pixel: %s", first_pixel, last_pixel)
 
         if last_pixel < first_pixel:
             last_pixel, first_pixel = first_pixel, last_pixel
@@ -164,13 +167,13 @@ class Spectrometer(Instrument):
             * delta.unit
         )
         coord_pix_center = np.flip(coord_pix_center)
-        self.debug("pix_center: {}".format(coord_pix_center))
+        self.debug("pix_center: %s", coord_pix_center)
         self._add_data_to_built("pix_center", coord_pix_center)
         # wavelength sampled by the pixels
         pixel_wavelength = (
             wl_sol_func(coord_pix_center) * wl_solution_data.wl_grid.unit
         )
-        self.debug("wl_pix_center: {}".format(pixel_wavelength))
+        self.debug("wl_pix_center: %s", pixel_wavelength)
         self._add_data_to_built("wl_pix_center", pixel_wavelength)
         pixel_bandwidth = (
             np.abs(
@@ -184,8 +187,6 @@ class Spectrometer(Instrument):
         # initializing channel table
         wl_bin = self._wavelength_table()
         self._add_data_to_built("wl_bin", wl_bin)
-        self.table["QE"], qe_data = self._get_qe()
-        self._add_data_to_built("qe_data", qe_data.to_dict())
 
         # PSF gain
         _gain_prf = np.empty(10, dtype=float)
@@ -278,7 +279,7 @@ class Spectrometer(Instrument):
         #     radius = EncE_sol(self.table['Wavelength'])
         else:
             radius = 1.22
-        self.debug("radius : {}".format(radius))
+        self.debug("radius : %s", radius)
 
         window_spatial_width = (
             2.0
@@ -292,9 +293,8 @@ class Spectrometer(Instrument):
                 "value"
             ]
             self.debug(
-                "window spatial width scaled by {}".format(
-                    self.description["window_spatial_scale"]["value"]
-                )
+                "window spatial width scaled by %s",
+                self.description["window_spatial_scale"]["value"],
             )
         if "window_spatial_pixel" in list(self.description.keys()):
             window_spatial_width = np.full(
@@ -302,9 +302,8 @@ class Spectrometer(Instrument):
                 float(self.description["window_spatial_pixel"]["value"]),
             )
             self.debug(
-                "window spatial width set to {}".format(
-                    self.description["window_spatial_pixel"]["value"]
-                )
+                "window spatial width set to %s",
+                self.description["window_spatial_pixel"]["value"],
             )
         if "window_spectral_pixel" in list(self.description.keys()):
             window_spectral_width = np.full(
@@ -312,18 +311,94 @@ class Spectrometer(Instrument):
                 float(self.description["window_spectral_pixel"]["value"]),
             )
             self.debug(
-                "window spectral width set to {}".format(
-                    self.description["window_spectral_pixel"]["value"]
-                )
+                "window spectral width set to %s",
+                self.description["window_spectral_pixel"]["value"],
             )
         window_size_px = window_spectral_width * window_spatial_width
         self._add_data_to_built("window_spectral_width", window_spectral_width)
         self._add_data_to_built("window_spatial_width", window_spatial_width)
         self._add_data_to_built("window_size_px", window_size_px)
         self.table["WindowSize"] = window_size_px
-        self.debug("window size : {}".format(window_size_px))
+        self.debug("window size : %s", window_size_px)
+
+    def _gain_prf(self):
+        gain_prf_data = self.built_instr["gain_prf_data"]
+        return interp1d(
+            gain_prf_data["wl_grid"]["value"],
+            gain_prf_data["data"]["value"],
+            kind="cubic",
+            assume_sorted=False,
+        )
+
+    def _pixel_binning(self):
+        """returns the :class:`BinningPlan` of the spectral bins over the pixels, computed once"""
+        if "pixel" not in self._binning_plans:
+            self._binning_plans["pixel"] = BinningPlan(
+                self.built_instr["wl_pix_center"],
+                self.table["LeftBinEdge"],
+                self.table["RightBinEdge"],
+                closed="neither",
+            )
+        return self._binning_plans["pixel"]
+
+    def _star_response_matrices(self, wl):
+        wl_pix = self.built_instr["wl_pix_center"]
+        if np.any(self._pixel_binning().counts == 0) or np.any(
+            np.diff(wl_pix) == 0
+        ):
+            self.debug("empty spectral bins: star response not built")
+            return {}
+
+        qe, transmission = self._get_throughput(wl)
+        transmission = transmission.data
+        wave_window = np.ones(wl.size)
+        if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
+            idx = self._outside_channel(wl)
+            transmission[idx] = wave_window[idx] = 0.0
+        efficiency = (
+            self.payload["optics"]["Atel"]["value"]
+            * transmission
+            * qe.data
+            * wl.to(u.m)
+            / const.h
+            / const.c
+            * (u.W / u.m**2 / u.um)
+        ).to_value(1 / u.um / u.s)
+
+        weights = self._binning_plan(wl).matrix(
+            trapz_weights(wl.to_value(u.um))
+        )
+        matrices = OrderedDict()
+        matrices["starFlux"] = (weights @ diags(wave_window), u.W / u.m**2)
+        matrices["starSignal"] = (weights @ diags(efficiency), u.count / u.s)
+
+        # the signal in the pixels is the signal density resampled on the pixels.
+        # Its maximum in each bin is not linear, and it is taken after the product
+        _, resample = rebin_matrix(wl_pix.to(u.um), wl)
+        pixel_factor = (
+            self.built_instr["pixel_bandwidth"] * self._gain_prf()(wl_pix)
+        ).to_value(u.um)
+        matrices["pixel_signal"] = (
+            diags(pixel_factor) @ resample @ diags(efficiency),
+            u.count / u.s,
+        )
+        return matrices
+
+    def _star_columns(self, matrices, seds, sky_transmission=None):
+        products = super()._star_columns(matrices, seds, sky_transmission)
+        out = OrderedDict()
+        out["starFlux"] = products["starFlux"]
+        out["starSignal"] = products["starSignal"]
+        out["star_signal_inAperture"] = products["starSignal"]
+        out["star_MaxSignal_inPixel"] = self._pixel_binning().max(
+            products["pixel_signal"]
+        )
+        return out
 
     def propagate_target(self, target):
+        out = self._propagate_target_response(target)
+        if out is not None:
+            return out
         out = QTable()
         wl = target.star.sed.wl_grid
         qe, transmission, wave_window = self._get_efficiency(wl, target)
@@ -331,16 +406,7 @@ class Spectrometer(Instrument):
             out["foreground_transmission"] = self.table["sky TR"]
         if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
             self.debug("force channel wl edge enabled")
-            idx = np.logical_or(
-                wl
-                < self.description["wl_min"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-                wl
-                > self.description["wl_max"]["value"].to(
-                    self.table["Wavelength"].unit
-                ),
-            )
+            idx = self._outside_channel(wl)
             transmission[idx] = wave_window[idx] = 0.0
 
         signal_density = CustomSignal(
@@ -357,34 +423,27 @@ class Spectrometer(Instrument):
             * u.count,
             data_unit=u.count / u.um / u.s,
         )
-        self.debug("star signal density: {}".format(signal_density.data))
+        self.debug("star signal density: %s", signal_density.data)
 
         # max signal in pixel
-        gain_prf_data = self.built_instr["gain_prf_data"]
-        gain_prf = interp1d(
-            gain_prf_data["wl_grid"]["value"],
-            gain_prf_data["data"]["value"],
-            kind="cubic",
-            assume_sorted=False,
-        )
+        gain_prf = self._gain_prf()
 
         # signal in spectral bin
-        window_function = self._window_function(target.star.sed)
-        self.debug("window function: {}".format(window_function))
+        binning = self._binning_plan(wl)
+        self.debug("spectral bin sizes: %s", binning.counts)
+        weights = trapz_weights(wl.to(u.um))
 
         flux_density = wave_window * target.star.sed.data
-        self.debug("star flux density: {}".format(flux_density))
+        self.debug("star flux density: %s", flux_density)
 
-        star_flux = np.trapz(
-            flux_density * window_function, x=target.star.sed.wl_grid.to(u.um)
-        ).to(u.W / u.m**2)
-        self.debug("star flux : {}".format(star_flux))
+        star_flux = binning.sum(flux_density * weights).to(u.W / u.m**2)
+        self.debug("star flux : %s", star_flux)
         out["starFlux"] = star_flux
 
-        star_signal = np.trapz(
-            signal_density.data * window_function, x=target.star.sed.wl_grid
-        ).to(u.count / u.s)
-        self.debug("star signal : {}".format(star_signal))
+        star_signal = binning.sum(signal_density.data * weights).to(
+            u.count / u.s
+        )
+        self.debug("star signal : %s", star_signal)
         out["starSignal"] = star_signal
         out["star_signal_inAperture"] = star_signal
 
@@ -401,22 +460,62 @@ class Spectrometer(Instrument):
                 * gain_prf(star_signal_inPixel_density.wl_grid)
             ).to(u.count / u.s),
         )
-        starSignal_inPixel_max = (
-            np.empty(self.table["Wavelength"].size, dtype=float)
-            * star_signal_inPixel.data.unit
+        starSignal_inPixel_max = self._pixel_binning().max(
+            star_signal_inPixel.data
         )
-        for k, (wld, wlu) in enumerate(
-            zip(self.table["LeftBinEdge"], self.table["RightBinEdge"])
-        ):
-            idx = np.where(
-                np.logical_and(
-                    star_signal_inPixel.wl_grid > wld,
-                    star_signal_inPixel.wl_grid < wlu,
-                )
-            )[0]
-            starSignal_inPixel_max[k] = np.max(star_signal_inPixel.data[idx])
         out["star_MaxSignal_inPixel"] = starSignal_inPixel_max
-        self.debug(
-            "star signal in pixel MAX : {}".format(starSignal_inPixel_max)
+        self.debug("star signal in pixel MAX : %s", starSignal_inPixel_max)
+        return out
+
+    def propagate_targets(self, wl, seds, sky_transmission=None):
+        out = self._propagate_targets_response(wl, seds, sky_transmission)
+        if out is not None:
+            return out
+        out = OrderedDict()
+        qe, transmission = self._get_throughput(wl)
+        qe, transmission = qe.data, transmission.data
+        wave_window = np.ones(wl.size)
+        if self.payload["optics"]["ForceChannelWlEdge"]["value"]:
+            idx = self._outside_channel(wl)
+            transmission[idx] = wave_window[idx] = 0.0
+        if sky_transmission is not None:
+            out["foreground_transmission"] = self._bin_transmission(
+                wl, sky_transmission
+            )
+            transmission = transmission * sky_transmission
+
+        signal_density = (
+            self.payload["optics"]["Atel"]["value"]
+            * transmission
+            * qe
+            * seds
+            * wl.to(u.m)
+            / const.h
+            / const.c
+        ).to(1 / u.um / u.s) * u.count
+
+        # the integrals in the spectral bins are sums of trapezoidal terms
+        binning = self._binning_plan(wl)
+        weights = trapz_weights(wl)
+        out["starFlux"] = binning.sum(wave_window * seds * weights).to(
+            u.W / u.m**2
+        )
+        out["starSignal"] = binning.sum(signal_density * weights).to(
+            u.count / u.s
+        )
+        out["star_signal_inAperture"] = out["starSignal"]
+
+        # max signal in pixel
+        gain_prf = self._gain_prf()
+        wl_pix = self.built_instr["wl_pix_center"]
+        signal_in_pixel = rebin(wl_pix, wl, signal_density)[1]
+        signal_in_pixel[np.isnan(signal_in_pixel)] = 0.0
+        signal_in_pixel = (
+            signal_in_pixel
+            * self.built_instr["pixel_bandwidth"]
+            * gain_prf(wl_pix)
+        ).to(u.count / u.s)
+        out["star_MaxSignal_inPixel"] = self._pixel_binning().max(
+            signal_in_pixel
         )
         return out
@@ -9,6 +9,18 @@ from exorad.models.signal import Signal
 
 logger = logging.getLogger("exorad.noise")
 
+# canonical units of the noise budget core
+_signal_unit = u.count / u.s
+_noise_unit = u.count / u.s * u.hr**0.5
+_budget_units = {
+    "saturation_time": u.s,
+    "frameTime": u.s,
+    "total_noise": u.hr**0.5,
+    "read_gain": u.dimensionless_unscaled,
+    "shot_gain": u.dimensionless_unscaled,
+}
+_hour = u.hr.to(u.s)
+
 
 def frame_time(target, channel, out):
     """
@@ -33,21 +45,17 @@ def frame_time(target, channel, out):
     max_signal_in_pix = target.table["MaxSignal_inPixel"][
         target.table["chName"] == name
     ]
-    out["saturation_time"] = (
-        channel["detector"]["well_depth"]["value"] / max_signal_in_pix
-    )
-    logger.debug("saturation time : {}".format(out["saturation_time"]))
-    if "frame_time" in channel["detector"].keys():
-        out["frameTime"] = channel["detector"]["frame_time"][
-            "value"
-        ] * np.ones(out["saturation_time"].size)
-    else:
-        out["frameTime"] = (
-            channel["detector"]["f_well_depth"]["value"]
-            * np.min(out["saturation_time"])
-            * np.ones(out["saturation_time"].size)
-        )
-    logger.debug("frame time : {}".format(out["frameTime"]))
+    detector = _detector_inputs(channel)
+    saturation_time, t_frame = _frame_times(
+        detector["well_depth"],
+        _value(max_signal_in_pix, _signal_unit),
+        detector["frame_time"],
+        detector["f_well_depth"],
+    )
+    out["saturation_time"] = saturation_time * u.s
+    logger.debug("saturation time : %s", out["saturation_time"])
+    out["frameTime"] = t_frame * u.s
+    logger.debug("frame time : %s", out["frameTime"])
     return out
 
 
@@ -59,28 +67,34 @@ def multiaccum(channel, t_frame):
     -----------
     channel: dict
         channel description
-    t_frame: float
+    t_frame: float or array
         frame time
 
     Returns
     --------
-    float
+    float or array
         read noise gain
-    float
+    float or array
         shot noise gain
     """
-    nRead = np.floor(t_frame * channel["detector"]["freqNDR"]["value"])
-
+    detector = _detector_inputs(channel)
     if "multiaccumM" in channel["detector"]:
-        m = channel["detector"]["multiaccumM"]["value"]
-        logger.debug("multiaccum activated: m = {}".format(m))
-        tf = 0.0 * u.s
-    else:
-        m = 1
-        tf = 0.0 * u.s
+        logger.debug("multiaccum activated: m = %s", detector["multiaccum_m"])
+    read_gain, shot_gain = _multiaccum_gains(
+        _value(t_frame, u.s), detector["freq_ndr"], detector["multiaccum_m"]
+    )
+    if np.ndim(read_gain) == 0:
+        read_gain, shot_gain = float(read_gain), float(shot_gain)
+    logger.debug("read noise gain: %s", read_gain)
+    logger.debug("shot noise gain: %s", shot_gain)
+    return read_gain, shot_gain
+
 
-    if nRead < 2:
-        nRead = 2.0  # Force to CDS in nRead < 2
+def _multiaccum_gains(t_frame, freq_ndr, m):
+    """multiaccum read and shot gains, from frame time [s] and NDR frequency [Hz]"""
+    nRead = np.floor(t_frame * freq_ndr)
+    tf = 0.0  # [s]
+    nRead = np.where(nRead < 2, 2.0, nRead)  # Force to CDS in nRead < 2
 
     read_gain = 12.0 * (nRead - 1.0) / (nRead**2 + nRead) / m
     shot_gain = (
@@ -100,8 +114,6 @@ def multiaccum(channel, t_frame):
             / t_frame
         )
     )
-    logger.debug("read noise gain: {}".format(read_gain))
-    logger.debug("shot noise gain: {}".format(shot_gain))
     return read_gain, shot_gain
 
 
@@ -131,15 +143,13 @@ def photon_noise(table, channel, shot_gain, out):
     for key in signals:
         noise_key = "{}_noise".format(key)
         out[noise_key] = (
-            np.sqrt(
-                shot_gain
-                * table[key][table["chName"] == name]
-                * u.count
-                / u.hr
-            ).to(u.count / u.s)
-            * u.hr**0.5
+            _photon_noise(
+                _value(shot_gain, u.dimensionless_unscaled),
+                _value(table[key][table["chName"] == name], _signal_unit),
+            )
+            * _noise_unit
         )
-        logger.debug("{} : {}".format(noise_key, out[noise_key]))
+        logger.debug("%s : %s", noise_key, out[noise_key])
     return out
 
 
@@ -162,13 +172,47 @@ def photon_noise_variance(table, out):
     """
     '''
     signals = [key for key in table.keys() if "signal" in key]
-    _photon_noise_variance = (
-        np.zeros(out["frameTime"].size) * (u.count / u.s) ** 2 * u.hr
+    return (
+        _sum_of_squares(
+            [
+                _value(out["{}_noise".format(key)], _noise_unit)
+                for key in signals
+            ],
+            out["frameTime"].shape,
+        )
+        * _noise_unit**2
     )
-    for key in signals:
-        noise_key = "{}_noise".format(key)
-        _photon_noise_variance += out[noise_key] * out[noise_key]
-    return _photon_noise_variance
+
+
+def _frame_times(well_depth, max_signal, frame_time, f_well_depth):
+    """
+    saturation and frame times [s], from the well depth [ct] and the maximum signal in a pixel [ct/s].
+    If the frame time is None, it is the fraction f_well_depth of the shortest saturation time
+    """
+    saturation_time = well_depth / max_signal
+    if frame_time is not None:
+        t_frame = frame_time * np.ones(saturation_time.shape)
+    else:
+        t_frame = (
+            f_well_depth
+            * np.min(saturation_time, axis=-1, keepdims=True)
+            * np.ones(saturation_time.shape)
+        )
+    return saturation_time, t_frame
+
+
+def _photon_noise(shot_gain, signal):
+    """photon noise [ct/s hr^1/2] on one hour of integration, from a signal [ct/s]"""
+    # sqrt(ct/s * ct/hr) -> ct/s hr^1/2
+    return np.sqrt(shot_gain * signal / _hour)
+
+
+def _sum_of_squares(noises, shape):
+    """sum of the squared noises, with the given shape"""
+    variance = np.zeros(shape)
+    for noise in noises:
+        variance = variance + noise * noise
+    return variance
 
 
 def add_custom_noise(custom, wl, out):
@@ -182,7 +226,7 @@ def add_custom_noise(custom, wl, out):
         custom_noise.spectral_rebin(wl)
         out["{}_noise".format(col_name)] = custom_noise.data
         logger.debug(
-            "{} added as custom noise :{}".format(col_name, custom_noise.data)
+            "%s added as custom noise :%s", col_name, custom_noise.data
         )
         out["total_noise"] = np.sqrt(
             out["total_noise"] * out["total_noise"]
@@ -201,9 +245,9 @@ def add_custom_noise(custom, wl, out):
                 "{}_noise".format(custom[contrib]["name"]["value"])
             ] = custom_noise
             logger.debug(
-                "{} added as custom noise :{}".format(
-                    custom[contrib]["name"]["value"], custom_noise
-                )
+                "%s added as custom noise :%s",
+                custom[contrib]["name"]["value"],
+                custom_noise,
             )
             out["total_noise"] = np.sqrt(
                 out["total_noise"] * out["total_noise"]
@@ -213,9 +257,9 @@ def add_custom_noise(custom, wl, out):
         custom_noise = custom["value"] * 1e-6 * np.ones(wl.size) * u.hr**0.5
         out["{}_noise".format(custom["name"]["value"])] = custom_noise
         logger.debug(
-            "{} added as custom noise :{}".format(
-                custom["name"]["value"], custom_noise
-            )
+            "%s added as custom noise :%s",
+            custom["name"]["value"],
+            custom_noise,
         )
         out["total_noise"] = np.sqrt(
             out["total_noise"] * out["total_noise"]
@@ -224,6 +268,308 @@ def add_custom_noise(custom, wl, out):
     return out
 
 
+def channel_noise(table, channel, payload=None):
+    """
+    Given the signals in the channel spectral bins, returns the channel noise budget.
+    The signal columns can have leading axes, as for the signals of many targets stacked together:
+    the spectral bins run along the last axis.
+
+    The units are checked here, converting the inputs to [ct/s], [ct] and [s]:
+    the budget itself is computed by :func:`noise_budget` on plain float arrays.
+
+    Parameters
+    -----------
+    table: dict or QTable
+        columns of the channel spectral bins. It must contain `Wavelength`, `WindowSize`,
+        `MaxSignal_inPixel`, `star_signal_inAperture` and the signals to include in the photon noise,
+        which are the columns with `signal` in their names
+    channel: dict
+        channel description
+    payload: dict
+        payload description, to include the common custom noise. Default is None
+
+    Returns
+    --------
+    OrderedDict
+        noise columns
+    """
+    budget = noise_budget(**_budget_inputs(table, channel))
+    out = _noise_columns(budget, table["Wavelength"], channel, payload)
+    logger.debug("total noise : %s", out["total_noise"])
+    return out
+
+
+def noise_sweep(
+    table,
+    channel,
+    payload=None,
+    read_noise=None,
+    dark_current=None,
+    freq_ndr=None,
+    well_depth=None,
+):
+    """
+    Noise budget of the channel spectral bins over a grid of detector parameters.
+    Every parameter that is not given is fixed to the value in the channel description.
+    The budget is computed once by :func:`noise_budget` on arrays broadcast over the grid,
+    whose axes are read noise, dark current, NDR frequency and well depth, in this order,
+    followed by the axes of the signal columns.
+
+    Parameters
+    -----------
+    table: dict or QTable
+        columns of the channel spectral bins, as for :func:`channel_noise`.
+        The columns can have leading axes, as for the signals of many targets stacked together
+    channel: dict
+        channel description
+    payload: dict
+        payload description, to include the common custom noise. Default is None
+    read_noise: array
+        read noise values [ct]. Default is None
+    dark_current: array
+        dark current values [ct/s]. Default is None
+    freq_ndr: array
+        non destructive reads frequency values [Hz]. Default is None
+    well_depth: array
+        well depth values [ct]. Default is None
+
+    Returns
+    --------
+    OrderedDict
+        grid values of `read_noise`, `dark_current`, `freqNDR` and `well_depth`
+    OrderedDict
+        noise columns as in :func:`channel_noise`, plus the multiaccum `read_gain` and `shot_gain`.
+        Every column has shape (read noise, dark current, NDR frequency, well depth) + the signal shape
+        and can be a read-only view of a smaller array
+
+    Raises
+    ------
+    ValueError
+        if a parameter has no values
+    UnitConversionError
+        if a parameter cannot be converted to its unit
+
+    Examples
+    --------
+    >>> grid, out = noise_sweep(table, channel.description, channel.payload,
+    ...                         read_noise=[10, 15, 20] * u.ct,
+    ...                         freq_ndr=[0.1, 1.0] * u.Hz)
+    >>> out['total_noise'].shape
+    (3, 1, 2, 1, 12)
+    """
+    inputs = _budget_inputs(table, channel)
+    detector = channel["detector"]
+    values = OrderedDict(
+        [
+            ("read_noise", (read_noise, u.count, "read_noise")),
+            ("dark_current", (dark_current, _signal_unit, "dark_current")),
+            ("freqNDR", (freq_ndr, u.Hz, "freq_ndr")),
+            ("well_depth", (well_depth, u.count, "well_depth")),
+        ]
+    )
+    signal_ndim = np.ndim(inputs["max_signal"])
+    grid = OrderedDict()
+    for axis, (key, (value, unit, arg)) in enumerate(values.items()):
+        if value is None:
+            value = detector[key]["value"]
+        value = np.atleast_1d(_value(value, unit)).ravel()
+        if value.size == 0:
+            raise ValueError("no {} values to sweep".format(key))
+        grid[key] = u.Quantity(value, unit)
+        shape = [1] * (len(values) + signal_ndim)
+        shape[axis] = value.size
+        inputs[arg] = value.reshape(shape)
+    logger.debug("detector parameters grid : %s", dict(grid))
+
+    budget = noise_budget(**inputs)
+    budget["read_gain"], budget["shot_gain"] = _multiaccum_gains(
+        budget["frameTime"][..., :1],
+        inputs["freq_ndr"],
+        inputs["multiaccum_m"],
+    )
+    out = _noise_columns(budget, table["Wavelength"], channel, payload)
+    shape = tuple(q.size for q in grid.values()) + np.shape(
+        inputs["max_signal"]
+    )
+    out = OrderedDict(
+        (key, np.broadcast_to(value, shape, subok=True))
+        for key, value in out.items()
+    )
+    return grid, out
+
+
+def _budget_inputs(table, channel):
+    """arguments of :func:`noise_budget` from the channel bins and description, in canonical units"""
+    signals = OrderedDict(
+        (key, _value(table[key], _signal_unit))
+        for key in table.keys()
+        if "signal" in key
+    )
+    return dict(
+        signals=signals,
+        max_signal=_value(table["MaxSignal_inPixel"], _signal_unit),
+        star_signal=_value(table["star_signal_inAperture"], _signal_unit),
+        window_size=_value(table["WindowSize"], u.dimensionless_unscaled),
+        **_detector_inputs(channel),
+    )
+
+
+def _detector_inputs(channel):
+    """detector and channel arguments of :func:`noise_budget`, in canonical units"""
+    detector = channel["detector"]
+    return dict(
+        well_depth=_value(detector["well_depth"]["value"], u.count),
+        frame_time=_value(detector["frame_time"]["value"], u.s)
+        if "frame_time" in detector.keys()
+        else None,
+        f_well_depth=_value(
+            detector["f_well_depth"]["value"], u.dimensionless_unscaled
+        )
+        if "f_well_depth" in detector.keys()
+        else None,
+        freq_ndr=_value(detector["freqNDR"]["value"], u.Hz),
+        multiaccum_m=_value(
+            detector["multiaccumM"]["value"], u.dimensionless_unscaled
+        )
+        if "multiaccumM" in detector
+        else 1,
+        dark_current=_value(detector["dark_current"]["value"], _signal_unit),
+        read_noise=_value(detector["read_noise"]["value"], u.count),
+        noise_x=_value(channel["NoiseX"]["value"], u.dimensionless_unscaled)
+        if "NoiseX" in channel
+        else 0.0,
+    )
+
+
+def _noise_columns(budget, wl, channel, payload=None):
+    """noise budget columns with their units, and the custom noise added"""
+    out = OrderedDict(
+        (key, u.Quantity(value, _budget_units[key], copy=False))
+        if key in _budget_units
+        else (key, u.Quantity(value, _noise_unit, copy=False))
+        for key, value in budget.items()
+    )
+    if payload:
+        try:
+            out = add_custom_noise(payload["common"]["customNoise"], wl, out)
+        except KeyError:
+            logger.debug("no custom noise found in common section")
+    try:
+        out = add_custom_noise(channel["customNoise"], wl, out)
+    except KeyError:
+        logger.debug("no custom noise found in channel section")
+    return out
+
+
+def noise_budget(
+    signals,
+    max_signal,
+    star_signal,
+    window_size,
+    well_depth,
+    frame_time,
+    f_well_depth,
+    freq_ndr,
+    dark_current,
+    read_noise,
+    multiaccum_m=1,
+    noise_x=0.0,
+):
+    """
+    Noise budget of the channel spectral bins, computed on plain float arrays in canonical units.
+    It is the numeric core of :func:`channel_noise`, that checks the units of its inputs.
+    The arrays can have leading axes: the spectral bins run along the last axis.
+
+    Parameters
+    -----------
+    signals: dict
+        signals to include in the photon noise [ct/s]
+    max_signal: array
+        maximum signal in a pixel [ct/s]
+    star_signal: array
+        star signal in the aperture [ct/s]
+    window_size: array
+        number of pixels in the aperture
+    well_depth: float
+        detector well depth [ct]
+    frame_time: float
+        detector frame time [s]. If None, it is estimated from the saturation time
+    f_well_depth: float
+        fraction of the well depth to use to estimate the frame time
+    freq_ndr: float
+        non destructive reads frequency [Hz]
+    dark_current: float
+        dark current [ct/s]
+    read_noise: float
+        read noise [ct]
+    multiaccum_m: float
+        multiaccum m factor. Default is 1
+    noise_x: float
+        margin on the photon noise variance. Default is 0
+
+    Returns
+    --------
+    OrderedDict
+        saturation and frame time [s], noise columns [ct/s hr^1/2], and `total_noise` [hr^1/2]
+    """
+    out = OrderedDict()
+    out["saturation_time"], out["frameTime"] = _frame_times(
+        well_depth, max_signal, frame_time, f_well_depth
+    )
+    logger.debug("saturation time : %s", out["saturation_time"])
+    logger.debug("frame time : %s", out["frameTime"])
+
+    read_gain, shot_gain = _multiaccum_gains(
+        out["frameTime"][..., :1], freq_ndr, multiaccum_m
+    )
+    logger.debug("read noise gain: %s", read_gain)
+    logger.debug("shot noise gain: %s", shot_gain)
+
+    for key, signal in signals.items():
+        noise_key = "{}_noise".format(key)
+        out[noise_key] = _photon_noise(shot_gain, signal)
+        logger.debug("%s : %s", noise_key, out[noise_key])
+    photon_noise_variance = _sum_of_squares(
+        [out["{}_noise".format(key)] for key in signals],
+        out["frameTime"].shape,
+    )
+
+    out["darkcurrent_noise"] = np.sqrt(
+        shot_gain * window_size * dark_current / _hour
+    )
+    logger.debug("dark current noise : %s", out["darkcurrent_noise"])
+    out["read_noise"] = np.sqrt(
+        read_gain * read_noise**2 * window_size / out["frameTime"] / _hour
+    )
+    logger.debug("read noise : %s", out["read_noise"])
+
+    logger.debug("NoiseX: %s", noise_x)
+    signal = np.array(star_signal, dtype=float)
+    signal[signal == 0.0] = np.nan
+    out["total_noise"] = (
+        np.sqrt(
+            out["darkcurrent_noise"] ** 2
+            + (1.0 + noise_x) * photon_noise_variance
+            + out["read_noise"] ** 2
+        )
+        / signal
+    )
+    return out
+
+
+def _value(data, unit):
+    """
+    values of data in the given unit, as plain floats.
+    Data with no unit are assumed to be already in it.
+
+    Raises
+    ------
+    UnitConversionError
+        if data cannot be converted to the unit
+    """
+    return u.Quantity(data, unit, copy=False).value
+
+
 class Noise(CustomSignal):
     """
     It's a Signal class with data having units of [hr^1/2]
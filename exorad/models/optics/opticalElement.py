@@ -72,7 +72,7 @@ class OpticalElement(Logger):
         """
         super().__init__()
         self.name = description["value"]
-        self.debug(f"Initializing OpticalElement: {self.name}")
+        self.debug("Initializing OpticalElement: %s", self.name)
         self.description = description
         self.wl = wl
         self.type = self.description["type"]["value"]
@@ -207,24 +207,24 @@ class OpticalElement(Logger):
             except KeyError:
                 transmission = np.ones(self.wl.size) * self.description["reflectivity"]["value"]
                 self.debug(
-                    f"Reflectivity keyword found for transmission for {self.name}"
+                    "Reflectivity keyword found for transmission for %s", self.name
                 )
             # Apply wavelength lower bound if specified
             if "wl_min" in self.description:
                 wl_min = self.description["wl_min"]["value"].to(self.wl.unit)
-                self.debug(f"Transmission lower boundary at {wl_min}")
+                self.debug("Transmission lower boundary at %s", wl_min)
                 idx = np.where(self.wl < wl_min)
                 transmission[idx] = 0.0
             # Apply wavelength upper bound if specified
             if "wl_max" in self.description:
                 wl_max = self.description["wl_max"]["value"].to(self.wl.unit)
-                self.debug(f"Transmission upper boundary at {wl_max}")
+                self.debug("Transmission upper boundary at %s", wl_max)
                 idx = np.where(self.wl > wl_max)
                 transmission[idx] = 0.0
         else:
             # Default transmission is 1 (no attenuation)
             transmission = np.ones(self.wl.size)
-        self.debug(f"Transmission: {transmission}")
+        self.debug("Transmission: %s", transmission)
         return transmission
 
     def _get_emissivity(self):
@@ -285,5 +285,5 @@ class OpticalElement(Logger):
         else:
             # Default emissivity is 0 (non-emissive)
             emissivity = np.zeros(self.wl.size)
-        self.debug(f"Emissivity: {emissivity}")
+        self.debug("Emissivity: %s", emissivity)
         return emissivity
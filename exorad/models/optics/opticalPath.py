@@ -10,13 +10,56 @@ from astropy.table import QTable
 from exorad.log import Logger
 from exorad.models.optics.opticalElement import OpticalElement
 from exorad.models.signal import Radiance
-from exorad.utils.diffuse_light_propagation import convolve_with_slit
-from exorad.utils.diffuse_light_propagation import integrate_light
+from exorad.utils.diffuse_light_propagation import integrate_radiance
 from exorad.utils.diffuse_light_propagation import prepare
+from exorad.utils.diffuse_light_propagation import slit_signal
 from exorad.utils.exolib import planck
+from exorad.utils.exolib import rebin
 from exorad.utils.passVal import PassVal
 
 
+def spectral_radiance(wl, T, emissivity):
+    """
+    Calculate the spectral radiance of surfaces at temperatures T.
+
+    The temperatures and the emissivities are broadcast against the wavelength grid,
+    so that the radiances of many surfaces, or of a surface at many temperatures,
+    are computed at once.
+
+    Parameters
+    ----------
+    wl : array_like
+        Wavelength array with units of length.
+    T : scalar or array_like
+        Temperatures in Kelvin. Use a trailing axis of size 1 to broadcast
+        an array of temperatures against the wavelength grid.
+    emissivity : scalar or array_like
+        Emissivity of the surfaces, broadcast as T.
+
+    Returns
+    -------
+    radiance : Quantity
+        Spectral radiance [W m^-2 micron^-1 sr^-1], of the broadcast shape of `wl`, `T` and `emissivity`.
+    """
+    # Ensure wavelength is in microns
+    wl_ = wl.to(u.micron) if hasattr(wl, "unit") else wl
+    # Ensure temperature is in Kelvin
+    T_ = T.to(u.K) if hasattr(T, "unit") else T
+    try:
+        # Calculate spectral radiance using Planck's law
+        I = planck(wl_, T_).to(u.W / (u.m**2 * u.micron * u.sr))
+    except AttributeError:
+        # If Planck function fails, use zeros
+        I = (
+            np.zeros(np.broadcast(np.asarray(wl_), np.asarray(T_)).shape)
+            * u.W
+            / u.m**2
+            / u.sr
+            / u.micron
+        )
+    return emissivity * I
+
+
 def surface_radiance(wl, T, emissivity):
     """
     Calculate the spectral radiance from optics.
@@ -38,18 +81,8 @@ def surface_radiance(wl, T, emissivity):
     radiance : Radiance
         Spectral radiance. It will have the same shape as the input `wl`.
     """
-    # Ensure wavelength is in microns
-    wl_ = wl.to(u.micron) if hasattr(wl, "unit") else wl
-    # Ensure temperature is in Kelvin
-    T_ = T.to(u.K) if hasattr(T, "unit") else T
-    try:
-        # Calculate spectral radiance using Planck's law
-        I = planck(wl_, T_).to(u.W / (u.m**2 * u.micron * u.sr))
-    except AttributeError:
-        # If Planck function fails, use zeros
-        I = np.zeros_like(wl_) * u.W / u.m**2 / u.sr / u.micron
     # Create Radiance object with emissivity applied
-    radiance = Radiance(wl_grid=wl, data=emissivity * I)
+    radiance = Radiance(wl_grid=wl, data=spectral_radiance(wl, T, emissivity))
     return radiance
 
 
@@ -97,6 +130,8 @@ class OpticalPath(Logger):
         Table of optical elements max signal per pixel.
     slit_width : Quantity or None
         Slit width measurement, if a slit is in the optical path. Default is None.
+    downstream : numpy.ndarray or None
+        Transmission downstream of each optical element, as computed by `chain`. Default is None.
 
     Methods
     -------
@@ -110,6 +145,8 @@ class OpticalPath(Logger):
     compute_signal(ch_table, ch_built_instr)
         Produces the telescope self-emission signal for the channel and returns
         the updated channel table.
+    thermal_sweep(temperatures, ch_table, ch_built_instr)
+        Computes the self-emission signal over a grid of temperatures of some optical elements.
 
     Examples
     --------
@@ -144,6 +181,7 @@ class OpticalPath(Logger):
         self.optical_element_dict = self._prepare_elements()
         self.transmission_table = QTable()
         self.slit_width = None
+        self.downstream = None
 
     def build_transmission_table(self):
         """
@@ -164,7 +202,7 @@ class OpticalPath(Logger):
             total_transmission *= self.optical_element_dict[el].transmission
         # Add total transmission to the table
         self.transmission_table["total"] = copy.deepcopy(total_transmission)
-        self.debug(f"Transmission table : {self.transmission_table}")
+        self.debug("Transmission table : %s", self.transmission_table)
         return self.transmission_table
 
     def _wl_grid_refinement(self, wl):
@@ -196,10 +234,10 @@ class OpticalPath(Logger):
                 )
                 * u.um
             )
-            self.debug(f"Single wavelength found. Using grid: {out_wl}")
+            self.debug("Single wavelength found. Using grid: %s", out_wl)
         else:
             out_wl = wl
-            self.debug(f"Selected wavelength grid: {wl}")
+            self.debug("Selected wavelength grid: %s", wl)
         return out_wl
 
     def prepend_optical_elements(self, optical_element_dict):
@@ -234,7 +272,7 @@ class OpticalPath(Logger):
             opt_el = {"value": "noElement", "type": {"value": "surface"}}
         if isinstance(opt_el, OrderedDict):
             for el in opt_el:
-                self.debug(f"Preparing {el}")
+                self.debug("Preparing %s", el)
                 out[el] = OpticalElement(opt_el[el], wl)
         else:
             out[opt_el["value"]] = OpticalElement(opt_el, wl)
@@ -244,6 +282,10 @@ class OpticalPath(Logger):
         """
         Concatenate the optical elements, producing the radiance_table and radiance_dict.
 
+        The optical path is handled as arrays of shape (elements, wavelengths):
+        the transmission downstream of each element is the reverse cumulative product
+        of the transmissions, and the emissions of all the elements are computed at once.
+
         Returns
         -------
         radiance_dict : OrderedDict
@@ -253,33 +295,87 @@ class OpticalPath(Logger):
         self.radiance_table["Wavelength"] = wl
         opt_el = self.optical_element_dict
         opt_list = list(opt_el.keys())
-        self.debug(f"Optics list: {opt_list}")
+        self.debug("Optics list: %s", opt_list)
+
+        self.downstream = self.downstream_transmission()
+        is_slit = np.array([opt_el[k].type == "slit" for k in opt_list])
+        slit_after = self._slit_after()
+
+        emitting = []
         for i, k in enumerate(opt_list):
-            el = opt_el[k]
-            self.debug(f"Propagating {el.name}")
-            out_radiance = InstRadiance(wl_grid=wl, data=np.zeros(wl.size))
-            out_radiance.position = el.position
-            if el.temperature is not None:
-                # Calculate the surface radiance
-                out_radiance.data = surface_radiance(
-                    el.wl, el.temperature, el.emissivity
-                ).data
+            if opt_el[k].temperature is None:
+                self.debug("%s skipped due to missing temperature", k)
             else:
-                self.debug("Skipped due to missing temperature")
-                continue
-            for other_el in opt_list[i + 1 :]:
-                self.debug(f"Passing through {other_el}")
-                # Apply the transmission of subsequent optical elements
-                out_radiance.data *= opt_el[other_el].transmission
-                if opt_el[other_el].type == "slit":
-                    out_radiance.slit = True
-                    self.slit_width = opt_el[other_el].description["width"]["value"]
+                emitting.append(i)
+        if not emitting:
+            return self.radiance_dict
+
+        radiances = (
+            spectral_radiance(
+                wl,
+                u.Quantity(
+                    [opt_el[opt_list[i]].temperature for i in emitting]
+                )[:, np.newaxis],
+                self._stack(
+                    [opt_el[opt_list[i]].emissivity for i in emitting]
+                ),
+            )
+            * self.downstream[emitting]
+        )
+        slits = np.flatnonzero(is_slit)
+        if slits.size and emitting[0] < slits[-1]:
+            self.slit_width = opt_el[opt_list[slits[-1]]].description["width"][
+                "value"
+            ]
+
+        for radiance, i in zip(radiances, emitting):
+            el = opt_el[opt_list[i]]
+            out_radiance = InstRadiance(wl_grid=wl, data=radiance)
+            out_radiance.position = el.position
+            if slit_after[i]:
+                out_radiance.slit = True
             # Store the radiance data
-            self.radiance_dict[el.name] = copy.deepcopy(out_radiance)
-            self.radiance_table[el.name] = copy.deepcopy(out_radiance.data)
-            self.debug(f"Final radiance: {out_radiance.data}")
+            self.radiance_dict[el.name] = out_radiance
+            self.radiance_table[el.name] = radiance
+            self.debug("Final radiance of %s: %s", el.name, radiance)
         return self.radiance_dict
 
+    def downstream_transmission(self):
+        """
+        Transmission of the optical path downstream of each optical element.
+
+        Returns
+        -------
+        transmission : numpy.ndarray
+            Array of shape (elements, wavelengths): the product of the transmissions
+            of the elements following each one, in the order of `optical_element_dict`.
+        """
+        transmission = self._stack(
+            [el.transmission for el in self.optical_element_dict.values()]
+        )
+        downstream = np.ones_like(transmission)
+        downstream[:-1] = np.cumprod(transmission[:0:-1], axis=0)[::-1]
+        return downstream
+
+    def _slit_after(self):
+        """flags the optical elements followed by a slit"""
+        # an element is seen through a slit if any of the following elements is a slit
+        is_slit = np.array(
+            [el.type == "slit" for el in self.optical_element_dict.values()]
+        )
+        slit_after = np.zeros(is_slit.size, dtype=bool)
+        slit_after[:-1] = np.logical_or.accumulate(is_slit[:0:-1])[::-1]
+        return slit_after
+
+    def _stack(self, items):
+        """stacks per element quantities, broadcast to the wavelength grid"""
+        return np.stack(
+            [
+                np.broadcast_to(np.asarray(item, dtype=float), self.wl.shape)
+                for item in items
+            ]
+        )
+
     def compute_signal(self, ch_table, ch_built_instr):
         """
         Compute the telescope self-emission signal for the channel.
@@ -305,54 +401,27 @@ class OpticalPath(Logger):
             omega_pix,
             _,
         ) = prepare(ch_table, ch_built_instr, self.description)
-        for item in self.radiance_dict:
-            self.debug(f"Computing signal for {item}")
-            rad = copy.deepcopy(self.radiance_dict[item])
+        names = list(self.radiance_dict)
+        if names:
+            radiances = [self.radiance_dict[item] for item in names]
             # Rebin the quantum efficiency to match the radiance wavelength grid
-            qe.spectral_rebin(rad.wl_grid)
-            if rad.slit and "slit_width" in ch_built_instr:
-                # If there is a slit, convolve the signal with the slit function
-                max_signal_per_pix, signal = convolve_with_slit(
-                    self.description,
-                    ch_built_instr,
-                    A,
-                    ch_table,
-                    omega_pix,
-                    qe,
-                    rad,
-                )
-            else:
-                self.debug("No slit found")
-                # Calculate the photon rate per unit area
-                rad.data *= (
-                    A
-                    * qe.data
-                    * (qe.wl_grid / const.c / const.h).to(1.0 / u.W / u.s)
-                    * u.count
-                )
-                if hasattr(rad, "angle") and rad.angle is not None:
-                    self.debug("Angle found")
-                    rad.data *= rad.angle
-                else:
-                    if rad.position == "detector":
-                        self.debug("This is the detector box")
-                        rad.data *= np.pi * u.sr
-                    elif rad.position == "optics box":
-                        self.debug("This is the optics box")
-                        rad.data *= np.pi * u.sr - omega_pix
-                    else:
-                        self.debug("This is the optical path")
-                        rad.data *= omega_pix
-                # Integrate the radiance over wavelength
-                max_signal_per_pix, signal = integrate_light(
-                    rad, rad.wl_grid, ch_built_instr
-                )
+            qe.spectral_rebin(self.wl)
+            max_signal, signal = self._element_signals(
+                radiances,
+                u.Quantity([rad.data for rad in radiances]),
+                ch_table,
+                ch_built_instr,
+                A,
+                qe,
+                omega_pix,
+            )
             # Store the signals
-            self.signal_table[f"{item} signal"] = signal
-            self.max_signal_per_pixel[item] = max_signal_per_pix
-            self.debug(f"Signal: {self.signal_table[f'{item} signal']}")
-            total_signal += self.signal_table[f"{item} signal"]
-            total_max_signal += self.max_signal_per_pixel[item]
+            for item, item_max, item_signal in zip(names, max_signal, signal):
+                self.signal_table[f"{item} signal"] = item_signal
+                self.max_signal_per_pixel[item] = item_max
+            self.debug("Signal: %s", self.signal_table)
+            total_signal += signal.sum(axis=0)
+            total_max_signal += max_signal.sum(axis=0)
         out = QTable()
         out["instrument_signal"] = total_signal
         out["instrument_MaxSignal_inPixel"] = total_max_signal
@@ -360,3 +429,208 @@ class OpticalPath(Logger):
         return hstack(
             [ch_table, out["instrument_signal", "instrument_MaxSignal_inPixel"]]
         )
+
+    def thermal_sweep(self, temperatures, ch_table, ch_built_instr):
+        """
+        Compute the telescope self-emission signal over a grid of temperatures of some optical elements.
+
+        The radiances of the elements at all the temperatures are computed at once,
+        propagated with the downstream transmissions of `chain`, and integrated together.
+        The signals of the other elements are those at their nominal temperature.
+
+        Parameters
+        ----------
+        temperatures : dict
+            Temperatures of the optical elements to vary, by element name.
+            Each is a scalar or a 1-D array, assumed in Kelvin if without units.
+        ch_table : QTable
+            Channel table.
+        ch_built_instr : dict
+            Built instrument parameters for the channel.
+
+        Returns
+        -------
+        sweep : OrderedDict
+            - "temperature": the 1-D temperature array of each element, by name.
+            - "surface_radiance": the radiance emitted by each element, of shape (temperatures, wavelengths).
+            - "signal": the signal of each element, of shape (temperatures, bins).
+            - "instrument_signal" and "instrument_MaxSignal_inPixel": the total instrument signals,
+              with an axis for each element, in the order of `temperatures`, and a last axis for the bins.
+
+        Raises
+        ------
+        KeyError
+            If an element is not in the optical path.
+        ValueError
+            If no temperatures are given.
+
+        Examples
+        --------
+        >>> sweep = spec.thermal_sweep({'M1': [50, 60, 70] * u.K}, table, built_instr)
+        >>> sweep['instrument_signal'].shape
+        (3, n_bins)
+        """
+        if getattr(self, "downstream", None) is None:
+            self.chain()
+        if not temperatures:
+            self.error("no optical element temperatures to sweep")
+            raise ValueError("no optical element temperatures to sweep")
+        opt_list = list(self.optical_element_dict)
+        for name in temperatures:
+            if name not in self.optical_element_dict:
+                self.error("optical element %s not found", name)
+                raise KeyError(name)
+        grid = OrderedDict(
+            (name, np.atleast_1d(u.Quantity(T, u.K)).ravel())
+            for name, T in temperatures.items()
+        )
+        self.debug("thermal sweep: %s", grid)
+        sizes = [T.size for T in grid.values()]
+        rows = np.repeat(np.arange(len(grid)), sizes)
+
+        # radiances of the swept elements at all the temperatures
+        elements = [self.optical_element_dict[name] for name in grid]
+        surface = spectral_radiance(
+            self.wl,
+            np.concatenate(list(grid.values()))[:, np.newaxis],
+            self._stack([el.emissivity for el in elements])[rows],
+        )
+        index = np.array([opt_list.index(name) for name in grid])
+        swept = surface * self.downstream[index][rows]
+        slit_after = self._slit_after()[index]
+        templates = []
+        for el, slit in zip(elements, slit_after):
+            radiance = InstRadiance(
+                wl_grid=self.wl, data=np.zeros(self.wl.size)
+            )
+            radiance.position = el.position
+            if slit:
+                radiance.slit = True
+            templates.append(radiance)
+
+        # the other elements emit at their nominal temperature
+        fixed = [name for name in self.radiance_dict if name not in grid]
+        radiances = [self.radiance_dict[name] for name in fixed]
+        radiances += [templates[i] for i in rows]
+        data = u.Quantity(
+            [self.radiance_dict[name].data for name in fixed] + list(swept)
+        )
+
+        (
+            total_max_signal,
+            total_signal,
+            _,
+            A,
+            qe,
+            omega_pix,
+            _,
+        ) = prepare(ch_table, ch_built_instr, self.description)
+        qe.spectral_rebin(self.wl)
+        max_signal, signal = self._element_signals(
+            radiances, data, ch_table, ch_built_instr, A, qe, omega_pix
+        )
+        total_signal = total_signal + signal[: len(fixed)].sum(axis=0)
+        total_max_signal = total_max_signal + max_signal[: len(fixed)].sum(
+            axis=0
+        )
+
+        out = OrderedDict(
+            [
+                ("temperature", grid),
+                ("surface_radiance", OrderedDict()),
+                ("signal", OrderedDict()),
+            ]
+        )
+        bounds = len(fixed) + np.cumsum([0] + sizes)
+        for k, name in enumerate(grid):
+            # each element varies along its own axis of the grid
+            shape = [1] * len(grid) + [-1]
+            shape[k] = sizes[k]
+            rows_k = slice(bounds[k], bounds[k + 1])
+            total_signal = total_signal + signal[rows_k].reshape(shape)
+            total_max_signal = total_max_signal + max_signal[rows_k].reshape(
+                shape
+            )
+            out["surface_radiance"][name] = surface[
+                bounds[k] - len(fixed) : bounds[k + 1] - len(fixed)
+            ]
+            out["signal"][name] = signal[rows_k]
+        out["instrument_signal"] = total_signal
+        out["instrument_MaxSignal_inPixel"] = total_max_signal
+        return out
+
+    def _element_signals(
+        self, radiances, data, ch_table, ch_built_instr, A, qe, omega_pix
+    ):
+        """
+        Signals of the radiances of the optical elements, each stacked in a row of data.
+        The quantum efficiency must be rebinned to the wavelength grid of the optical path.
+
+        Returns
+        -------
+        max_signal : Quantity
+            Maximum signal in a pixel, of shape (radiances, bins).
+        signal : Quantity
+            Signal, of shape (radiances, bins).
+        """
+        slit = np.array(
+            [
+                bool(rad.slit) and "slit_width" in ch_built_instr
+                for rad in radiances
+            ]
+        )
+        max_signal = [None] * len(radiances)
+        signal = [None] * len(radiances)
+        if slit.any():
+            # If there is a slit, convolve the signal with the slit function
+            slit_data = rebin(
+                ch_built_instr["wl_pix_center"], self.wl, data[slit]
+            )[1]
+            slit_data[np.isnan(slit_data)] = 0.0
+            slit_max, slit_signals = slit_signal(
+                self.description,
+                ch_built_instr,
+                A,
+                ch_table,
+                omega_pix,
+                qe,
+                slit_data,
+            )
+            for j, i in enumerate(np.flatnonzero(slit)):
+                max_signal[i], signal[i] = slit_max[j], slit_signals[j]
+        if not slit.all():
+            # Calculate the photon rate per unit area
+            photon_data = data[~slit] * (
+                A
+                * qe.data
+                * (qe.wl_grid / const.c / const.h).to(1.0 / u.W / u.s)
+                * u.count
+            )
+            photon_data *= u.Quantity(
+                [
+                    self._solid_angle(rad, omega_pix)
+                    for rad, s in zip(radiances, slit)
+                    if not s
+                ]
+            )[:, np.newaxis]
+            # Integrate the radiances over wavelength
+            path_max, path_signals = integrate_radiance(
+                photon_data, self.wl, ch_built_instr
+            )
+            for j, i in enumerate(np.flatnonzero(~slit)):
+                max_signal[i], signal[i] = path_max[j], path_signals[j]
+        return u.Quantity(max_signal), u.Quantity(signal)
+
+    def _solid_angle(self, radiance, omega_pix):
+        """solid angle of the radiance of an element seen by a detector pixel"""
+        if hasattr(radiance, "angle") and radiance.angle is not None:
+            self.debug("Angle found")
+            return radiance.angle
+        if radiance.position == "detector":
+            self.debug("This is the detector box")
+            return np.pi * u.sr
+        if radiance.position == "optics box":
+            self.debug("This is the optics box")
+            return np.pi * u.sr - omega_pix
+        self.debug("This is the optical path")
+        return omega_pix
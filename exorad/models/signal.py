@@ -5,6 +5,12 @@ import numpy as np
 from exorad.log.logger import Logger
 from exorad.utils.exolib import rebin
 
+# units parsed once: comparing against a unit string parses it at every call
+_units = {"um": u.um, "hr": u.hr, "": u.dimensionless_unscaled}
+_sed_unit = u.W / u.m**2 / u.um
+_radiance_unit = u.W / u.m**2 / u.um / u.sr
+_counts_unit = u.ct / u.s
+
 
 class Signal(Logger):
     """
@@ -96,21 +102,22 @@ class Signal(Logger):
             if it cannot convert the original units into the desired ones
 
         """
+        units = (
+            _units[units]
+            if isinstance(units, str) and units in _units
+            else u.Unit(units)
+        )
         if isinstance(quantity, u.Quantity):
-            if quantity.unit != units:
+            if quantity.unit is not units and quantity.unit != units:
                 try:
-                    data_converted = quantity.to(u.Unit(units))
-                    self.debug("input data: {}".format(quantity))
-                    self.debug(
-                        "converted {} to {}".format(quantity.unit, units)
-                    )
-                    self.debug("converted data: {}".format(data_converted))
+                    data_converted = quantity.to(units)
+                    self.debug("input data: %s", quantity)
+                    self.debug("converted %s to %s", quantity.unit, units)
+                    self.debug("converted data: %s", data_converted)
                     return data_converted
                 except u.UnitConversionError:
                     self.error(
-                        "Impossible to convert {} to {}".format(
-                            quantity.unit, units
-                        )
+                        "Impossible to convert %s to %s", quantity.unit, units
                     )
                     raise u.UnitConversionError
 
@@ -121,7 +128,7 @@ class Signal(Logger):
             #     self.debug('assumed dimensionless quantity as input'.format(units))
             # else:
             #     self.debug('assumed {} as input units'.format(units))
-            data_converted = np.array(quantity) * u.Unit(units)
+            data_converted = np.array(quantity) * units
             return data_converted
 
     def check_sizes(self):
@@ -210,7 +217,7 @@ class Sed(CustomSignal):
     """
 
     def __init__(self, wl_grid, data, time_grid=[0] * u.hr):
-        super().__init__(wl_grid, data, u.W / u.m**2 / u.um, time_grid)
+        super().__init__(wl_grid, data, _sed_unit, time_grid)
 
 
 class Radiance(CustomSignal):
@@ -219,9 +226,7 @@ class Radiance(CustomSignal):
     """
 
     def __init__(self, wl_grid, data, time_grid=[0] * u.hr):
-        super().__init__(
-            wl_grid, data, u.W / u.m**2 / u.um / u.sr, time_grid
-        )
+        super().__init__(wl_grid, data, _radiance_unit, time_grid)
 
 
 class CountsPerSeconds(CustomSignal):
@@ -230,4 +235,4 @@ class CountsPerSeconds(CustomSignal):
     """
 
     def __init__(self, wl_grid, data, time_grid=[0] * u.hr):
-        super().__init__(wl_grid, data, "ct/s", time_grid)
+        super().__init__(wl_grid, data, _counts_unit, time_grid)
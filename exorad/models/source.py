@@ -1,4 +1,6 @@
 import glob
+import hashlib
+import json
 import os
 import warnings
 
@@ -46,6 +48,8 @@ class Star(Logger):
         wl_min=0.2 * u.um,
         wl_max=50.0 * u.um,
         phoenix_model_filename=None,
+        wl_grid=None,
+        sed_cache=None,
     ):
         """
         Parameters
@@ -54,6 +58,10 @@ class Star(Logger):
                     exodata star object
           star_sed_path:    : 	string
                     path to Phoenix stellar spectra
+          wl_grid:    : 	Quantity
+                    wavelength grid the sed is rebinned to, if a sed cache is used
+          sed_cache:    : 	SedCache
+                    cache of the Phoenix seds rebinned to wl_grid
 
         """
         self.set_log_name()
@@ -73,7 +81,7 @@ class Star(Logger):
         else:
             if phoenix_model_filename:
                 ph_file = os.path.join(star_sed_path, phoenix_model_filename)
-                self.debug("phoenix file name : {}".format(ph_file))
+                self.debug("phoenix file name : %s", ph_file)
             else:
                 ph_file = self.__get_phonix_model_filename(
                     star_sed_path,
@@ -81,66 +89,51 @@ class Star(Logger):
                     starLogg,
                     starMetallicity,
                 )
-                self.debug("phoenix file name : {}".format(ph_file))
-
-            ph_wl, ph_sed, ph_L = self.__read_phenix_spectrum(
-                ph_file, starDistance.to(u.m), starRadius.to(u.m)
-            )
+                self.debug("phoenix file name : %s", ph_file)
+
+            if sed_cache is not None and wl_grid is not None:
+                ph_wl, ph_sed, ph_L = self.__get_cached_spectrum(
+                    ph_file,
+                    starDistance.to(u.m),
+                    starRadius.to(u.m),
+                    wl_grid,
+                    sed_cache,
+                )
+            else:
+                ph_wl, ph_sed, ph_L = self.__read_phenix_spectrum(
+                    ph_file, starDistance.to(u.m), starRadius.to(u.m)
+                )
             self.model = os.path.basename(ph_file)
 
         self.luminosity = ph_L
         self.sed = Sed(wl_grid=ph_wl, data=ph_sed)
         self.filename = ph_file
 
-    def __get_sed_list(self, path):
-        sed_name = []
-        # todo include more phoenix formats
-        format_list = [
-            "*.BT-Settl.spec.fits.gz"
-        ]  # , "*.7.bz2", "*.7.gz", "*HiRes.fits"]
-        for format in format_list:
-            sed_name = glob.glob(os.path.join(path, format))
-            if len(sed_name) != 0:
-                return sed_name
-
-        if len(sed_name) == 0:
-            self.error("No stellar SED files found")
-            raise OSError("No stellar SED files found")
-
     def __get_phonix_model_filename(
         self, path, star_temperature, star_logg, star_f_h
     ):
-        sed_name = self.__get_sed_list(path)
-        sed_name_cleaned = [os.path.basename(k) for k in sed_name]
-
-        sed_T_list = np.array(
-            [float(name.split("-")[0][3:]) for name in sed_name_cleaned]
-        )
-        sed_Logg_list = np.array(
-            [float(name.split("-")[1]) for name in sed_name_cleaned]
+        return load_phoenix_library(path).select(
+            star_temperature, star_logg, star_f_h
         )
-        sed_Z_list = np.array(
-            [float(name.split("-")[2][:3]) for name in sed_name_cleaned]
-        )
-
-        temp_to_find = star_temperature.value / 100
-        # if 'HiRes' not in sed_name_cleaned[0]:
-        #     temp_to_find /= 100.0
 
-        if np.round(temp_to_find) < min(sed_T_list) or np.round(
-            temp_to_find
-        ) > max(sed_T_list):
-            raise ValueError
-
-        idx = np.argmin(
-            np.abs(sed_T_list - np.round(temp_to_find))
-            + np.abs(sed_Logg_list - star_logg)
-            + np.abs(sed_Z_list - star_f_h)
-        )
-
-        ph_file = sed_name[idx]
-
-        return ph_file
+    def __get_cached_spectrum(
+        self, ph_file, star_distance, star_radius, wl_grid, sed_cache
+    ):
+        """As __read_phenix_spectrum, with the sed rebinned to wl_grid and cached"""
+        cached = sed_cache.get(ph_file, wl_grid)
+        if cached is None:
+            wl, sed, bolometric_flux = self.__read_phenix_model(ph_file)
+            model_sed = Sed(wl_grid=wl, data=sed)
+            model_sed.spectral_rebin(wl_grid)
+            cached = sed_cache.put(
+                ph_file, wl_grid, model_sed.data, bolometric_flux
+            )
+        sed, bolometric_flux = cached
+        bolometric_luminosity = (
+            4 * np.pi * star_radius**2 * bolometric_flux
+        )  # [W]
+        sed = sed * (star_radius / star_distance) ** 2  # [W/m^2/mu]
+        return wl_grid, sed, bolometric_luminosity.to(u.Lsun)
 
     def __read_phenix_spectrum(self, ph_file, star_distance, star_radius):
         """Read a PHENIX Stellar Spectrum.
@@ -160,6 +153,22 @@ class Star(Logger):
 
         """
 
+        wl, sed, bolometric_flux = self.__read_phenix_model(ph_file)
+        bolometric_luminosity = (
+            4 * np.pi * star_radius**2 * bolometric_flux
+        )  # [W]
+        sed *= (star_radius / star_distance) ** 2  # [W/m^2/mu]
+
+        # When trading two lines below for two above you'll be using the phoenix
+        # luminosity, but this invalidates current validation tables against exosim
+        # norm = bolometric_luminosity.to(u.W) / (4.0*np.pi*star_distance**2)
+        # sed = norm * sed / bolometric_flux
+
+        return wl, sed, bolometric_luminosity.to(u.Lsun)
+
+    def __read_phenix_model(self, ph_file):
+        """Read a PHENIX model file, returning wavelength, sed at the stellar surface and bolometric flux"""
+
         ####################### USING PHOENIX BIN_SPECTRA BINARY FILES (h5)
 
         if "spec.fits.gz" in ph_file:
@@ -223,17 +232,7 @@ class Star(Logger):
         sed = sed[idx]
         # Normalise SED to observed SED
         bolometric_flux = np.trapz(sed, x=wl)  # [W m**-2]
-        bolometric_luminosity = (
-            4 * np.pi * star_radius**2 * bolometric_flux
-        )  # [W]
-        sed *= (star_radius / star_distance) ** 2  # [W/m^2/mu]
-
-        # When trading two lines below for two above you'll be using the phoenix
-        # luminosity, but this invalidates current validation tables against exosim
-        # norm = bolometric_luminosity.to(u.W) / (4.0*np.pi*star_distance**2)
-        # sed = norm * sed / bolometric_flux
-
-        return wl, sed, bolometric_luminosity.to(u.Lsun)
+        return wl, sed, bolometric_flux
 
     def __get_star_spectrum(
         self, wl, star_distance, star_temperature, star_radius
@@ -247,6 +246,174 @@ class Star(Logger):
         return wl, sed, bolometric_luminosity.to(u.Lsun)
 
 
+class PhoenixLibrary(Logger):
+    """
+    Index of a directory of Phoenix stellar models.
+    The model files are listed and their parameters are parsed from the file names once,
+    so that the selection of the model for a star is a lookup on the parameter grid.
+
+    Parameters
+    ----------
+    path: str
+        path to Phoenix stellar spectra
+
+    Attributes
+    ----------
+    files: list
+        model files
+    temperature: array
+        model temperatures, in hundreds of K
+    logg: array
+        model surface gravities
+    metallicity: array
+        model metallicities
+    """
+
+    # todo include more phoenix formats
+    format_list = [
+        "*.BT-Settl.spec.fits.gz"
+    ]  # , "*.7.bz2", "*.7.gz", "*HiRes.fits"]
+
+    def __init__(self, path):
+        self.set_log_name()
+        self.path = path
+        self.files = self._get_sed_list(path)
+        names = [os.path.basename(k) for k in self.files]
+        self.temperature = np.array(
+            [float(name.split("-")[0][3:]) for name in names]
+        )
+        self.logg = np.array([float(name.split("-")[1]) for name in names])
+        self.metallicity = np.array(
+            [float(name.split("-")[2][:3]) for name in names]
+        )
+        self.debug("%s models found in %s", len(self.files), path)
+
+    def _get_sed_list(self, path):
+        for format in self.format_list:
+            sed_name = glob.glob(os.path.join(path, format))
+            if len(sed_name) != 0:
+                return sed_name
+
+        self.error("No stellar SED files found")
+        raise OSError("No stellar SED files found")
+
+    def select(self, star_temperature, star_logg, star_f_h):
+        """
+        returns the model file closest to the stellar parameters
+
+        Raises
+        ------
+        ValueError
+            if the temperature is outside the library range
+        """
+        temp_to_find = star_temperature.to(u.K).value / 100
+        # if 'HiRes' not in sed_name_cleaned[0]:
+        #     temp_to_find /= 100.0
+
+        if (
+            np.round(temp_to_find) < self.temperature.min()
+            or np.round(temp_to_find) > self.temperature.max()
+        ):
+            raise ValueError
+
+        idx = np.argmin(
+            np.abs(self.temperature - np.round(temp_to_find))
+            + np.abs(self.logg - star_logg)
+            + np.abs(self.metallicity - star_f_h)
+        )
+        return self.files[idx]
+
+
+# libraries already indexed, by directory. They are indexed again if the directory is modified
+_phoenix_libraries = {}
+
+
+def load_phoenix_library(path):
+    """returns the :class:`PhoenixLibrary` of the directory, indexed once per process"""
+    key = os.path.realpath(path)
+    mtime = os.stat(path).st_mtime_ns
+    if key not in _phoenix_libraries or _phoenix_libraries[key][0] != mtime:
+        _phoenix_libraries[key] = (mtime, PhoenixLibrary(path))
+    return _phoenix_libraries[key][1]
+
+
+class SedCache(Logger):
+    """
+    On-disk cache of the Phoenix model seds rebinned to a wavelength grid.
+    Each entry is a `.npy` file, memory mapped read-only when loaded, and a `.json` file with the
+    bolometric flux of the model. The entries are keyed by model file, its size and modification time,
+    and wavelength grid, so the cache directory can be shared by all the processes of a run and between runs.
+
+    Parameters
+    ----------
+    path: str
+        cache directory. It is created if missing
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.set_log_name()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, filename, wl_grid):
+        """returns the cache key of a model file rebinned to wl_grid"""
+        stat = os.stat(filename)
+        key = hashlib.sha1()
+        key.update(
+            "{}:{}:{}:{}".format(
+                self.version,
+                os.path.realpath(filename),
+                stat.st_size,
+                stat.st_mtime_ns,
+            ).encode()
+        )
+        key.update(np.ascontiguousarray(wl_grid.to_value(u.um)).tobytes())
+        return key.hexdigest()
+
+    def get(self, filename, wl_grid):
+        """
+        returns the sed [W m**-2 micron**-1] and the bolometric flux [W m**-2] of the model rebinned to wl_grid,
+        or None if not in cache
+        """
+        base = os.path.join(self.path, self.key(filename, wl_grid))
+        try:
+            with open(base + ".json") as fd:
+                meta = json.load(fd)
+            sed = np.load(base + ".npy", mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        self.debug("cached sed found for %s", filename)
+        return (
+            u.Quantity(sed, u.W / u.m**2 / u.um, copy=False),
+            meta["bolometric_flux"] * u.W / u.m**2,
+        )
+
+    def put(self, filename, wl_grid, sed, bolometric_flux):
+        """stores the sed of a model rebinned to wl_grid and returns it as :func:`get`"""
+        base = os.path.join(self.path, self.key(filename, wl_grid))
+        sed = sed.to(u.W / u.m**2 / u.um)
+        bolometric_flux = bolometric_flux.to(u.W / u.m**2)
+        # files are written under a temporary name and moved, so that concurrent processes
+        # never read an incomplete entry
+        tmp = "{}.{}.tmp".format(base, os.getpid())
+        with open(tmp, "wb") as fd:
+            np.save(fd, sed.value)
+        os.replace(tmp, base + ".npy")
+        with open(tmp, "w") as fd:
+            json.dump(
+                {
+                    "filename": os.path.realpath(filename),
+                    "bolometric_flux": bolometric_flux.value,
+                },
+                fd,
+            )
+        os.replace(tmp, base + ".json")
+        self.debug("sed of %s cached", filename)
+        return sed, bolometric_flux
+
+
 class CustomSed(Logger):
     def __init__(self, fname, star_radius, star_distance):
         self.set_log_name()
@@ -261,7 +428,7 @@ class CustomSed(Logger):
         ph_sed *= (
             star_radius.to(u.m) / star_distance.to(u.m)
         ) ** 2  # [W/m^2/mu]
-        self.debug("custom sed used : {}".format(fname))
+        self.debug("custom sed used : %s", fname)
 
         self.sed = Sed(ph_wl, ph_sed)
         self.filename = fname
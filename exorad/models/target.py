@@ -38,14 +38,14 @@ class Target(Logger):
             self.star.model = obj.model
             self.debug("target updated")
         else:
-            self.warning("Object type {:s} not implemented".format(type(obj)))
+            self.warning("Object type %s not implemented", type(obj))
 
     def write(self, output):
         targets_out = output.create_group("targets")
         group_name = str(self.name)
         target_dict = self.to_dict()
         targets_out.store_dictionary(target_dict, group_name=group_name)
-        self.info("target {} saved".format(self.name))
+        self.info("target %s saved", self.name)
         return output
 
     def to_dict(self):
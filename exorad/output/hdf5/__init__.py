@@ -1,3 +1,6 @@
 from .hdf5 import HDF5Output
 from .hdf5 import HDF5OutputGroup
 from .hdf5 import load
+from .writer import completed_targets
+from .writer import same_payload
+from .writer import HDF5TargetWriter
@@ -93,6 +93,80 @@ def load_table(input_table, k):
     return table
 
 
+def load_table_columns(input_table, k):
+    """
+    Reads the columns of a table written by :func:`~exorad.output.hdf5.hdf5.HDF5OutputGroup.write_table`,
+    with their units but without the table metadata.
+    It is much faster than :func:`load_table`, as the YAML header is not parsed.
+
+    Parameters
+    ----------
+    input_table: h5py.Group
+        group containing the table
+    k: str
+        table name
+
+    Returns
+    -------
+    QTable
+        table columns
+    """
+    data = input_table[k][()]
+    columns = input_table["{}_to_group".format(k)]
+    table = QTable()
+    for name in data.dtype.names:
+        col = data[name]
+        if col.dtype.kind == "S":
+            col = col.astype(str)
+        if "unit" in columns[name]:
+            col = col * u.Unit(columns[name]["unit"][()].decode())
+        table[name] = col
+    return table
+
+
+def update_table_columns(input_table, k, table):
+    """
+    Overwrites the values of a table written by :func:`~exorad.output.hdf5.hdf5.HDF5OutputGroup.write_table`,
+    keeping its metadata. The table is updated only if it has the same columns, in the same order
+    and with the same units, of the new one.
+
+    Parameters
+    ----------
+    input_table: h5py.Group
+        group containing the table
+    k: str
+        table name
+    table: QTable
+        new table
+
+    Returns
+    -------
+    bool
+        True if the table was updated
+    """
+    data = input_table[k][()]
+    columns = input_table["{}_to_group".format(k)]
+    if list(data.dtype.names) != table.colnames or len(data) != len(table):
+        return False
+    for name in table.colnames:
+        unit = getattr(table[name], "unit", None)
+        stored = (
+            columns[name]["unit"][()].decode()
+            if "unit" in columns[name]
+            else None
+        )
+        if (None if unit is None else str(unit)) != stored:
+            return False
+    for name in table.colnames:
+        value = getattr(table[name], "value", table[name])
+        if data.dtype[name].kind in "SU":
+            value = np.char.encode(np.asarray(value, dtype=str))
+        data[name] = value
+        columns[name]["value"][...] = value
+    input_table[k][...] = data
+    return True
+
+
 def recursively_save_dict_contents_to_output(output, dic):
     """
     Will recursive write a dictionary into output.
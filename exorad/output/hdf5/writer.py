@@ -0,0 +1,214 @@
+import logging
+import queue
+import threading
+
+import h5py
+import numpy as np
+
+from exorad.log import Logger
+from exorad.output.hdf5.hdf5 import HDF5Output
+from exorad.output.hdf5.hdf5 import HDF5OutputGroup
+
+logger = logging.getLogger("exorad.writer")
+
+_STOP = object()
+# attribute marking the target groups completely written to file
+COMPLETED_KEY = "completed"
+# attribute stamping the files written by HDF5TargetWriter, that marks the completed targets
+WRITER_KEY = "exorad_writer"
+
+
+class HDF5TargetWriter(Logger):
+    """
+    Writes the observed targets into an HDF5 output file as soon as they are produced.
+    The file is opened only once and the targets are written by a dedicated thread,
+    so that the observation does not wait for the disk and
+    the targets do not need to be kept in memory until the end of the run.
+    The file is flushed after every target, so that what is on disk always
+    reflects the completed targets, which are marked with the `completed` attribute.
+    The file itself is stamped with the `exorad_writer` attribute when opened.
+
+    Parameters
+    ----------
+    filename: str
+        output file name
+    append: bool
+        if True the file is opened in append mode. Default is True
+    max_queue: int
+        maximum number of targets waiting to be written. Default is 16
+
+    Attributes
+    ----------
+    written: list
+        names of the targets written to the file
+
+    Examples
+    --------
+    >>> with HDF5TargetWriter('output.h5') as writer:
+    >>>     writer.put(target)
+    """
+
+    def __init__(self, filename, append=True, max_queue=16):
+        self.set_log_name()
+        self.filename = filename
+        self._append = append
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._output = None
+        self._error = None
+        self.written = []
+
+    def open(self):
+        self._output = HDF5Output(self.filename, append=self._append)
+        self._output.open()
+        self._output.fd.attrs[WRITER_KEY] = 1
+        self._output.fd.flush()
+        self._thread = threading.Thread(
+            target=self._run, name="HDF5TargetWriter", daemon=True
+        )
+        self._thread.start()
+        self.debug("writer started on %s", self.filename)
+
+    def put(self, target):
+        """
+        queues a target to be written
+
+        Raises
+        ------
+        RuntimeError
+            if a previous target could not be written
+        """
+        if self._error is not None:
+            raise RuntimeError(
+                "target writer stopped: {}".format(self._error)
+            ) from self._error
+        self._queue.put(target)
+
+    def close(self):
+        """waits for all the queued targets to be written and closes the file"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+        if self._output is not None:
+            self._output.close()
+            self._output = None
+        self.debug("%s targets written", len(self.written))
+        if self._error is not None:
+            raise RuntimeError(
+                "target writer stopped: {}".format(self._error)
+            ) from self._error
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, type, value, tb):
+        self.close()
+
+    def _run(self):
+        while True:
+            target = self._queue.get()
+            if target is _STOP:
+                break
+            if self._error is not None:
+                # keep consuming the queue so that put never blocks
+                continue
+            try:
+                target.write(self._output)
+                self._output.fd["targets"][str(target.name)].attrs[
+                    COMPLETED_KEY
+                ] = True
+                self._output.fd.flush()
+                self.written.append(target.name)
+            except Exception as e:
+                self.error("target %s not written", target.name)
+                self._error = e
+
+
+def completed_targets(filename, clean=True):
+    """
+    Returns the names of the targets completely written in an output file.
+
+    Parameters
+    ----------
+    filename: str
+        output file name
+    clean: bool
+        if True the target groups not marked as completed,
+        as those left by an interrupted run, are removed from the file. Default is True
+
+    Returns
+    -------
+    set:
+        names of the completed targets
+
+    Notes
+    -----
+    The files written before the targets were marked as completed are not stamped
+    by :class:`HDF5TargetWriter` and have no marks:
+    all their targets are considered completed and none is removed.
+    """
+    with h5py.File(filename, "a" if clean else "r") as fd:
+        if "targets" not in fd:
+            return set()
+        targets = fd["targets"]
+        if not fd.attrs.get(WRITER_KEY, False):
+            logger.info(
+                "%s not written by the target writer: all targets are kept",
+                filename,
+            )
+            return set(targets)
+        completed = {
+            name
+            for name in targets
+            if targets[name].attrs.get(COMPLETED_KEY, False)
+        }
+        if clean:
+            for name in set(targets) - completed:
+                logger.info(
+                    "removing incomplete target %s from %s", name, filename
+                )
+                del targets[name]
+    return completed
+
+
+def same_payload(filename, payload):
+    """
+    Checks that the payload description stored in an output file is the given one.
+
+    Parameters
+    ----------
+    filename: str
+        output file name
+    payload: dict
+        payload description
+
+    Returns
+    -------
+    bool:
+        True if the file stores the same payload description, or no payload
+    """
+    with h5py.File(filename, "r") as fd:
+        if "payload" not in fd:
+            return True
+        stored = fd["payload"]["payload description"]
+        # the description is written as it would be in the file, then compared
+        with h5py.File(
+            "payload", "w", driver="core", backing_store=False
+        ) as memory:
+            HDF5OutputGroup(memory).store_dictionary(
+                payload, group_name="payload description"
+            )
+            return _same_group(stored, memory["payload description"])
+
+
+def _same_group(a, b):
+    """compares the content of two HDF5 groups or datasets"""
+    if isinstance(a, h5py.Group) != isinstance(b, h5py.Group):
+        return False
+    if isinstance(a, h5py.Group):
+        return set(a) == set(b) and all(_same_group(a[k], b[k]) for k in a)
+    if a.shape != b.shape or a.dtype != b.dtype:
+        return False
+    return bool(np.array_equal(a[()], b[()]))
@@ -7,15 +7,18 @@ from .instrumentHandler import GetChannelList
 from .instrumentHandler import LoadPayload
 from .instrumentHandler import MergeChannelsOutput
 from .instrumentHandler import PreparePayload
+from .instrumentHandler import RebuildChannels
 from .loadOptions import LoadOptions
 from .loadSource import LoadSource
 from .noiseHandler import EstimateNoise
 from .noiseHandler import EstimateNoiseInChannel
+from .noiseHandler import EstimateTargetsNoise
 from .propagateLight import PropagateForegroundLight
 from .propagateLight import PropagateTargetLight
 from .targetHandler import EstimateMaxSignal
 from .targetHandler import LoadTargetList
 from .targetHandler import ObserveTarget
+from .targetHandler import ObserveTargetBatch
 from .targetHandler import ObserveTargetlist
 from .targetHandler import PrepareTarget
 from .targetHandler import UpdateTargetTable
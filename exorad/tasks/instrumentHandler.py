@@ -1,11 +1,16 @@
+import os
 from collections import OrderedDict
 
 from astropy.io.misc.hdf5 import read_table_hdf5
 
 from .task import Task
+from exorad.models.instruments import PayloadCache
+from exorad.models.instruments.cache import channel_descriptions
+from exorad.models.instruments.cache import fingerprints
 from exorad.models.instruments import Photometer
 from exorad.models.instruments import Spectrometer
 from exorad.output.hdf5 import load
+from exorad.utils.passVal import PassVal
 
 instruments = {"photometer": Photometer, "spectrometer": Spectrometer}
 
@@ -72,6 +77,30 @@ class BuildInstrument(Task):
         self.set_output(instrument)
 
 
+_builder_state = {}
+
+
+def _init_builder(payload):
+    """stores the payload as process-global state of the processes building the channels"""
+    if "working_R" in payload.get("common", {}):
+        PassVal.working_R = payload["common"]["working_R"]["value"]
+    _builder_state["payload"] = payload
+
+
+def _build_channel(name):
+    """builds a channel of the payload stored by _init_builder"""
+    payload = _builder_state["payload"]
+    description = payload["channel"][name]
+    return BuildInstrument()(
+        type=description["channelClass"]["value"].lower(),
+        name=name,
+        description=description,
+        payload=payload,
+        write=False,
+        output=None,
+    )
+
+
 class BuildChannels(Task):
     """
     Initialize and build all the channels in the payload
@@ -84,42 +113,45 @@ class BuildChannels(Task):
         set to True to write the built dict to file. Default is None
     output: str
         output object
+    n_thread: int
+        number of processes building the channels concurrently. Default is 1
     Returns
     -------
     dict:
-        return a dict of built Instrument classes
+        return a dict of built Instrument classes, in the order of the payload description
 
     Examples
     --------
     >>> buildChannels = BuildChannels()
     >>> channels = buildChannels(payload=payload, write=False, output=None)
+
+    The channels are independent, so they can be built by a pool of processes
+    in the time of the slowest one
+
+    >>> channels = buildChannels(payload=payload, write=False, output=None, n_thread=4)
     """
 
     def __init__(self):
         self.addTaskParam("payload", "main payload")
         self.addTaskParam("write", "write processed instrument to output file")
         self.addTaskParam("output", "output object")
+        self.addTaskParam("n_thread", "number of processes", 1)
 
     def execute(self):
         self.info("building channel")
         channels = {}
         self.debug(
-            "detectors found : {}".format(
-                self.get_task_param("payload")["channel"].keys()
-            )
+            "detectors found : %s",
+            self.get_task_param("payload")["channel"].keys(),
         )
 
-        ch = None
-        if self.get_task_param("write"):
-            inst = self.get_task_param("output").create_group("payload")
-            inst.store_dictionary(
-                self.get_task_param("payload"),
-                group_name="payload description",
-            )
-            ch = inst.create_group("channels")
-
         buildInstrument = BuildInstrument()
-        if isinstance(self.get_task_param("payload")["channel"], OrderedDict):
+        many = isinstance(
+            self.get_task_param("payload")["channel"], OrderedDict
+        )
+        if many and self.get_task_param("n_thread") > 1:
+            channels = self._build_in_pool(self.get_task_param("n_thread"))
+        elif many:
             for det in self.get_task_param("payload")["channel"].keys():
                 channel_type = self.get_task_param("payload")["channel"][det][
                     "channelClass"
@@ -132,8 +164,6 @@ class BuildChannels(Task):
                     write=False,
                     output=None,
                 )
-                if self.get_task_param("write"):
-                    channels[det].write(ch)
         else:
             channel_type = self.get_task_param("payload")["channel"][
                 "channelClass"
@@ -147,9 +177,102 @@ class BuildChannels(Task):
                 write=False,
                 output=None,
             )
-            if self.get_task_param("write"):
-                channels[det].write(ch)
-        self.debug("channels : {}".format(channels))
+        if self.get_task_param("write"):
+            write_payload(
+                self.get_task_param("output"),
+                self.get_task_param("payload"),
+                channels,
+            )
+        self.debug("channels : %s", channels)
+        self.set_output(channels)
+
+    def _build_in_pool(self, n_thread):
+        from concurrent.futures import ProcessPoolExecutor
+
+        payload = self.get_task_param("payload")
+        n_thread = min(n_thread, len(payload["channel"]))
+        self.debug("building channels with %s processes", n_thread)
+        # the payload is sent once to each process by the initializer
+        with ProcessPoolExecutor(
+            max_workers=n_thread,
+            initializer=_init_builder,
+            initargs=(payload,),
+        ) as executor:
+            built = list(executor.map(_build_channel, payload["channel"]))
+        channels = {}
+        for channel in built:
+            # the channels refer to the payload of this process, as if built here.
+            # Their descriptions, completed while building, replace the original ones
+            payload["channel"][channel.name] = channel.description
+            channel.payload = payload
+            channels[channel.name] = channel
+        return channels
+
+
+class RebuildChannels(Task):
+    """
+    Builds the channels of a payload from the channels built for a similar payload,
+    running again for each channel only the build steps affected by the differences
+
+    Parameters
+    ----------
+    payload: dict
+        main payload
+    channels: dict
+        channels built for the previous payload. They are rebuilt in place
+    plan: dict
+        first build step to run for each channel of the payload, or None if the channel is unchanged,
+        as returned by :func:`~exorad.models.instruments.cache.rebuild_plan`
+
+    Returns
+    -------
+    dict:
+        return a dict of built Instrument classes, in the order of the payload description
+
+    Examples
+    --------
+    >>> rebuildChannels = RebuildChannels()
+    >>> channels = rebuildChannels(payload=payload, channels=previous_channels,
+    >>>                            plan={'Phot': None, 'Spec': 'optical_path'})
+    """
+
+    def __init__(self):
+        self.addTaskParam("payload", "main payload")
+        self.addTaskParam("channels", "channels built for a previous payload")
+        self.addTaskParam("plan", "first build step of each channel")
+
+    def execute(self):
+        self.info("rebuilding channels")
+        payload = self.get_task_param("payload")
+        previous = self.get_task_param("channels")
+        plan = self.get_task_param("plan")
+        buildInstrument = BuildInstrument()
+        channels = {}
+        for name, description in channel_descriptions(payload).items():
+            step = plan[name]
+            if step == "builder" or name not in previous:
+                channels[name] = buildInstrument(
+                    type=description["channelClass"]["value"].lower(),
+                    name=name,
+                    description=description,
+                    payload=payload,
+                    write=False,
+                    output=None,
+                )
+                continue
+            channel = previous[name]
+            # the entries added to the description by the builder are kept
+            for key, item in channel.description.items():
+                if key not in description and key != "optics":
+                    description[key] = item
+            if step is None:
+                self.debug("%s unchanged", name)
+                channel.payload = payload
+                channel.description = description
+            else:
+                channel.rebuild(step, payload=payload, description=description)
+            channels[name] = channel
+        self.debug("channels : %s", channels)
         self.set_output(channels)
 
 
@@ -198,7 +321,7 @@ class LoadPayload(Task):
             table = read_table_hdf5(ch_dir, path=ch)
             built_instr = load(ch_dir["built_instr"])
             channels[ch].load(table, built_instr)
-        self.debug("channels loaded: {}".format(channels))
+        self.debug("channels loaded: %s", channels)
         self.set_output([payload, channels])
 
 
@@ -214,6 +337,8 @@ class PreparePayload(Task):
         xml file with payload description
     output: str
         h5 output file
+    n_thread: int
+        number of processes building the channels. Default is 1
 
     Returns
     -------
@@ -235,9 +360,9 @@ class PreparePayload(Task):
     def __init__(self):
         self.addTaskParam("payload_file", "payload xml file")
         self.addTaskParam("output", "output file")
+        self.addTaskParam("n_thread", "number of processes", 1)
 
     def execute(self):
-        import os
         from exorad.tasks import LoadOptions
         from exorad.output.hdf5 import HDF5Output
 
@@ -258,19 +383,25 @@ class PreparePayload(Task):
                 payload = loadOptions(filename=payload_file)
             if isinstance(payload_file, dict):
                 payload = payload_file
+            cache = self._payload_cache(payload) if ext == ".xml" else None
+            if cache is not None:
+                payload, channels = self._cached_build(
+                    cache, payload_file, payload
+                )
+            else:
+                channels = buildChannels(
+                    payload=payload,
+                    write=False,
+                    output=None,
+                    n_thread=self.get_task_param("n_thread"),
+                )
             if output is not None:
                 if os.path.isfile(output):
                     append = True
                 else:
                     append = False
                 with HDF5Output(output, append=append) as out:
-                    channels = buildChannels(
-                        payload=payload, write=True, output=out
-                    )
-            else:
-                channels = buildChannels(
-                    payload=payload, write=False, output=None
-                )
+                    write_payload(out, payload, channels)
 
         elif ext in [".h5", ".hdf5"]:
             import h5py
@@ -287,6 +418,64 @@ class PreparePayload(Task):
         )
         self.set_output([payload, channels, (wl_min, wl_max)])
 
+    def _cached_build(self, cache, payload_file, payload):
+        """
+        returns the payload and its channels from the cache.
+        If not in cache, the channels are rebuilt from the closest cached payload, or built from scratch
+        """
+        key = cache.key(payload_file, payload)
+        cached = cache.get(key)
+        if cached is not None:
+            self.info("channels loaded from cache %s", cache.path)
+            return cached
+
+        # the fingerprints of the payload as parsed, before the builders complete it
+        sections = fingerprints(payload)
+        base, plan = cache.closest(sections)
+        previous = None if base is None else cache.get(base)
+        if previous is not None:
+            self.info("channels rebuilt from cache %s", cache.path)
+            channels = RebuildChannels()(
+                payload=payload, channels=previous[1], plan=plan
+            )
+        else:
+            channels = BuildChannels()(
+                payload=payload,
+                write=False,
+                output=None,
+                n_thread=self.get_task_param("n_thread"),
+            )
+        cache.put(key, payload, channels, sections)
+        return payload, channels
+
+    def _payload_cache(self, payload):
+        """the channels build can be cached on disk"""
+        if "PayloadCache" in payload["common"]:
+            path = payload["common"]["PayloadCache"]["value"]
+        else:
+            path = os.environ.get("EXORAD_PAYLOAD_CACHE", None)
+        return PayloadCache(path) if path else None
+
+
+def write_payload(output, payload, channels):
+    """
+    writes the payload description and the built channels in the payload group of an output
+
+    Parameters
+    ----------
+    output: HDF5Output
+        open output
+    payload: dict
+        payload description
+    channels: dict
+        built channels
+    """
+    inst = output.create_group("payload")
+    inst.store_dictionary(payload, group_name="payload description")
+    ch = inst.create_group("channels")
+    for channel in channels.values():
+        channel.write(ch)
+
 
 class MergeChannelsOutput(Task):
     """
@@ -350,9 +539,7 @@ class GetChannelList(Task):
         self._channel_type = self.get_task_param("channel_type")
         self.channel_lst = self.__get_channel_list__()
         self.info(
-            "{} type channel found: {}".format(
-                self._channel_type, self.channel_lst
-            )
+            "%s type channel found: %s", self._channel_type, self.channel_lst
         )
         self.set_output(self.channel_lst)
 
@@ -364,7 +551,5 @@ class GetChannelList(Task):
                 == self._channel_type.lower()
             ):
                 channel_lst.append(channel)
-                self.debug(
-                    "{} added as {}".format(channel, self._channel_type)
-                )
+                self.debug("%s added as %s", channel, self._channel_type)
         return channel_lst
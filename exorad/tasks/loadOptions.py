@@ -61,7 +61,7 @@ class LoadOptions(Task):
 
     def __get_root__(self):
         try:
-            self.debug("input option file found %s" % self._filename)
+            self.debug("input option file found %s", self._filename)
             return ET.parse(self._filename).getroot()
         except OSError:
             self.error("No input option file found")
@@ -171,9 +171,7 @@ class LoadOptions(Task):
                 data = self.__read_datadict__(datafile)
                 root_dict = data
                 root_dict["config_dict"] = datafile
-                self.debug(
-                    "Configuration dictionary found in {}".format(datafile)
-                )
+                self.debug("Configuration dictionary found in %s", datafile)
             except OSError:
                 self.error("Cannot read input file")
                 raise OSError
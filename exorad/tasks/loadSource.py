@@ -4,6 +4,7 @@ import numpy as np
 from astropy import units as u
 
 from exorad.models.source import CustomSed
+from exorad.models.source import SedCache
 from exorad.models.source import Star
 from exorad.tasks.task import Task
 from exorad.utils.passVal import PassVal
@@ -80,9 +81,7 @@ class LoadSource(Task):
             star = CustomSed(
                 source["CustomSed"]["value"], target.star.R, target.star.D
             )
-            self.debug(
-                "custom sed used {}".format(source["CustomSed"]["value"])
-            )
+            self.debug("custom sed used %s", source["CustomSed"]["value"])
 
         else:
             # check if star information are complete
@@ -91,7 +90,7 @@ class LoadSource(Task):
                     self.error("target information incomplete")
                     raise AttributeError("target information incomplete")
 
-            self.debug("source spectrum : {}".format(source["value"].lower()))
+            self.debug("source spectrum : %s", source["value"].lower())
             if source["value"].lower() == "planck":
                 self.debug("Plack sed selected")
                 star = Star(
@@ -122,6 +121,15 @@ class LoadSource(Task):
                         "Phoenix path does not exist: {}".format(star_sed_path)
                     )
 
+                # seds rebinned to the working grid can be cached on disk
+                if "SedCache" in source:
+                    sed_cache_path = source["SedCache"]["value"]
+                else:
+                    sed_cache_path = os.environ.get("EXORAD_SED_CACHE", None)
+                sed_cache = (
+                    SedCache(sed_cache_path) if sed_cache_path else None
+                )
+
                 try:
                     star = Star(
                         star_sed_path=star_sed_path,
@@ -135,8 +143,10 @@ class LoadSource(Task):
                         use_planck_spectrum=False,
                         wl_min=wl_min,
                         wl_max=wl_max,
+                        wl_grid=wl_grid,
+                        sed_cache=sed_cache,
                     )
-                    self.debug("stellar sed used {}".format(star.filename))
+                    self.debug("stellar sed used %s", star.filename)
                 except ValueError:
                     self.warning(
                         "stellar temperature out sed boundaries: Planck star used instead"
@@ -172,7 +182,11 @@ class LoadSource(Task):
                     "invalid source spectrum description. Planck spectrum is used"
                 )
 
-        star.sed.spectral_rebin(wl_grid)
+        # cached seds are already on the working grid
+        if star.sed.wl_grid.size != wl_grid.size or np.any(
+            star.sed.wl_grid != wl_grid
+        ):
+            star.sed.spectral_rebin(wl_grid)
 
         target.update_target(star)
         if hasattr(target, "table"):
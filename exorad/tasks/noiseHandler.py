@@ -26,8 +26,6 @@ class EstimateNoiseInChannel(Task):
 
     def execute(self):
         from exorad.models import noise
-        import numpy as np
-        import astropy.units as u
         from astropy.table import QTable
 
         channel = self.get_task_param("channel")
@@ -35,75 +33,12 @@ class EstimateNoiseInChannel(Task):
         payload = self.get_task_param("payload")
 
         name = channel["value"]
-        self.info("estimating noise in {}".format(name))
-
-        out = QTable()
-        out = noise.frame_time(target, channel, out)
-        read_gain, shot_gain = noise.multiaccum(channel, out["frameTime"][0])
-        self.debug(
-            "read gain : {} , shot gain : {}".format(read_gain, shot_gain)
-        )
-
-        out = noise.photon_noise(target.table, channel, shot_gain, out)
-
-        out["darkcurrent_noise"] = (
-            np.sqrt(
-                shot_gain
-                * target.table["WindowSize"][target.table["chName"] == name]
-                * channel["detector"]["dark_current"]["value"]
-                * u.ct
-                / u.hr
-            ).to(u.ct / u.s)
-            * u.hr**0.5
-        )
-        self.debug("dark current noise : {}".format(out["darkcurrent_noise"]))
-        out["read_noise"] = (
-            np.sqrt(
-                read_gain
-                * channel["detector"]["read_noise"]["value"] ** 2
-                * target.table["WindowSize"][target.table["chName"] == name]
-                / out["frameTime"]
-                * 1
-                / u.hr
-            ).to(u.ct / u.s)
-            * u.hr**0.5
-        )
-        self.debug("read noise : {}".format(out["read_noise"]))
-
-        if "NoiseX" in channel:
-            NoiseX = channel["NoiseX"]["value"]
-        else:
-            NoiseX = 0.0
-        self.debug("NoiseX: {}".format(NoiseX))
-
-        photon_noise_variance = noise.photon_noise_variance(target.table, out)
-        signal = target.table["star_signal_inAperture"][
-            target.table["chName"] == name
-        ].copy()
-        signal[signal == 0.0] = np.nan
-        out["total_noise"] = (
-            np.sqrt(
-                out["darkcurrent_noise"] ** 2
-                + (1.0 + NoiseX) * (photon_noise_variance)
-                + out["read_noise"] ** 2
-            )
-            / signal
-        )
-
-        wl = target.table["Wavelength"][target.table["chName"] == name]
-        if payload:
-            try:
-                out = noise.add_custom_noise(
-                    payload["common"]["customNoise"], wl, out
-                )
-            except KeyError:
-                self.debug("no custom noise found in common section")
-        try:
-            out = noise.add_custom_noise(channel["customNoise"], wl, out)
-        except KeyError:
-            self.debug("no custom noise found in channel section")
+        self.info("estimating noise in %s", name)
 
-        self.debug("total noise : {}".format(out["total_noise"]))
+        rows = target.table["chName"] == name
+        table = {key: target.table[key][rows] for key in target.table.keys()}
+        out = QTable(noise.channel_noise(table, channel, payload))
+        self.debug("total noise : %s", out["total_noise"])
 
         self.set_output(out)
 
@@ -145,7 +80,7 @@ class EstimateNoise(Task):
 
         table_list = []
         for ch in self.get_task_param("channels"):
-            self.debug("computing noise in {}".format(ch))
+            self.debug("computing noise in %s", ch)
             table_list.append(
                 estimateNoiseInChannel(
                     target=target,
@@ -156,3 +91,90 @@ class EstimateNoise(Task):
         table = vstack_tables(table_list)
         new_target = updateTargetTable(target=target, table=table)
         self.set_output(new_target)
+
+
+class EstimateTargetsNoise(Task):
+    """
+    Estimates again the noise of observed targets from the signals in their tables,
+    for the detector and noise parameters of a payload description.
+    The light is not propagated again: the signal columns of the tables are stacked
+    and the noise of all the targets is computed at once for each channel.
+    The targets with the same signal columns are stacked together.
+
+    Parameters
+    ----------
+    tables: list
+        target tables, as produced by :class:`~exorad.tasks.noiseHandler.EstimateNoise`
+    payload : dict
+        payload description
+
+    Returns
+    -------
+    list:
+        target tables with the noise columns replaced
+
+    Raises
+    -------
+    KeyError:
+        if a channel of the tables is not in the payload description
+    """
+
+    def __init__(self):
+        self.addTaskParam("tables", "target tables")
+        self.addTaskParam("payload", "payload description")
+
+    def execute(self):
+        import numpy as np
+        from collections import OrderedDict
+        from exorad.models.instruments.cache import channel_descriptions
+        from exorad.models.noise import channel_noise
+        from exorad.tasks.targetHandler import _merge_channel_columns
+
+        tables = self.get_task_param("tables")
+        payload = self.get_task_param("payload")
+        descriptions = channel_descriptions(payload)
+        self.info("estimating noise of %s targets", len(tables))
+
+        groups = OrderedDict()
+        for table in tables:
+            # the noise columns are estimated again
+            table.remove_columns(
+                [key for key in table.keys() if _is_noise_column(key)]
+            )
+            signals = tuple(key for key in table.keys() if "signal" in key)
+            groups.setdefault(signals, []).append(table)
+
+        for signals, group in groups.items():
+            reference = group[0]
+            names = list(OrderedDict.fromkeys(reference["chName"]))
+            missing = [name for name in names if name not in descriptions]
+            if missing:
+                self.error("channels %s not in the payload", missing)
+                raise KeyError(missing)
+            columns = OrderedDict(
+                (key, np.stack([table[key] for table in group]))
+                for key in signals + ("MaxSignal_inPixel", "WindowSize")
+            )
+            noise_columns, sizes = [], []
+            for name in names:
+                rows = reference["chName"] == name
+                ch_columns = OrderedDict(
+                    (key, col[..., rows]) for key, col in columns.items()
+                )
+                ch_columns["Wavelength"] = reference["Wavelength"][rows]
+                noise_columns.append(
+                    channel_noise(ch_columns, descriptions[name], payload)
+                )
+                sizes.append(int(rows.sum()))
+            noise_columns = _merge_channel_columns(
+                noise_columns, sizes, len(group)
+            )
+            for i, table in enumerate(group):
+                for key, col in noise_columns.items():
+                    table[key] = col[i]
+        self.set_output(tables)
+
+
+def _is_noise_column(key):
+    """True for the columns estimated by the noise budget"""
+    return key.endswith("_noise") or key in ("saturation_time", "frameTime")
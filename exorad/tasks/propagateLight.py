@@ -32,10 +32,10 @@ class PropagateTargetLight(Task):
 
         target = self.get_task_param("target")
         channels = self.get_task_param("channels")
-        self.debug("detectors found : {}".format(channels.keys()))
+        self.debug("detectors found : %s", channels.keys())
         table_list = []
         for ch in self.get_task_param("channels"):
-            self.debug("propagating target in {}".format(ch))
+            self.debug("propagating target in %s", ch)
             table_list.append(channels[ch].propagate_target(target))
         table = vstack_tables(table_list)
         updateTargetTable = UpdateTargetTable()
@@ -73,10 +73,10 @@ class PropagateForegroundLight(Task):
 
         target = self.get_task_param("target")
         channels = self.get_task_param("channels")
-        self.debug("detectors found : {}".format(channels.keys()))
+        self.debug("detectors found : %s", channels.keys())
         table_list = []
         for ch in self.get_task_param("channels"):
-            self.debug("propagating target background in {}".format(ch))
+            self.debug("propagating target background in %s", ch)
             table_list.append(
                 channels[ch].propagate_diffuse_foreground(target)
             )
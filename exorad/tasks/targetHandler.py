@@ -9,6 +9,12 @@ from .task import Task
 from exorad.__version__ import __version__
 from exorad.log import disableLogging
 from exorad.log import enableLogging
+from exorad.utils import profiling
+from exorad.utils.mpi import broadcast
+from exorad.utils.mpi import dynamic_map
+from exorad.utils.mpi import get_rank
+from exorad.utils.mpi import nprocs
+from exorad.utils.passVal import PassVal
 
 
 class LoadTargetList(Task):
@@ -37,7 +43,7 @@ class LoadTargetList(Task):
 
     def execute(self):
         target_list_file = self.get_task_param("target_list")
-        self.info("target list file : {}".format(target_list_file))
+        self.info("target list file : %s", target_list_file)
 
         target_list_format = {
             ".xlsx": XLXSTargetList,
@@ -46,8 +52,8 @@ class LoadTargetList(Task):
 
         try:
             ext = os.path.splitext(target_list_file)[1]
-            self.info("target list file : {}".format(target_list_file))
-            self.debug("target list format : {}".format(ext))
+            self.info("target list file : %s", target_list_file)
+            self.debug("target list format : %s", ext)
             target_klass = target_list_format[ext]
             tt = target_klass(target_list_file)
             if not tt.target:
@@ -55,7 +61,7 @@ class LoadTargetList(Task):
                     tt = CSVTargetListMRS(target_list_file)
 
         except KeyError:
-            self.error("unsupported target list format: {}".format(ext))
+            self.error("unsupported target list format: %s", ext)
             raise OSError("unsupported target list format: {}".format(ext))
         except TypeError:
             self.debug("target list is not a file. It is assumed to be QTable")
@@ -137,9 +143,8 @@ class UpdateTargetTable(Task):
         ]
         if repeated_keys:
             self.debug(
-                "the following keys are already in both table and will be replaced : {}".format(
-                    repeated_keys
-                )
+                "the following keys are already in both table and will be replaced : %s",
+                repeated_keys,
             )
             target.table.remove_columns(repeated_keys)
         target.table = hstack([target_table, table])
@@ -264,6 +269,203 @@ class ObserveTarget(Task):
         self.set_output(target)
 
 
+class ObserveTargetBatch(Task):
+    """
+    Vectorized version of :class:`ObserveTarget`, to observe many targets at once.
+    The foregrounds and the sources are estimated for each target, then the foreground radiances
+    and the seds of all the targets are stacked into arrays of shape (n_targets, n_wavelengths)
+    and propagated together through each channel. The noise is estimated for all the targets
+    at once as well. The targets must share the same wavelength grid, as it happens for the
+    targets observed with the same payload.
+
+    Parameters
+    ----------
+    targets: list
+        targets to observe
+    payload : dict
+        payload description
+    channels : dict
+        channel dictionary
+    wl_range: (float, float)
+        wavelength range to investigate. (wl_min, wl_max)
+
+    Returns
+    -------
+    list:
+        same targets with table attribute updated
+    """
+
+    def __init__(self):
+        self.addTaskParam("targets", "targets to observe")
+        self.addTaskParam("payload", "payload description")
+        self.addTaskParam("channels", "channel dictionary")
+        self.addTaskParam(
+            "wl_range", "wavelength range to investigate. (wl_min, wl_max)"
+        )
+
+    def execute(self):
+        import numpy as np
+        import astropy.units as u
+        from collections import OrderedDict
+        from exorad.models.noise import channel_noise
+        from exorad.utils.exolib import rebin
+        from . import (
+            EstimateForegrounds,
+            LoadSource,
+            MergeChannelsOutput,
+        )
+
+        targets = self.get_task_param("targets")
+        payload = self.get_task_param("payload")
+        channels = self.get_task_param("channels")
+        wl_min, wl_max = self.get_task_param("wl_range")
+        self.info("observing %s targets", len(targets))
+        if not targets:
+            self.set_output([])
+            return
+
+        prepareTarget = PrepareTarget()
+        loadSource = LoadSource()
+        estimateForegrounds = EstimateForegrounds()
+
+        table = MergeChannelsOutput()(channels=channels)
+        for target in targets:
+            target.table = prepareTarget.add_metadata(table.copy(), target)
+            if "foreground" in payload["common"]:
+                estimateForegrounds(
+                    foregrounds=payload["common"]["foreground"],
+                    target=target,
+                    wl_range=(wl_min, wl_max),
+                )
+            loadSource(
+                target=target,
+                source=payload["common"]["sourceSpectrum"],
+                wl_range=(wl_min, wl_max),
+            )
+
+        # target seds stacked as (n_targets, n_wavelengths). The foreground radiances
+        # are listed, so that the channels can use their foreground response
+        wl = targets[0].star.sed.wl_grid
+        seds = np.stack([target.star.sed.data for target in targets])
+        foregrounds = OrderedDict()
+        wl_frg = None
+        if hasattr(targets[0], "foreground"):
+            for frg, radiance in targets[0].foreground.items():
+                wl_frg = radiance.wl_grid
+                foregrounds[frg] = [
+                    target.foreground[frg] for target in targets
+                ]
+        sky_transmission = None
+        if hasattr(targets[0], "skyTransmission"):
+            sky_transmission = rebin(
+                wl,
+                targets[0].skyTransmission.wl_grid,
+                np.stack([target.skyTransmission.data for target in targets]),
+            )[1]
+            sky_transmission[np.isnan(sky_transmission)] = 0.0
+
+        sizes = [len(channels[ch].table) for ch in channels]
+        n_targets = len(targets)
+        columns = OrderedDict()
+        if foregrounds:
+            self.debug("propagating foregrounds")
+            columns.update(
+                _merge_channel_columns(
+                    [
+                        channels[ch].propagate_diffuse_foregrounds(
+                            wl_frg, foregrounds
+                        )
+                        for ch in channels
+                    ],
+                    sizes,
+                    n_targets,
+                )
+            )
+        self.debug("propagating target light")
+        columns.update(
+            _merge_channel_columns(
+                [
+                    channels[ch].propagate_targets(wl, seds, sky_transmission)
+                    for ch in channels
+                ],
+                sizes,
+                n_targets,
+            )
+        )
+
+        self.debug("computing noise")
+        # the columns of the channel tables are shared by all the targets
+        signals = OrderedDict(
+            (key, table[key]) for key in table.keys() if key not in columns
+        )
+        signals.update(columns)
+        max_signal = np.zeros((n_targets, len(table))) * u.count / u.s
+        for key in signals:
+            if "Max" in key:
+                max_signal = max_signal + signals[key]
+        columns["MaxSignal_inPixel"] = max_signal
+        signals["MaxSignal_inPixel"] = max_signal
+
+        noise_columns = []
+        for ch in channels:
+            rows = table["chName"] == channels[ch].description["value"]
+            noise_columns.append(
+                channel_noise(
+                    OrderedDict(
+                        (key, col[..., rows]) for key, col in signals.items()
+                    ),
+                    channels[ch].description,
+                    channels[ch].payload,
+                )
+            )
+        columns.update(_merge_channel_columns(noise_columns, sizes, n_targets))
+
+        for i, target in enumerate(targets):
+            for key, col in columns.items():
+                target.table[key] = col[i]
+        self.set_output(targets)
+
+
+def _merge_channel_columns(columns, sizes, n_targets):
+    """
+    Stacks the columns computed for each channel along the spectral bins.
+    As in :func:`~exorad.utils.util.vstack_tables`, the columns missing in a channel are filled with zeros.
+
+    Parameters
+    ----------
+    columns: list
+        columns of each channel
+    sizes: list
+        number of spectral bins of each channel
+    n_targets: int
+        number of targets
+
+    Returns
+    -------
+    OrderedDict:
+        columns of shape (n_targets, n_bins)
+    """
+    import numpy as np
+    from collections import OrderedDict
+
+    keys = []
+    for ch_columns in columns:
+        keys += [key for key in ch_columns if key not in keys]
+    merged = OrderedDict()
+    for key in keys:
+        unit = next(ch[key] for ch in columns if key in ch).unit
+        merged[key] = np.concatenate(
+            [
+                np.broadcast_to(ch[key], (n_targets, size), subok=True)
+                if key in ch
+                else np.zeros((n_targets, size)) * unit
+                for ch, size in zip(columns, sizes)
+            ],
+            axis=-1,
+        )
+    return merged
+
+
 def pipeline_to_dict(
     target,
     payload,
@@ -279,45 +481,162 @@ def pipeline_to_dict(
 
     observeTarget = ObserveTarget()
 
-    root_logger.info("observing {}".format(target.name))
+    root_logger.info("observing %s", target.name)
     if not debug:
         disableLogging()
     try:
+        # the observation updates the target: the input target is copied
+        # so that the caller's target list is left untouched
         target = observeTarget(
-            target=target,
+            target=deepcopy(target),
             payload=payload,
             channels=channels,
             wl_range=wl_range,
         )
         enableLogging()
-        outputDict = deepcopy(target)
+        outputDict = target
 
         if plot:
-            import matplotlib.pyplot as plt
-            import matplotlib
-            from exorad.utils.plotter import Plotter
-
-            matplotlib.use("Agg")
-            plotter = Plotter(input_table=target.table)
-            plotter.plot_table()
-            plotter.save_fig(
-                os.path.join(out_dir, "{}.png".format(target.name))
-            )
-            plt.close()
+            _plot_target(target, out_dir)
         return target.name, outputDict
     except:
         enableLogging()
         root_logger.warning(
-            "target {} skipped. Please check for previous error messages".format(
-                target.name
-            )
+            "target %s skipped. Please check for previous error messages",
+            target.name,
         )
         return None, None
 
 
+def batch_pipeline_to_dict(
+    targets,
+    payload,
+    channels,
+    wl_range,
+    plot,
+    out_dir,
+    debug,
+):
+    """
+    Observes a batch of targets with :class:`ObserveTargetBatch`.
+    If the batch fails, its targets are observed one by one with :func:`pipeline_to_dict`,
+    so that only the faulty targets are skipped.
+    """
+    from . import ObserveTargetBatch
+    from exorad.log.logger import root_logger
+
+    observeTargetBatch = ObserveTargetBatch()
+
+    root_logger.info("observing a batch of %s targets", len(targets))
+    if not debug:
+        disableLogging()
+    try:
+        observed = observeTargetBatch(
+            targets=deepcopy(targets),
+            payload=payload,
+            channels=channels,
+            wl_range=wl_range,
+        )
+        enableLogging()
+    except Exception:
+        enableLogging()
+        root_logger.warning(
+            "batch observation failed: targets observed one at a time",
+            exc_info=True,
+        )
+        return [
+            pipeline_to_dict(
+                target, payload, channels, wl_range, plot, out_dir, debug
+            )
+            for target in targets
+        ]
+
+    if plot:
+        for target in observed:
+            _plot_target(target, out_dir)
+    return [(target.name, target) for target in observed]
+
+
+def _plot_target(target, out_dir):
+    import matplotlib.pyplot as plt
+    import matplotlib
+    from exorad.utils.plotter import Plotter
+
+    matplotlib.use("Agg")
+    plotter = Plotter(input_table=target.table)
+    plotter.plot_table()
+    plotter.save_fig(os.path.join(out_dir, "{}.png".format(target.name)))
+    plt.close()
+
+
+# observation inputs shared by the worker processes. They are set once per
+# process by _init_worker, so that only the targets cross the process boundary
+_worker_state = {}
+
+
+def _init_worker(
+    payload,
+    channels,
+    wl_range,
+    plot,
+    out_dir,
+    debug,
+    profile=None,
+    code_profile=None,
+):
+    """
+    Stores the observation inputs as process-global state of the worker.
+    If profile is given, the worker records its tasks with a profiler built with these settings.
+    If code_profile is given, the worker profiles its code with `cProfile`
+    and writes the stats in this directory
+    """
+    if "working_R" in payload.get("common", {}):
+        # MPI processes do not parse the payload file, which sets it
+        PassVal.working_R = payload["common"]["working_R"]["value"]
+    if profile is not None:
+        profiling.enable_profiling(**profile)
+    if code_profile is not None:
+        profiling.enable_code_profiling(code_profile, worker=True)
+    _worker_state.update(
+        payload=payload,
+        channels=channels,
+        wl_range=wl_range,
+        plot=plot,
+        out_dir=out_dir,
+        debug=debug,
+    )
+
+
+def pipeline_in_worker(target):
+    """
+    This will be executed by the worker processes initialised by _init_worker.
+    It returns the result with the worker profiler stats recorded meanwhile, or None
+    """
+    return pipeline_to_dict(target, **_worker_state), _pop_worker_stats()
+
+
+def batch_in_worker(targets):
+    """As pipeline_in_worker, for a batch of targets"""
+    return (
+        batch_pipeline_to_dict(targets, **_worker_state),
+        _pop_worker_stats(),
+    )
+
+
+def _pop_worker_stats():
+    if profiling.active_profiler is None:
+        return None
+    return profiling.active_profiler.pop_stats()
+
+
 class ObserveTargetlist(Task):
     """
-    Standard pipeline to observe a full targetlist. It allows parallelization:
+    Standard pipeline to observe a full targetlist. It allows parallelization,
+    using a pool of processes (n_thread > 1) or, if the code is run with more
+    than one MPI process, distributing the targets among the MPI processes.
+    In the MPI case, the inputs of the root process (rank 0) are broadcast to all the processes,
+    the root process hands out the targets to the others as soon as they are free
+    and it collects the results.
 
     Parameters
     ----------
@@ -337,11 +656,19 @@ class ObserveTargetlist(Task):
         number of threads
     debug: bool
         debug mode
+    writer: HDF5TargetWriter
+        if provided, each target is handed to the writer as soon as it is observed,
+        instead of being kept in memory. Default is None
+    batch_size: int
+        if larger than 1, the targets are observed in batches of this size
+        with the vectorized :class:`ObserveTargetBatch`. Default is 1
 
     Returns
     -------
     dict:
-        targets dict
+        targets dict. If a writer is provided the targets are not retained
+        and the dict maps the observed target names to None.
+        In the MPI case, the dict is empty for all the processes but the root
     """
 
     def __init__(self):
@@ -357,6 +684,8 @@ class ObserveTargetlist(Task):
         )
         self.addTaskParam("n_thread", "number of threads", 1)
         self.addTaskParam("debug", "debug mode", False)
+        self.addTaskParam("writer", "writer for the observed targets", None)
+        self.addTaskParam("batch_size", "number of targets per batch", 1)
 
     def execute(self):
         targets = self.get_task_param("targets")
@@ -367,36 +696,101 @@ class ObserveTargetlist(Task):
         plot = self.get_task_param("plot")
         out_dir = self.get_task_param("out_dir")
         debug = self.get_task_param("debug")
+        writer = self.get_task_param("writer")
+        batch_size = self.get_task_param("batch_size")
         outputDict = {}
 
-        if n_thread > 1:
-            from concurrent.futures import (
-                ProcessPoolExecutor,
-                ThreadPoolExecutor,
+        def collect(t_name, output):
+            if writer is None:
+                outputDict[t_name] = output
+            elif output is not None:
+                writer.put(output)
+                outputDict[t_name] = None
+
+        if batch_size > 1:
+            # the work items are batches of targets, each producing a list of results
+            from exorad.utils.util import chunks
+
+            items = list(chunks(targets, batch_size))
+            in_worker, in_process = batch_in_worker, batch_pipeline_to_dict
+        else:
+            items = targets
+            in_worker, in_process = pipeline_in_worker, pipeline_to_dict
+
+        def collect_item(result):
+            for t_name, output in result if batch_size > 1 else [result]:
+                collect(t_name, output)
+
+        # the tasks run by the workers are nested in this task
+        profiler = profiling.active_profiler
+        profile = None if profiler is None else profiler.settings
+        code_profiler = profiling.active_code_profiler
+        code_profile = None if code_profiler is None else code_profiler.out_dir
+
+        def collect_from_worker(result, stats):
+            collect_item(result)
+            if stats is not None and profiler is not None:
+                profiler.merge(stats, prefix=profiler.path)
+
+        if nprocs() > 1:
+            # the inputs of the root process are broadcast to all the processes
+            state = broadcast(
+                (
+                    payload,
+                    channels,
+                    wl_range,
+                    plot,
+                    out_dir,
+                    debug,
+                    profile,
+                    code_profile,
+                )
             )
-            from itertools import repeat
-
-            # Does the distribution and chunking for you
-            # Switch to ThreadPoolExecutor if you want to use python threading
-            with ProcessPoolExecutor(max_workers=n_thread) as executor:
-                for t_name, output in executor.map(
-                    pipeline_to_dict,
-                    targets,
-                    repeat(payload),
-                    repeat(channels),
-                    repeat(wl_range),
-                    repeat(plot),
-                    repeat(out_dir),
-                    repeat(debug),
+            if get_rank() == 0:
+                # the root process only hands out the targets: it keeps its profilers
+                state = state[:-2] + (None, None)
+            _init_worker(*state)
+            if n_thread > 1:
+                self.warning("n_thread ignored: targets distributed with MPI")
+            for result, stats in dynamic_map(in_worker, items):
+                collect_from_worker(result, stats)
+        elif n_thread > 1:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+
+            # the payload and the built channels are sent once to each worker
+            # by the initializer: only the targets are pickled for every task
+            with ProcessPoolExecutor(
+                max_workers=n_thread,
+                initializer=_init_worker,
+                initargs=(
+                    payload,
+                    channels,
+                    wl_range,
+                    plot,
+                    out_dir,
+                    debug,
+                    profile,
+                    code_profile,
+                ),
+            ) as executor:
+                # results are collected as they complete
+                for future in as_completed(
+                    executor.submit(in_worker, item) for item in items
                 ):
-                    outputDict[t_name] = output
+                    collect_from_worker(*future.result())
         else:
-            outputDict = {}
-            for target in targets:
-                t_name, output = pipeline_to_dict(
-                    target, payload, channels, wl_range, plot, out_dir, debug
+            for item in items:
+                collect_item(
+                    in_process(
+                        item,
+                        payload,
+                        channels,
+                        wl_range,
+                        plot,
+                        out_dir,
+                        debug,
+                    )
                 )
-                outputDict[t_name] = output
 
         self.set_output(outputDict)
 
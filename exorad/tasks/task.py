@@ -2,6 +2,7 @@ from abc import ABCMeta
 from abc import abstractmethod
 
 from exorad.log.logger import Logger
+from exorad.utils import profiling
 
 
 class Task(Logger):
@@ -35,13 +36,17 @@ class Task(Logger):
         self._task_input = kwargs
         self._validate_input_params()
         self._populate_empty_param()
-        self.execute()
+        if profiling.active_profiler is None:
+            self.execute()
+        else:
+            with profiling.active_profiler.stage(self.__class__.__name__):
+                self.execute()
         return self.get_output()
 
     def _validate_input_params(self):
         for key in self._task_input.keys():
             if key not in self._task_params.keys():
-                self.error("Unexpected Task input parameter: {}".format(key))
+                self.error("Unexpected Task input parameter: %s", key)
                 raise ValueError
 
     def _populate_empty_param(self):
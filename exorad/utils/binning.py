@@ -0,0 +1,148 @@
+import astropy.units as u
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# searchsorted sides of the left and right edges, for each kind of bin interval
+_sides = {
+    "left": ("left", "left"),  # left <= x < right
+    "right": ("right", "right"),  # left < x <= right
+    "neither": ("right", "left"),  # left < x < right
+}
+
+
+class BinningPlan:
+    """
+    Spectral bins of a grid, as the index ranges of the grid samples in each bin.
+    The ranges are found once with `searchsorted`, so that the reductions of the samples
+    in the bins are segment reductions (`np.add.reduceat`, `np.maximum.reduceat`)
+    instead of a mask for each bin.
+
+    Parameters
+    ----------
+    grid: Quantity
+        grid to bin. It does not need to be sorted
+    left: Quantity
+        left edges of the bins
+    right: Quantity
+        right edges of the bins
+    closed: str
+        bin interval kind: 'left' for left <= x < right, 'right' for left < x <= right,
+        'neither' for left < x < right. Default is 'left'
+
+    Attributes
+    ----------
+    order: array
+        indexes sorting the grid, or None if it is already sorted
+    starts: array
+        index of the first sample of each bin in the sorted grid
+    stops: array
+        index after the last sample of each bin in the sorted grid
+
+    Examples
+    --------
+    >>> plan = BinningPlan(wl, table['LeftBinEdge'], table['RightBinEdge'])
+    >>> binned = plan.mean(signal)
+    """
+
+    def __init__(self, grid, left, right, closed="left"):
+        unit = getattr(grid, "unit", None)
+        grid = np.asarray(u.Quantity(grid).value, dtype=float)
+        left = np.atleast_1d(self._values(left, unit))
+        right = np.atleast_1d(self._values(right, unit))
+
+        self.size = grid.size
+        self.order = None
+        if np.any(np.diff(grid) < 0):
+            self.order = np.argsort(grid, kind="stable")
+            grid = grid[self.order]
+        left_side, right_side = _sides[closed]
+        self.starts = np.searchsorted(grid, left, side=left_side)
+        self.stops = np.maximum(
+            np.searchsorted(grid, right, side=right_side), self.starts
+        )
+        self.counts = self.stops - self.starts
+        # segment reductions need sorted, not overlapping bins
+        bounds = np.empty(2 * self.starts.size, dtype=int)
+        bounds[0::2] = self.starts
+        bounds[1::2] = self.stops
+        self._bounds = bounds if np.all(np.diff(bounds) >= 0) else None
+
+    @staticmethod
+    def _values(edges, unit):
+        if unit is None or not hasattr(edges, "unit"):
+            return np.asarray(u.Quantity(edges).value, dtype=float)
+        return np.asarray(edges.to_value(unit), dtype=float)
+
+    def _reduce(self, ufunc, data):
+        unit = getattr(data, "unit", None)
+        values = np.asarray(data.value if unit is not None else data)
+        if self.order is not None:
+            values = values[..., self.order]
+        if self._bounds is not None:
+            # a padding sample makes the reduceat indexes always valid
+            pad = np.zeros(values.shape[:-1] + (1,), dtype=values.dtype)
+            values = np.concatenate([values, pad], axis=-1)
+            reduced = ufunc.reduceat(values, self._bounds, axis=-1)[..., 0::2]
+        else:
+            reduced = np.stack(
+                [
+                    ufunc.reduce(values[..., start:stop], axis=-1)
+                    if stop > start
+                    else values[..., 0] * 0
+                    for start, stop in zip(self.starts, self.stops)
+                ],
+                axis=-1,
+            )
+        return reduced, unit
+
+    @staticmethod
+    def _with_unit(values, unit):
+        return values * unit if unit is not None else values
+
+    def sum(self, data):
+        """sum of the samples in each bin, along the last axis of data. Empty bins are zero"""
+        reduced, unit = self._reduce(np.add, data)
+        reduced = np.where(self.counts > 0, reduced, 0.0)
+        return self._with_unit(reduced, unit)
+
+    def mean(self, data):
+        """mean of the samples in each bin, along the last axis of data. Empty bins are NaN"""
+        reduced, unit = self._reduce(np.add, data)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            reduced = np.where(self.counts > 0, reduced / self.counts, np.nan)
+        return self._with_unit(reduced, unit)
+
+    def max(self, data):
+        """
+        maximum of the samples in each bin, along the last axis of data
+
+        Raises
+        ------
+        ValueError
+            if a bin is empty
+        """
+        if np.any(self.counts == 0):
+            raise ValueError("empty bin: no max value")
+        reduced, unit = self._reduce(np.maximum, data)
+        return self._with_unit(reduced, unit)
+
+    def matrix(self, weights=None):
+        """
+        sparse matrix of shape (n_bins, grid size) summing the samples in each bin,
+        each multiplied by its weight if weights are given
+        """
+        samples = np.arange(self.size)
+        if self.order is not None:
+            samples = self.order
+        rows = np.repeat(np.arange(self.starts.size), self.counts)
+        cols = np.concatenate(
+            [
+                samples[start:stop]
+                for start, stop in zip(self.starts, self.stops)
+            ]
+            + [np.zeros(0, dtype=int)]
+        )
+        data = np.ones(cols.size) if weights is None else weights[cols]
+        return csr_matrix(
+            (data, (rows, cols)), shape=(self.starts.size, self.size)
+        )
@@ -4,8 +4,10 @@ import astropy.constants as const
 import astropy.units as u
 import numpy as np
 from scipy.interpolate import interp1d
+from scipy.signal import convolve
 
 from exorad.models.signal import Signal
+from exorad.utils.binning import BinningPlan
 from exorad.utils.exolib import OmegaPix
 
 logger = logging.getLogger("exorad.diffuse light")
@@ -14,7 +16,7 @@ logger = logging.getLogger("exorad.diffuse light")
 def prepare(ch_table, ch_built_instr, description):
     logger.info("computing signal")
     wl_table = ch_table["Wavelength"]
-    logger.debug("wl table : {}".format(wl_table))
+    logger.debug("wl table : %s", wl_table)
 
     fnum_x = description["Fnum_x"]["value"].value
     if "Fnum_y" in description.keys():
@@ -22,7 +24,7 @@ def prepare(ch_table, ch_built_instr, description):
     else:
         fnum_y = None
     omega_pix = OmegaPix(fnum_x, fnum_y)
-    logger.debug("omega pix : {}".format(omega_pix))
+    logger.debug("omega pix : %s", omega_pix)
     A = (
         description["detector"]["delta_pix"]["value"]
         * description["detector"]["delta_pix"]["value"]
@@ -32,7 +34,7 @@ def prepare(ch_table, ch_built_instr, description):
         * u.Unit(ch_built_instr["qe_data"]["wl_grid"]["unit"]),
         ch_built_instr["qe_data"]["data"]["value"],
     )
-    logger.debug("wl qe : {}".format(qe.wl_grid))
+    logger.debug("wl qe : %s", qe.wl_grid)
 
     transmission = Signal(
         ch_built_instr["transmission_data"]["wl_grid"]["value"]
@@ -56,11 +58,42 @@ def prepare(ch_table, ch_built_instr, description):
 def convolve_with_slit(
     ch_description, ch_built_instr, A, ch_table, omega_pix, qe, radiance
 ):
+    radiance.spectral_rebin(ch_built_instr["wl_pix_center"])
+    logger.debug("radiance : %s", radiance.data)
+    max_signal_per_pix, signal = slit_signal(
+        ch_description,
+        ch_built_instr,
+        A,
+        ch_table,
+        omega_pix,
+        qe,
+        radiance.data,
+    )
+    return list(max_signal_per_pix), list(signal)
+
+
+def slit_signal(
+    ch_description, ch_built_instr, A, ch_table, omega_pix, qe, radiance
+):
+    """
+    Signal of a diffuse radiance seen through the slit in the channel spectral bins.
+
+    Parameters
+    ----------
+    radiance: Quantity
+        radiance sampled on the pixel wavelength grid.
+        It can have leading axes, as for the radiances of many targets stacked together
+
+    Returns
+    -------
+    Quantity:
+        maximum signal in a pixel for each spectral bin
+    Quantity:
+        signal in each spectral bin
+    """
     slit_width = ch_built_instr["slit_width"]
     wl_pix = ch_built_instr["wl_pix_center"]
     dwl_pic = ch_built_instr["pixel_bandwidth"]
-    radiance.spectral_rebin(wl_pix)
-    logger.debug("radiance : {}".format(radiance.data))
 
     qe_func = interp1d(
         qe.wl_grid,
@@ -76,9 +109,9 @@ def convolve_with_slit(
         * (wl_pix / const.c / const.h).to(1.0 / u.W / u.s)
         * u.count
     )
-    logger.debug("AOmega : {}".format(aomega))
-    radiance.data *= aomega
-    logger.debug("sed : {}".format(radiance.data))
+    logger.debug("AOmega : %s", aomega)
+    radiance = radiance * aomega
+    logger.debug("sed : %s", radiance)
     logger.debug("convolving with slit")
     slit_kernel = np.ones(
         int(
@@ -86,28 +119,29 @@ def convolve_with_slit(
             / ch_description["detector"]["delta_pix"]["value"].to(u.um)
         )
     )
+    radiance = radiance * dwl_pic
     signal_tmp = (
-        np.convolve(radiance.data * dwl_pic, slit_kernel, "same")
-    ).to(u.count / u.s)
-    logger.debug("signal_tmp: {}".format(signal_tmp))
-    idx = [
-        np.logical_and(wl_pix > wlow, wl_pix <= whigh)
-        for wlow, whigh in zip(
-            ch_table["LeftBinEdge"], ch_table["RightBinEdge"]
-        )
-    ]
-    signal = [signal_tmp[idx[k]].sum() for k in range(len(idx))]
-    signal = [
-        sig * w
-        for sig, w in zip(
-            signal, np.array(ch_built_instr["window_spatial_width"])
+        convolve(
+            radiance.value,
+            slit_kernel.reshape((1,) * (radiance.ndim - 1) + (-1,)),
+            "same",
+            method="direct",
         )
-    ]
-    logger.debug("signal: {}".format(signal))
+        * radiance.unit
+    ).to(u.count / u.s)
+    logger.debug("signal_tmp: %s", signal_tmp)
+    binning = BinningPlan(
+        wl_pix,
+        ch_table["LeftBinEdge"],
+        ch_table["RightBinEdge"],
+        closed="right",
+    )
+    signal = binning.sum(signal_tmp) * np.array(
+        ch_built_instr["window_spatial_width"]
+    )
+    logger.debug("signal: %s", signal)
     try:
-        max_signal_per_pix = [
-            signal_tmp[idx[k]].max() for k in range(len(idx))
-        ]
+        max_signal_per_pix = binning.max(signal_tmp)
     except ValueError:
         logger.error("no max value in the array")
         raise
@@ -115,10 +149,32 @@ def convolve_with_slit(
 
 
 def integrate_light(radiance, wl_qe, ch_built_instr):
-    logger.debug("sed : {}".format(radiance.data))
-    signal_tmp = np.trapz(radiance.data, x=wl_qe).to(u.count / u.s)
+    logger.debug("sed : %s", radiance.data)
+    return integrate_radiance(radiance.data, wl_qe, ch_built_instr)
+
+
+def integrate_radiance(radiance, wl_qe, ch_built_instr):
+    """
+    Signal of a diffuse radiance integrated over the wavelength grid
+    in the channel spectral bins.
+
+    Parameters
+    ----------
+    radiance: Quantity
+        radiance sampled on wl_qe. It can have leading axes,
+        as for the radiances of many targets stacked together
+
+    Returns
+    -------
+    Quantity:
+        maximum signal in a pixel for each spectral bin
+    Quantity:
+        signal in each spectral bin
+    """
+    signal_tmp = np.trapz(radiance, x=wl_qe).to(u.count / u.s)
     # signal_tmp = (np.trapz(radiance.data[~np.isnan(radiance.data)], x=wl_qe[~np.isnan(radiance.data)])).to(
     #     u.count / u.s)
+    signal_tmp = signal_tmp[..., np.newaxis]
     signal = signal_tmp * np.asarray(ch_built_instr["window_size_px"])
     max_signal_per_pix = signal_tmp * np.ones_like(
         ch_built_instr["window_size_px"]
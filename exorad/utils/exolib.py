@@ -1,6 +1,8 @@
 import glob
+import hashlib
 import logging
 import os
+from collections import OrderedDict
 
 import astropy.units as u
 import mpmath
@@ -9,22 +11,24 @@ import photutils
 from astropy.io import fits
 from scipy import signal
 from scipy.integrate import cumulative_trapezoid
+from scipy.sparse import csr_matrix
 from scipy.interpolate import interp1d
 from scipy.special import j1
-from scipy.stats import binned_statistic
 
 logger = logging.getLogger("exorad.exolib")
 
 
 def rebin(x, xp, fp):
     """Resample a function fp(xp) over the new grid x, rebinning if necessary,
-    otherwise interpolates
+    otherwise interpolates. The resampling is the product with the matrix
+    of :func:`rebin_matrix`, which is cached for the last pairs of grids used
     Parameters
     ----------
     x	: 	array like
     New coordinates
     fp 	:	array like
-    y-coordinates to be resampled
+    y-coordinates to be resampled. If fp has more than one axis,
+    as for many spectra stacked together, it is resampled along the last one
     xp 	:	array like
     x-coordinates at which fp are sampled
 
@@ -41,78 +45,138 @@ def rebin(x, xp, fp):
         )
         raise ValueError
 
-    idx = np.where(np.logical_and(xp > 0.9 * x.min(), xp < 1.1 * x.max()))[0]
-    xp = xp[idx]
-    fp = fp[idx]
-
     if not hasattr(fp, "unit"):
         logger.debug("No units found for fp. Forced to None")
-        fp *= u.Unit()
-    funits = fp.unit
-
-    # remove NaNs
-    id = np.where(np.isnan(xp))[0]
-    if id.size > 0:
-        logger.debug("Nans found in input x array: removing it")
-        xp = np.delete(xp, id)
-        fp = np.delete(fp, id)
-
-    id = np.where(np.isnan(x))[0]
-    if id.size > 0:
-        logger.debug("Nans found in new x array: removing it")
-        x = np.delete(x, id)
-
-    # remove duplicates
-    while np.diff(xp).min() == 0:
-        logger.debug("duplicate found in input x array: removing it")
-        id = np.argmin(np.diff(xp))
-        xp = np.delete(xp, id)
-        fp = np.delete(fp, id)
-
-    while np.diff(x).min() == 0:
-        logger.debug("duplicate found in new x array: removing it")
-        id = np.argmin(np.diff(x))
-        x = np.delete(x, id)
+        fp = fp * u.Unit()
+
+    new_x, matrix, empty_bins = _resampling_operator(x, xp)
+    values = np.asarray(fp.value)
+    new_f = (matrix @ values.reshape(-1, values.shape[-1]).T).T
+    new_f = new_f.reshape(values.shape[:-1] + (matrix.shape[0],))
+    if empty_bins is not None:
+        new_f[..., empty_bins] = np.nan
+    return new_x.copy(), new_f * fp.unit
+
+
+# resampling operators of the last pairs of grids used by rebin, by grids fingerprint
+_resampling_operators = OrderedDict()
+_RESAMPLING_CACHE_SIZE = 32
+
+
+def _resampling_operator(x, xp):
+    """returns the cached new grid, matrix and empty bins of :func:`rebin` for the grids pair"""
+    fingerprint = hashlib.sha1()
+    for grid in (x, xp):
+        fingerprint.update("{}:{}:".format(grid.unit, grid.shape).encode())
+        fingerprint.update(np.ascontiguousarray(grid.value).tobytes())
+    key = fingerprint.digest()
+    try:
+        _resampling_operators.move_to_end(key)
+        return _resampling_operators[key]
+    except KeyError:
+        pass
+    logger.debug("building resampling operator")
+    operator = _rebin_operator(x, xp)
+    _resampling_operators[key] = operator
+    while len(_resampling_operators) > _RESAMPLING_CACHE_SIZE:
+        _resampling_operators.popitem(last=False)
+    return operator
+
+
+def rebin_matrix(x, xp):
+    """Linear operator of :func:`rebin`: the resampling of any function fp(xp)
+    over the new grid x is the product of the returned sparse matrix with fp
+    Parameters
+    ----------
+    x	: 	array like
+    New coordinates
+    xp 	:	array like
+    x-coordinates at which the functions to resample are sampled
+
+    Returns
+    -------
+    out	: 	array like
+    new coordinates, without NaNs and duplicates
+    out	: 	scipy.sparse.csr_matrix
+    matrix of shape (x.size, xp.size). The rows of empty bins are zero,
+    where :func:`rebin` returns NaN
+
+    """
+    return _rebin_operator(x, xp)[:2]
 
+
+def _rebin_operator(x, xp):
+    if x.unit != xp.unit:
+        logger.fatal(
+            "Units mismatch in rebin {:s}, {:s}".format(x.unit, xp.unit)
+        )
+        raise ValueError
+    x_unit = x.unit
+    n_xp = xp.size
+    xp = xp.value
+    x = x.value
+
+    # samples outside the new grid, NaNs and duplicates are dropped:
+    # of a sequence of duplicates only the last one is kept
+    cols = np.where(np.logical_and(xp > 0.9 * x.min(), xp < 1.1 * x.max()))[0]
+    cols = cols[~np.isnan(xp[cols])]
+    x = x[~np.isnan(x)]
+    if np.diff(xp[cols]).min() == 0:
+        cols = cols[np.append(np.diff(xp[cols]) != 0, True)]
+    if np.diff(x).min() == 0:
+        x = x[np.append(np.diff(x) != 0, True)]
+    xp = xp[cols]
+
+    empty_bins = None
     if np.diff(xp).max() < np.diff(x).min():
-        # Binning!
-        logger.debug("binning")
+        # Binning: mean of the samples in each bin, as binned_statistic
         bin_x = 0.5 * (x[1:] + x[:-1])
         x0 = x[0] - (bin_x[0] - x[0]) / 2.0
         x1 = x[-1] + (x[-1] - bin_x[-1]) / 2.0
-        bin_x = np.insert(bin_x, [0], x0)
-        bin_x = np.append(bin_x, x1)
-        new_f = (
-            binned_statistic(xp, fp, bins=bin_x, statistic="mean")[0] * funits
-        )
-
-    #    idx = np.where(np.logical_and(xp >= x.min(), xp <= x.max()))[0]
-    #    print np.trapz(fp[idx], x=xp[idx])
-    #    print np.trapz(new_f, x=x)
-    #    asd
+        bin_x = np.concatenate([[x0], bin_x, [x1]])
+        rows = np.digitize(xp, bin_x) - 1
+        rows[xp == bin_x[-1]] = x.size - 1
+        inside = np.logical_and(rows >= 0, rows < x.size)
+        rows, cols = rows[inside], cols[inside]
+        counts = np.bincount(rows, minlength=x.size)
+        data = 1.0 / counts[rows]
+        if np.any(counts == 0):
+            empty_bins = np.where(counts == 0)[0]
     else:
-        logger.debug("interpolating")
-
-        # Interpolate !
-        # new_f = np.interp(x, xp, fp, left=0.0, right=0.0)
-        #         from scipy.interpolate import interp1d
-        #         interpolator = interp1d(xp, fp, kind='cubic', fill_value=0.0, assume_sorted=False, bounds_error=False)
-        #         new_f = interpolator(x)
-        func = interp1d(
-            xp,
-            fp,
-            fill_value=0.0,
-            assume_sorted=False,
-            bounds_error=False,
-            kind="linear",
-        )
-        new_f = func(x)
+        # Interpolate: linear, with zero outside the input grid, as interp1d
+        order = np.argsort(xp)
+        xp, cols = xp[order], cols[order]
+        rows = np.where(np.logical_and(x >= xp[0], x <= xp[-1]))[0]
+        hi = np.clip(np.searchsorted(xp, x[rows]), 1, xp.size - 1)
+        lo = hi - 1
+        w_hi = (x[rows] - xp[lo]) / (xp[hi] - xp[lo])
+        rows = np.concatenate([rows, rows])
+        data = np.concatenate([1.0 - w_hi, w_hi])
+        cols = np.concatenate([cols[lo], cols[hi]])
+
+    matrix = csr_matrix((data, (rows, cols)), shape=(x.size, n_xp))
+    return x * u.Unit(x_unit), matrix, empty_bins
+
+
+def trapz_weights(x):
+    """Weights of the trapezoidal rule over the grid x, so that
+    the integral of many functions sampled on x is a matrix product
+    Parameters
+    ----------
+    x	: 	array like
+    x-coordinates of the samples
 
-        if not hasattr(new_f, "unit"):
-            logger.debug("output units force to inputs fp")
-            new_f *= funits
+    Returns
+    -------
+    out	: 	array like
+    weights w such that np.trapz(y, x=x) == np.sum(y * w, axis=-1)
 
-    return x, new_f
+    """
+    dx = np.diff(x)
+    weights = np.zeros_like(x, dtype=float)
+    weights[:-1] += 0.5 * dx
+    weights[1:] += 0.5 * dx
+    return weights
 
 
 def rebin_(x, xp, fp):
@@ -164,9 +228,14 @@ def rebin_(x, xp, fp):
     return x, new_f
 
 
+_planck_unit = u.W / u.m**2 / u.sr / u.um
+
+
 def planck(wl, T):
     """Planck function.
 
+    The units are checked on input: the spectrum is computed on plain floats.
+
     Parameters
     __________
       wl : 			array
@@ -180,14 +249,16 @@ def planck(wl, T):
                 The Planck spectrum  [W m^-2 sr^-1 micron^-1]
     """
 
-    a = np.float64(1.191042768e8) * u.um**5 * u.W / u.m**2 / u.sr / u.um
-    b = np.float64(14387.7516) * 1 * u.um * u.K
+    a = np.float64(1.191042768e8)  # [W m^-2 sr^-1 um^4]
+    b = np.float64(14387.7516)  # [um K]
+    wl = u.Quantity(wl, u.um, copy=False).value
+    T = u.Quantity(T, u.K, copy=False).value
     try:
         x = b / (wl * T)
         bb = a / wl**5 / (np.exp(x) - 1.0)
     except ArithmeticError:
         bb = np.zeros_like(wl)
-    return bb
+    return u.Quantity(bb, _planck_unit, copy=False)
 
 
 def load_standard_psf(F_x, F_y, wl, delta_pix, hdr):
@@ -44,14 +44,36 @@ def get_rank():
     return rank
 
 
+# message tags for the master/worker queue of dynamic_map
+_WORK_TAG = 1
+_STOP_TAG = 2
+_RESULT_TAG = 3
+
+
 def scatter(data, root=0):
+    """Distributes the data from the root process among all the processes
+
+    Parameters
+    ----------
+    data: list
+        data to distribute. Only the root process data is used
+    root: int
+        rank of the process distributing the data
+
+    Returns
+    -------
+    list:
+        share of the data of the process. It's empty if there are fewer
+        items than processes
+
+    """
     from mpi4py import MPI
 
     comm = MPI.COMM_WORLD
-    if len(data) < nprocs():
-        raise ValueError("not enough processes! work in progress")
-    else:
-        data = comm.scatter(data, root=root)
+    if comm.Get_rank() == root:
+        n = nprocs()
+        data = [list(data[i::n]) for i in range(n)]
+    data = comm.scatter(data, root=root)
     return data
 
 
@@ -63,6 +85,93 @@ def gather(data, root=0):
     return data
 
 
+def broadcast(data, root=0):
+    """Broadcasts the data of the root process to all the processes.
+    It returns the data untouched if MPI is not in use
+
+    Parameters
+    ----------
+    data: object
+        data to broadcast. Only the root process data is used
+    root: int
+        rank of the process broadcasting the data
+
+    Returns
+    -------
+    object:
+        the root process data
+
+    """
+    if nprocs() == 1:
+        return data
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    return comm.bcast(data, root=root)
+
+
+def dynamic_map(func, items, root=0):
+    """Applies the function to the items using a master/worker queue.
+    The root process hands out the items one at a time to the other processes
+    as soon as they are free, and yields the results as they arrive.
+    The other processes execute the function until the items are exhausted.
+    If MPI is not in use, the function is applied serially.
+
+    Parameters
+    ----------
+    func: callable
+        function to apply to each item. It's called on the worker processes
+    items: iterable
+        items to process. Only the root process items are used
+    root: int
+        rank of the master process
+
+    Yields
+    ------
+    object:
+        results of the function, in order of completion.
+        Nothing is yielded on the worker processes
+
+    """
+    if nprocs() == 1:
+        for item in items:
+            yield func(item)
+        return
+
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    status = MPI.Status()
+
+    if comm.Get_rank() != root:
+        while True:
+            item = comm.recv(source=root, tag=MPI.ANY_TAG, status=status)
+            if status.Get_tag() == _STOP_TAG:
+                return
+            comm.send(func(item), dest=root, tag=_RESULT_TAG)
+
+    items = iter(items)
+    active = 0
+
+    def feed(worker):
+        for item in items:
+            comm.send(item, dest=worker, tag=_WORK_TAG)
+            return 1
+        comm.send(None, dest=worker, tag=_STOP_TAG)
+        return 0
+
+    for worker in range(nprocs()):
+        if worker != root:
+            active += feed(worker)
+    while active:
+        result = comm.recv(
+            source=MPI.ANY_SOURCE, tag=_RESULT_TAG, status=status
+        )
+        active -= 1
+        active += feed(status.Get_source())
+        yield result
+
+
 # def only_master_rank(f):
 #     """
 #     A decorator to ensure only the master
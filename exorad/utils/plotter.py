@@ -180,7 +180,7 @@ class Plotter(Logger):
                 pce = self.inputTable["TR"] * self.inputTable["QE"]
                 self.inputTable["pce"] = pce
                 keys = ["TR", "QE", "pce"]
-                self.debug("efficiency keys : {}".format(keys))
+                self.debug("efficiency keys : %s", keys)
                 for e in keys:
                     ax.plot(
                         self.inputTable["Wavelength"],
@@ -227,7 +227,7 @@ class Plotter(Logger):
         noise_keys = [
             x for x in self.inputTable.keys() if "noise" in x or "custom" in x
         ]
-        self.debug("noise keys : {}".format(noise_keys))
+        self.debug("noise keys : %s", noise_keys)
         for k, n in enumerate(noise_keys):
             if n == "total_noise":
                 ax.plot(
@@ -245,9 +245,7 @@ class Plotter(Logger):
                 if self.inputTable[n].unit == u.hr**0.5:
                     noise = self.inputTable[n]
                 else:
-                    self.debug(
-                        "{} rescaled by starSignal_inAperture".format(n)
-                    )
+                    self.debug("%s rescaled by starSignal_inAperture", n)
                     noise = (
                         self.inputTable[n]
                         / self.inputTable["star_signal_inAperture"]
@@ -319,7 +317,7 @@ class Plotter(Logger):
             for x in self.inputTable.keys()
             if "signal" in x and "noise" not in x
         ]
-        self.debug("signal keys : {}".format(keys))
+        self.debug("signal keys : %s", keys)
         for k, s in enumerate(keys):
             # ax.scatter(self.inputTable['Wavelength'], self.inputTable[s], label=s, zorder=10, s=5, color=palette[k])
             ax.plot(
@@ -410,7 +408,7 @@ class Plotter(Logger):
             else:
                 self.fig.savefig("{}".format(name))
 
-            self.info("plot saved in {}".format(name))
+            self.info("plot saved in %s", name)
         except AttributeError:
             self.error(
                 "the indicated figure is not available. Check if you have produced it."
@@ -476,7 +474,7 @@ def main():
     from exorad.utils.ascii_art import ascii_plot
 
     logger.info(ascii_plot)
-    logger.info("code version {}".format(__version__))
+    logger.info("code version %s", __version__)
 
     if args.debug:
         setLogLevel(logging.DEBUG)
@@ -485,7 +483,7 @@ def main():
         os.makedirs(args.out)
         logger.info("output directory created")
 
-    logger.info("reading {}".format(args.input))
+    logger.info("reading %s", args.input)
     file = h5py.File(args.input)
 
     if args.target_number != "all" and args.target_name != "None":
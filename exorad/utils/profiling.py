@@ -0,0 +1,427 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from astropy import units as u
+from astropy.table import QTable
+
+from exorad.log import Logger
+
+# profiler of the running process, used by Task.__call__. None if profiling is not enabled
+active_profiler = None
+
+# position of the measures in the stats of a stage
+_CALLS, _WALL, _CPU, _MEMORY = range(4)
+
+# name of the summary table in the info group of the output file
+PROFILE_KEY = "profile"
+
+
+class TaskProfiler(Logger):
+    """
+    Records the wall time, the CPU time and the number of calls of each :class:`~exorad.tasks.task.Task`,
+    nested by parent task. Optionally, it records the memory allocated by each task, using `tracemalloc`.
+    It is enabled with :func:`enable_profiling`: then every task call is recorded by `Task.__call__`.
+
+    The stages are identified by their path, the names of the tasks from the outermost to the task itself,
+    so that the same task called by different parents is reported separately.
+    The times of a stage include the times of its children.
+
+    Parameters
+    ----------
+    memory: bool
+        if True the memory allocated by each stage is recorded with `tracemalloc`. Default is False
+
+    Attributes
+    ----------
+    stats: OrderedDict
+        number of calls, wall time [s], CPU time [s] and memory allocated [byte] for each stage path
+
+    Examples
+    --------
+    >>> profiler = enable_profiling()
+    >>> payload, channels, (wl_min, wl_max) = preparePayload(payload_file=payload_file)
+    >>> profiler.log_summary()
+    >>> disable_profiling()
+    """
+
+    def __init__(self, memory=False):
+        self.set_log_name()
+        self.memory = memory
+        self.stats = OrderedDict()
+        self._stack = []
+
+    @property
+    def settings(self):
+        """arguments to build a profiler with the same settings, as in the worker processes"""
+        return {"memory": self.memory}
+
+    @property
+    def path(self):
+        """path of the running stage"""
+        return tuple(self._stack)
+
+    @contextmanager
+    def stage(self, name):
+        """records the execution of the wrapped code as a stage, nested in the running one"""
+        self._stack.append(name)
+        path = tuple(self._stack)
+        # the stage is listed before the stages it runs
+        self.stats.setdefault(path, [0, 0.0, 0.0, 0])
+        memory = tracemalloc.get_traced_memory()[0] if self.memory else 0
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if self.memory:
+                memory = tracemalloc.get_traced_memory()[0] - memory
+            self._stack.pop()
+            self._add(path, [1, wall, cpu, memory])
+
+    def _add(self, path, measures):
+        stats = self.stats.setdefault(path, [0, 0.0, 0.0, 0])
+        for i, value in enumerate(measures):
+            stats[i] += value
+
+    def pop_stats(self):
+        """returns the stats recorded so far and resets them, as to send them to another process"""
+        stats, self.stats = self.stats, OrderedDict()
+        return stats
+
+    def merge(self, stats, prefix=()):
+        """
+        adds the stats recorded by another profiler, as the one of a worker process
+
+        Parameters
+        ----------
+        stats: dict
+            stats of the other profiler
+        prefix: tuple
+            path of the stage the stats are nested in. Default is the root
+        """
+        for path, measures in stats.items():
+            self._add(tuple(prefix) + tuple(path), measures)
+
+    def table(self):
+        """
+        Returns
+        -------
+        QTable:
+            summary of the stages, in order of first call
+        """
+        table = QTable()
+        table["stage"] = [
+            "  " * (len(path) - 1) + path[-1] for path in self.stats
+        ]
+        table["path"] = ["/".join(path) for path in self.stats]
+        table["calls"] = [s[_CALLS] for s in self.stats.values()]
+        table["wall_time"] = [s[_WALL] for s in self.stats.values()] * u.s
+        table["cpu_time"] = [s[_CPU] for s in self.stats.values()] * u.s
+        if self.memory:
+            table["memory"] = (
+                [s[_MEMORY] for s in self.stats.values()] * u.byte
+            ).to(u.MiB)
+        return table
+
+    def log_summary(self):
+        """writes the summary table to the log"""
+        table = self.table()
+        table.remove_column("path")
+        table["stage"].info.format = "<"
+        for col in ["wall_time", "cpu_time", "memory"]:
+            if col in table.keys():
+                table[col].info.format = ".3f"
+        self.info("time spent in each task:")
+        for line in table.pformat(max_lines=-1, max_width=-1):
+            self.info(line)
+
+    def write(self, output):
+        """
+        writes the summary table in the info group of the output file, replacing any previous one
+
+        Parameters
+        ----------
+        output: HDF5Output
+            open output file
+        """
+        if "info" in output.fd:
+            for key in list(output.fd["info"].keys()):
+                if key.startswith(PROFILE_KEY):
+                    del output.fd["info"][key]
+        output.create_group("info").write_table(PROFILE_KEY, self.table())
+
+
+def enable_profiling(memory=False):
+    """
+    Starts recording the tasks executed by the process.
+
+    Parameters
+    ----------
+    memory: bool
+        if True the memory allocated by each task is recorded with `tracemalloc`. Default is False
+
+    Returns
+    -------
+    TaskProfiler:
+        the profiler recording the tasks
+    """
+    global active_profiler
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    active_profiler = TaskProfiler(memory=memory)
+    return active_profiler
+
+
+def disable_profiling():
+    """
+    Stops recording the tasks.
+
+    Returns
+    -------
+    TaskProfiler:
+        the profiler that was recording the tasks, or None
+    """
+    global active_profiler
+    profiler, active_profiler = active_profiler, None
+    if profiler is not None and profiler.memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return profiler
+
+
+# code profiler of the running process. None if code profiling is not enabled
+active_code_profiler = None
+
+# names of the files written by the code profiling
+PROCESS_STATS = "exorad_{}.pstats"
+PROCESS_STACKS = "exorad_{}.stacks"
+MERGED_STATS = "exorad.pstats"
+COLLAPSED_STACKS = "exorad_stacks.txt"
+HOTSPOTS = "exorad_hotspots.txt"
+
+
+class StackSampler(threading.Thread):
+    """
+    Samples the call stack of a thread at regular intervals, recording the time spent in each stack.
+    `cProfile` only records the calls between pairs of functions,
+    so the full stacks of a flame graph are sampled instead.
+
+    Parameters
+    ----------
+    interval: float
+        sampling interval [s]. Default is 1e-3
+    thread_id: int
+        identifier of the sampled thread. Default is the calling thread
+
+    Attributes
+    ----------
+    stacks: Counter
+        time [us] spent in each stack, as semicolon separated frames from the outermost
+    """
+
+    def __init__(self, interval=1e-3, thread_id=None):
+        super().__init__(name="StackSampler", daemon=True)
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        last = time.perf_counter()
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            # the sampler waits for the GIL during long calls to compiled code:
+            # each sample is weighted by the time elapsed since the previous one
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+            frames = []
+            while frame is not None:
+                frames.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += int(elapsed * 1e6)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def _frame_label(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return "{}:{}({})".format(
+        os.path.basename(code.co_filename), code.co_firstlineno, name
+    )
+
+
+class CodeProfiler(Logger):
+    """
+    Profiles the functions called by the process with `cProfile`
+    and samples its call stacks with a :class:`StackSampler`.
+    Each process writes its own stats and stacks files in the output directory,
+    named after the process id, so that the files of the worker processes
+    can be merged at the end of the run by :func:`merge_code_profiles`.
+
+    Parameters
+    ----------
+    out_dir: str
+        output directory of the profile files
+    interval: float
+        sampling interval of the stacks [s]. Default is 1e-3
+
+    Attributes
+    ----------
+    filenames: tuple
+        stats and stacks files of the process
+    """
+
+    def __init__(self, out_dir, interval=1e-3):
+        import cProfile
+
+        self.set_log_name()
+        self.out_dir = out_dir
+        self.interval = interval
+        self.filenames = tuple(
+            os.path.join(out_dir, name.format(os.getpid()))
+            for name in (PROCESS_STATS, PROCESS_STACKS)
+        )
+        self._profile = cProfile.Profile()
+        self._sampler = None
+
+    def start(self):
+        self._sampler = StackSampler(self.interval)
+        self._sampler.start()
+        self._profile.enable()
+
+    def stop(self):
+        """stops profiling and writes the files of the process"""
+        if self._sampler is None:
+            return
+        self._profile.disable()
+        self._sampler.stop()
+        stats_file, stacks_file = self.filenames
+        self._profile.dump_stats(stats_file)
+        with open(stacks_file, "w") as f:
+            for stack, count in self._sampler.stacks.items():
+                f.write("{} {}\n".format(stack, count))
+        self._sampler = None
+        self.debug("code profile written to %s", stats_file)
+
+
+def enable_code_profiling(out_dir, worker=False):
+    """
+    Starts profiling the code run by the process.
+
+    Parameters
+    ----------
+    out_dir: str
+        output directory of the profile files
+    worker: bool
+        if True, the process is a worker and its files are written when it exits.
+        Otherwise, the files left in the directory by previous runs are removed.
+        Default is False
+
+    Returns
+    -------
+    CodeProfiler:
+        the profiler of the process
+    """
+    global active_code_profiler
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+    if not worker:
+        for filename in _process_files(
+            out_dir, PROCESS_STATS
+        ) + _process_files(out_dir, PROCESS_STACKS):
+            os.remove(filename)
+    active_code_profiler = CodeProfiler(out_dir)
+    if worker:
+        # the pool workers exit without returning to the caller:
+        # the files are written by the multiprocessing exit handlers
+        from multiprocessing.util import Finalize
+
+        Finalize(
+            active_code_profiler, active_code_profiler.stop, exitpriority=10
+        )
+    active_code_profiler.start()
+    return active_code_profiler
+
+
+def disable_code_profiling():
+    """
+    Stops profiling and writes the files of the process.
+
+    Returns
+    -------
+    CodeProfiler:
+        the profiler of the process, or None
+    """
+    global active_code_profiler
+    profiler, active_code_profiler = active_code_profiler, None
+    if profiler is not None:
+        profiler.stop()
+    return profiler
+
+
+def _process_files(out_dir, name):
+    import glob
+
+    return sorted(glob.glob(os.path.join(out_dir, name.format("*"))))
+
+
+def merge_code_profiles(out_dir, top=30):
+    """
+    Merges the profile files written by the processes in the output directory.
+    It writes the merged `cProfile` stats, the sampled stacks in the collapsed format
+    read by flame graph tools (e.g. `flamegraph.pl` or `speedscope`) and a hotspot report.
+
+    Parameters
+    ----------
+    out_dir: str
+        output directory of the profile files
+    top: int
+        number of functions listed in the hotspot report. Default is 30
+
+    Returns
+    -------
+    dict:
+        names of the files written, by kind: `stats`, `stacks` and `hotspots`
+
+    Raises
+    ------
+    OSError
+        if no profile file is found
+    """
+    import pstats
+
+    stats_files = _process_files(out_dir, PROCESS_STATS)
+    if not stats_files:
+        raise OSError("no code profile found in {}".format(out_dir))
+    out = {
+        "stats": os.path.join(out_dir, MERGED_STATS),
+        "stacks": os.path.join(out_dir, COLLAPSED_STACKS),
+        "hotspots": os.path.join(out_dir, HOTSPOTS),
+    }
+    pstats.Stats(*stats_files).dump_stats(out["stats"])
+
+    stacks = Counter()
+    for filename in _process_files(out_dir, PROCESS_STACKS):
+        with open(filename) as f:
+            for line in f:
+                stack, count = line.rsplit(" ", 1)
+                stacks[stack] += int(count)
+    with open(out["stacks"], "w") as f:
+        for stack, count in sorted(stacks.items()):
+            f.write("{} {}\n".format(stack, count))
+
+    with open(out["hotspots"], "w") as f:
+        f.write("code profile of {} processes\n\n".format(len(stats_files)))
+        report = pstats.Stats(out["stats"], stream=f)
+        report.sort_stats("tottime").print_stats(top)
+        report.sort_stats("cumulative").print_stats(top)
+    return out
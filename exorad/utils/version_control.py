@@ -27,11 +27,11 @@ class VersionControl(Logger):
                 if message != "":
                     self.warning("### NEW CODE VERSION ONLINE ###")
                     self.warning(
-                        "your version: {}  - online version:{}".format(
-                            self.current_version, new_ver
-                        )
+                        "your version: %s  - online version:%s",
+                        self.current_version,
+                        new_ver,
                     )
-                    self.warning("changelog: \n {}".format(message))
+                    self.warning("changelog: \n %s", message)
                     if force:
                         raise VersionError(
                             "please update your code version. Your version: {} - online version:{}".format(
@@ -46,7 +46,7 @@ class VersionControl(Logger):
                 splitted_url[-2], splitted_url[-1]
             )
         )
-        self.debug("package url: {}".format(url))
+        self.debug("package url: %s", url)
         req = requests.get(url)
         if req.status_code == requests.codes.ok:
             self.status_code = True
@@ -0,0 +1,49 @@
+import argparse
+import tempfile
+import unittest
+
+import exorad.tasks as tasks
+from benchmarks.inputs import example_payload
+from benchmarks.inputs import synthetic_catalog
+from benchmarks.inputs import write_catalog
+from benchmarks.run import run
+from benchmarks.scaling import observe
+from benchmarks.suite import measure
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_catalog(self):
+        loadTargetList = tasks.LoadTargetList()
+        with tempfile.TemporaryDirectory() as tmp:
+            targets = loadTargetList(target_list=write_catalog(5, tmp)).target
+        self.assertEqual(len(targets), 5)
+        self.assertEqual(targets[0].name, 'synthetic-0 b')
+        self.assertEqual(targets[0].star.Teff.unit, 'K')
+        self.assertEqual(targets[0].planet.P.unit, 'd')
+
+        # the catalog can be passed as a QTable as well
+        catalog = synthetic_catalog(5, planets=False)
+        targets = loadTargetList(target_list=catalog).target
+        self.assertEqual(targets[0].name, 'synthetic-0')
+        self.assertEqual(targets[0].star.M, catalog['star M'][0])
+
+    def test_scaling(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            record = observe(example_payload(tmp), write_catalog(3, tmp),
+                             workers=1, batch=1)
+        self.assertEqual(record['observed'], 3)
+        self.assertGreater(record['targets_per_s'], 0)
+
+    def test_measure(self):
+        calls = []
+        timing = measure(lambda: calls.append(1), repeat=3, number=2)
+        self.assertEqual(len(calls), 6)
+        self.assertLessEqual(timing['min'], timing['median'])
+
+    def test_run(self):
+        options = argparse.Namespace(repeat=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run(['exolib.planck'], options, tmp)
+        self.assertEqual(results[0]['name'], 'exolib.planck')
+        self.assertIn('size', results[0]['params'])
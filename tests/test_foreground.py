@@ -7,9 +7,11 @@ import astropy.units as u
 import matplotlib.pyplot as plt
 import numpy as np
 from conf import skip_plot
+from test_options import assert_same_without_built
 from test_options import payload_file
 
 from exorad.log import setLogLevel
+from exorad.models.foregrounds.zodiacalForeground import load_zodiacal_map
 from exorad.models.foregrounds.zodiacalForeground import ZodiacalFrg
 from exorad.tasks import LoadTargetList
 from exorad.tasks import PreparePayload
@@ -55,6 +57,20 @@ class ZodiacalTest(unittest.TestCase):
         self.assertListEqual(list(zodi.radiance.data.value),
                              list(zodi_validation.radiance.data.value))
 
+    def test_map_query(self):
+        zodi = ZodiacalFrg(wl=self.wl, description={'zodiacFactor': {'value': 1}})
+        map_file = zodi.map_file()
+        zodi_map = load_zodiacal_map(map_file)
+        self.assertIs(zodi_map, load_zodiacal_map(map_file))
+
+        ra = [90.03841366076144, 10., 200.] * u.deg
+        dec = [-66.55432012293919, 45., -5.] * u.deg
+        coefficients = zodi_map.query(ra, dec)
+        self.assertEqual(coefficients.shape, (3,))
+        self.assertEqual(coefficients[0], 1.4536394185097168)
+        for r, d, c in zip(ra, dec, coefficients):
+            self.assertEqual(zodi.zodiacal_fit_direction((r, d)), c)
+
 
 class BackgroundHanderTest(unittest.TestCase):
     setLogLevel(logging.INFO)
@@ -79,3 +95,18 @@ class BackgroundHanderTest(unittest.TestCase):
             target=self.target,
             wl_range=(self.wl_min, self.wl_max))
         print(target.foreground['zodi'].data)
+
+    def test_foreground_response(self):
+        from copy import deepcopy
+        from exorad.tasks.foregroundHandler import EstimateForegrounds
+        estimateForegrounds = EstimateForegrounds()
+        target = estimateForegrounds(
+            foregrounds=self.payload['common']['foreground'],
+            target=deepcopy(self.target),
+            wl_range=(self.wl_min, self.wl_max))
+        self.assertNotEqual(target.foreground['zodi'].coefficient, 1.0)
+
+        for name, channel in self.channels.items():
+            assert_same_without_built(
+                self, channel, 'foreground_response',
+                lambda ch: ch.propagate_diffuse_foreground(target))
@@ -1,18 +1,28 @@
+import glob
 import logging
 import os
 import pathlib
+import tempfile
 import unittest
+from unittest import mock
 
+import astropy.units as u
 import h5py
+import numpy as np
 from test_options import payload_file
 
 from exorad.log import setLogLevel
+from exorad.models.instruments import PayloadCache
 from exorad.models.instruments import Photometer
 from exorad.models.instruments import Spectrometer
+from exorad.models.instruments.cache import fingerprints
+from exorad.models.instruments.cache import rebuild_plan
 from exorad.output.hdf5 import HDF5Output
 from exorad.tasks import MergeChannelsOutput
 from exorad.tasks.instrumentHandler import BuildChannels
 from exorad.tasks.instrumentHandler import LoadPayload
+from exorad.tasks.instrumentHandler import PreparePayload
+from exorad.tasks.instrumentHandler import RebuildChannels
 from exorad.tasks.loadOptions import LoadOptions
 
 path = pathlib.Path(__file__).parent.absolute()
@@ -85,6 +95,18 @@ class InstrumentBuilderTest(unittest.TestCase):
     def test_builder_dict(self):
         self.assertListEqual(list(self.channels.keys()), ['Phot', 'Spec'])
 
+    def test_builder_pool(self):
+        payload = loadOptions(filename=payload_file())
+        channels = self.buildChannels(payload=payload, write=False,
+                                      output=None, n_thread=2)
+        self.assertListEqual(list(channels.keys()), ['Phot', 'Spec'])
+        for name, channel in channels.items():
+            self.assertIs(channel.payload, payload)
+            self.assertIs(payload['channel'][name], channel.description)
+            for key in self.channels[name].table.keys():
+                np.testing.assert_array_equal(self.channels[name].table[key],
+                                              channel.table[key])
+
 
 class IOTest(unittest.TestCase):
     setLogLevel(logging.INFO)
@@ -102,6 +124,17 @@ class IOTest(unittest.TestCase):
         self.assertListEqual(list(self.channels_built.keys()),
                              list(self.channels_loaded.keys()))
 
+    def test_star_response_from_file(self):
+        for name, channel in self.channels_built.items():
+            wl = channel.built_instr['star_response']['wl_grid']['value'] * u.um
+            built = channel._get_star_response(wl)
+            loaded = self.channels_loaded[name]._get_star_response(wl)
+            self.assertSetEqual(set(built.keys()), set(loaded.keys()))
+            for key in built:
+                self.assertEqual(built[key][1], loaded[key][1])
+                np.testing.assert_array_equal(built[key][0].toarray(),
+                                              loaded[key][0].toarray())
+
     def test_instrument_build_from_file(self):
         with self.assertRaises(ValueError):
             self.channels_loaded['Phot'].build()
@@ -111,6 +144,112 @@ class IOTest(unittest.TestCase):
         os.remove(self.fname)
 
 
+class PayloadCacheTest(unittest.TestCase):
+
+    def test_cached_channels(self):
+        preparePayload = PreparePayload()
+        with tempfile.TemporaryDirectory() as tmp:
+            entries = os.path.join(tmp, '*.pickle')
+            with mock.patch.dict(os.environ, {'EXORAD_PAYLOAD_CACHE': tmp}):
+                _, built, wl_range = preparePayload(payload_file=payload_file(),
+                                                    output=None)
+                self.assertEqual(len(glob.glob(entries)), 1)
+                _, cached, cached_wl_range = preparePayload(
+                    payload_file=payload_file(), output=None)
+            self.assertEqual(len(glob.glob(entries)), 1)
+        self.assertEqual(wl_range, cached_wl_range)
+        self.assertListEqual(list(built.keys()), list(cached.keys()))
+        for name, channel in built.items():
+            self.assertIsNot(channel, cached[name])
+            np.testing.assert_array_equal(channel.table['Wavelength'],
+                                          cached[name].table['Wavelength'])
+
+    def test_key(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = PayloadCache(os.path.join(tmp, 'cache'))
+            datafile = os.path.join(tmp, 'data.csv')
+            with open(datafile, 'w') as f:
+                f.write('a,b\n1,2\n')
+            payload = {'common': {'qe': {'datafile': {'value': datafile}}}}
+            key = cache.key(payload_file(), payload)
+            self.assertEqual(key, cache.key(payload_file(), payload))
+            self.assertIsNone(cache.get(key))
+
+            # any change to the referenced data is a new entry
+            with open(datafile, 'w') as f:
+                f.write('a,b\n1,3\n')
+            self.assertNotEqual(key, cache.key(payload_file(), payload))
+
+    def test_rebuild_plan(self):
+        payload = loadOptions(filename=payload_file())
+        previous = fingerprints(payload)
+        self.assertDictEqual(dict(rebuild_plan(previous, previous)),
+                             {'Phot': None, 'Spec': None})
+
+        spec_optics = payload['channel']['Spec']['optics']['opticalElement']
+        spec_optics['M5']['temperature']['value'] = 65 * u.K
+        self.assertDictEqual(
+            dict(rebuild_plan(previous, fingerprints(payload))),
+            {'Phot': None, 'Spec': 'optical_path'})
+
+        payload['common']['wl_min']['value'] = 0.46 * u.um
+        self.assertDictEqual(
+            dict(rebuild_plan(previous, fingerprints(payload))),
+            {'Phot': 'star_response', 'Spec': 'optical_path'})
+
+        # the noise parameters are not used to build the channels
+        payload['channel']['Phot']['detector']['read_noise']['value'] = 16 * u.ct
+        payload['channel']['Spec']['detector']['dark_current']['value'] = \
+            2 * u.ct / u.s
+        self.assertDictEqual(
+            dict(rebuild_plan(previous, fingerprints(payload))),
+            {'Phot': 'star_response', 'Spec': 'optical_path'})
+
+        payload['channel']['Phot']['detector']['qe']['value'] = 0.6
+        self.assertDictEqual(
+            dict(rebuild_plan(previous, fingerprints(payload))),
+            {'Phot': 'qe', 'Spec': 'optical_path'})
+
+        payload['channel']['Phot']['Fnum_x']['value'] = 20
+        self.assertDictEqual(
+            dict(rebuild_plan(previous, fingerprints(payload))),
+            {'Phot': 'builder', 'Spec': 'optical_path'})
+
+        payload['common']['working_R']['value'] = 1000
+        self.assertIsNone(rebuild_plan(previous, fingerprints(payload)))
+
+    def test_rebuild(self):
+        payload = loadOptions(filename=payload_file())
+        channels = BuildChannels()(payload=payload, write=False, output=None)
+
+        payload = loadOptions(filename=payload_file())
+        optics = payload['optics']['opticalElement']
+        optics['M1']['temperature']['value'] = 85 * u.K
+        built = BuildChannels()(payload=payload, write=False, output=None)
+        rebuilt = RebuildChannels()(payload=payload, channels=channels,
+                                    plan={'Phot': 'optical_path',
+                                          'Spec': 'optical_path'})
+        for name, channel in built.items():
+            self.assertIs(rebuilt[name].payload, payload)
+            self.assertListEqual(channel.table.colnames,
+                                 rebuilt[name].table.colnames)
+            np.testing.assert_array_equal(
+                channel.table['instrument_signal'],
+                rebuilt[name].table['instrument_signal'])
+
+        payload = loadOptions(filename=payload_file())
+        payload['channel']['Phot']['detector']['qe']['value'] = 0.6
+        built = BuildChannels()(payload=payload, write=False, output=None)
+        rebuilt = RebuildChannels()(payload=payload, channels=rebuilt,
+                                    plan={'Phot': 'qe', 'Spec': None})
+        channel = built['Phot']
+        self.assertListEqual(channel.table.colnames,
+                             rebuilt['Phot'].table.colnames)
+        for key in ('QE', 'instrument_signal'):
+            np.testing.assert_array_equal(channel.table[key],
+                                          rebuilt['Phot'].table[key])
+
+
 class MergeOutputTest(unittest.TestCase):
     setLogLevel(logging.INFO)
     buildChannels = BuildChannels()
@@ -1,6 +1,9 @@
+import logging
 import unittest
 
+from exorad import log
 from exorad.log import Logger
+from exorad.log import setLogLevel
 
 
 class LoggerTest(Logger):
@@ -35,6 +38,26 @@ class LoadOptionsTest(unittest.TestCase):
                 "ERROR:exorad.LoggerTest:error",
                 cm.output)
 
+    def test_lazy_formatting(self):
+        class Value:
+            formatted = 0
+
+            def __str__(self):
+                Value.formatted += 1
+                return 'value'
+
+        logger = LoggerTest.__new__(LoggerTest)
+        logger.set_log_name()
+        previous = log.last_log
+        setLogLevel(logging.INFO)
+        logger.debug('value: %s', Value())
+        setLogLevel(previous)
+        self.assertEqual(Value.formatted, 0)
+        with self.assertLogs('exorad', level='DEBUG') as cm:
+            logger.debug('value: %s', Value())
+        self.assertEqual(Value.formatted, 1)
+        self.assertIn("DEBUG:exorad.LoggerTest:value: value", cm.output)
+
     # def test_log_file(self):
     #     print('starts here')
     #
@@ -0,0 +1,89 @@
+"""
+These tests run both serially and with MPI, as:
+
+    mpirun -n 4 python -m unittest test_mpi
+"""
+import logging
+import os
+import pathlib
+import unittest
+
+from test_options import payload_file
+
+import exorad.tasks as tasks
+from exorad.log import setLogLevel
+from exorad.utils.mpi import broadcast
+from exorad.utils.mpi import dynamic_map
+from exorad.utils.mpi import gather
+from exorad.utils.mpi import get_rank
+from exorad.utils.mpi import nprocs
+from exorad.utils.mpi import scatter
+
+path = pathlib.Path(__file__).parent.absolute()
+data_dir = os.path.join(path.parent.absolute(), 'examples')
+
+setLogLevel(logging.INFO)
+
+try:
+    import mpi4py
+    mpi_installed = True
+except ImportError:
+    mpi_installed = False
+
+
+def square(x):
+    return x ** 2
+
+
+class MPIUtilsTest(unittest.TestCase):
+
+    def test_broadcast(self):
+        data = 'root' if get_rank() == 0 else None
+        self.assertEqual(broadcast(data), 'root')
+
+    def test_dynamic_map(self):
+        items = range(10) if get_rank() == 0 else []
+        results = list(dynamic_map(square, items))
+        if get_rank() == 0:
+            self.assertListEqual(sorted(results), [x ** 2 for x in range(10)])
+        else:
+            self.assertListEqual(results, [])
+
+    @unittest.skipIf(not mpi_installed, 'mpi4py not installed')
+    def test_scatter_few_items(self):
+        # fewer items than processes
+        data = list(range(nprocs() - 1)) if nprocs() > 1 else [0]
+        shares = gather(scatter(data))
+        if get_rank() == 0:
+            self.assertListEqual(sorted(sum(shares, [])), data)
+
+
+class MPIObserveTargetlistTest(unittest.TestCase):
+    loadOptions = tasks.LoadOptions()
+    buildChannels = tasks.BuildChannels()
+    loadTargetList = tasks.LoadTargetList()
+
+    def test_obsTargetList(self):
+        # only the root process inputs are used
+        if get_rank() == 0:
+            payload = self.loadOptions(filename=payload_file())
+            wl_range = (payload['common']['wl_min']['value'],
+                        payload['common']['wl_max']['value'])
+            channels = self.buildChannels(payload=payload, write=False,
+                                          output=None)
+            targets = self.loadTargetList(
+                target_list=os.path.join(data_dir, 'test_target.csv')).target
+        else:
+            payload, channels, wl_range, targets = None, None, None, []
+
+        observeTargetList = tasks.ObserveTargetlist()
+        out = observeTargetList(targets=targets, payload=payload,
+                                channels=channels, wl_range=wl_range,
+                                plot=False, out_dir=None)
+        if get_rank() == 0:
+            self.assertSetEqual(set(out.keys()),
+                                {t.name for t in targets})
+            for name in out:
+                self.assertIn('total_noise', out[name].table.keys())
+        else:
+            self.assertDictEqual(out, {})
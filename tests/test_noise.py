@@ -1,13 +1,22 @@
+import copy
 import logging
 import os
 import pathlib
 import unittest
 
+import astropy.units as u
+import numpy as np
 from test_options import payload_file
 
 from exorad.log import disableLogging
 from exorad.log import enableLogging
 from exorad.log import setLogLevel
+from exorad.models.noise import channel_noise
+from exorad.models.noise import frame_time
+from exorad.models.noise import multiaccum
+from exorad.models.noise import photon_noise
+from exorad.models.noise import photon_noise_variance
+from exorad.models.noise import noise_sweep
 from exorad.tasks import EstimateZodi
 from exorad.tasks import LoadSource
 from exorad.tasks import LoadTargetList
@@ -57,3 +66,94 @@ class NoiseTest(unittest.TestCase):
     estimateNoise = EstimateNoise()
     target = estimateNoise(target=target, channels=channels)
     print(target.table.keys())
+
+    def test_units_boundary(self):
+        channel = self.channels['Spec']
+        rows = self.target.table['chName'] == 'Spec'
+        table = {key: self.target.table[key][rows]
+                 for key in self.target.table.keys() if 'noise' not in key}
+        out = channel_noise(table, channel.description, channel.payload)
+        self.assertEqual(out['total_noise'].unit, u.hr ** 0.5)
+        self.assertEqual(out['frameTime'].unit, u.s)
+
+        # the same signals in other units give the same noise
+        converted = {key: col.to(u.ct / u.hr)
+                     if getattr(col, 'unit', None) == u.ct / u.s else col
+                     for key, col in table.items()}
+        out_converted = channel_noise(converted, channel.description,
+                                      channel.payload)
+        for key in out:
+            np.testing.assert_allclose(
+                out_converted[key].to_value(out[key].unit), out[key].value,
+                rtol=1e-12)
+
+        table['star_signal_inAperture'] = table['starFlux']
+        with self.assertRaises(u.UnitConversionError):
+            channel_noise(table, channel.description, channel.payload)
+
+    def test_noise_steps(self):
+        channel = self.channels['Spec']
+        rows = self.target.table['chName'] == 'Spec'
+        table = {key: self.target.table[key][rows]
+                 for key in self.target.table.keys() if 'noise' not in key}
+        expected = channel_noise(table, channel.description, channel.payload)
+
+        out = frame_time(self.target, channel.description, {})
+        for key in ('saturation_time', 'frameTime'):
+            np.testing.assert_allclose(out[key].to_value(u.s),
+                                       expected[key].to_value(u.s),
+                                       rtol=1e-12)
+
+        read_gain, shot_gain = multiaccum(channel.description,
+                                          out['frameTime'][0])
+        self.assertIsInstance(read_gain, float)
+        self.assertIsInstance(shot_gain, float)
+
+        out = photon_noise(table, channel.description, shot_gain, out)
+        for key in table:
+            if 'signal' in key:
+                np.testing.assert_allclose(
+                    out[key + '_noise'].value,
+                    expected[key + '_noise'].to_value(out[key + '_noise'].unit),
+                    rtol=1e-12)
+        variance = photon_noise_variance(table, out)
+        self.assertEqual(variance.unit, (u.ct / u.s) ** 2 * u.hr)
+        self.assertEqual(variance.shape, out['frameTime'].shape)
+
+    def test_noise_sweep(self):
+        channel = self.channels['Spec']
+        rows = self.target.table['chName'] == 'Spec'
+        table = {key: self.target.table[key][rows]
+                 for key in self.target.table.keys() if 'noise' not in key}
+        grid, out = noise_sweep(table, channel.description, channel.payload,
+                                read_noise=[10, 30] * u.ct,
+                                dark_current=[1, 5, 50] * u.ct / u.s,
+                                freq_ndr=[0.1, 1] * u.Hz)
+        n_bins = len(table['Wavelength'])
+        self.assertEqual(out['total_noise'].shape, (2, 3, 2, 1, n_bins))
+        self.assertEqual(grid['well_depth'].size, 1)
+        self.assertEqual(out['read_gain'].shape, out['total_noise'].shape)
+
+        # every grid point matches the noise of the edited description
+        for i, j, k in np.ndindex(2, 3, 2):
+            description = copy.deepcopy(channel.description)
+            detector = description['detector']
+            detector['read_noise']['value'] = grid['read_noise'][i]
+            detector['dark_current']['value'] = grid['dark_current'][j]
+            detector['freqNDR']['value'] = grid['freqNDR'][k]
+            expected = channel_noise(table, description, channel.payload)
+            for key in expected:
+                np.testing.assert_allclose(
+                    out[key][i, j, k, 0].to_value(expected[key].unit),
+                    expected[key].value, rtol=1e-12, err_msg=key)
+
+        # the well depth changes the saturation time
+        grid, out = noise_sweep(table, channel.description,
+                                well_depth=[1e4, 1e5] * u.ct)
+        np.testing.assert_allclose(out['saturation_time'][0, 0, 0, 1],
+                                   10 * out['saturation_time'][0, 0, 0, 0])
+
+        with self.assertRaises(ValueError):
+            noise_sweep(table, channel.description, read_noise=[] * u.ct)
+        with self.assertRaises(u.UnitConversionError):
+            noise_sweep(table, channel.description, freq_ndr=[1] * u.s)
@@ -1,3 +1,4 @@
+import copy
 import logging
 import os
 import pathlib
@@ -13,6 +14,7 @@ from exorad.log import setLogLevel
 from exorad.models.instruments import Photometer
 from exorad.models.instruments import Spectrometer
 from exorad.models.optics.opticalPath import OpticalPath
+from exorad.models.optics.opticalPath import surface_radiance
 from exorad.tasks.loadOptions import LoadOptions
 
 path = pathlib.Path(__file__).parent.absolute()
@@ -70,6 +72,68 @@ class InstrumentDiffuseLightTest(unittest.TestCase):
             plt.legend()
             plt.show()
 
+    def test_chain(self):
+        wl_grid = np.logspace(np.log10(
+            options['channel']['Spec']['detector']['wl_min']['value'].value),
+                              np.log10(options['channel']['Spec']['detector'][
+                                           'cut_off']['value'].value),
+                              6000) * u.um
+        telescope = OpticalPath(wl=wl_grid, description=options)
+        telescope.chain()
+        spec = OpticalPath(wl=wl_grid, description=options['channel']['Spec'])
+        spec.prepend_optical_elements(telescope.optical_element_dict)
+        spec.build_transmission_table()
+        radiances = spec.chain()
+
+        # the radiances of the stacked path match the element by element propagation
+        elements = list(spec.optical_element_dict.values())
+        for i, el in enumerate(elements):
+            if el.temperature is None:
+                self.assertNotIn(el.name, radiances)
+                continue
+            radiance = surface_radiance(wl_grid, el.temperature,
+                                        el.emissivity).data
+            for other in elements[i + 1:]:
+                radiance = radiance * other.transmission
+            np.testing.assert_allclose(radiances[el.name].data, radiance,
+                                       rtol=1e-12)
+            self.assertEqual(bool(radiances[el.name].slit),
+                             any(other.type == 'slit'
+                                 for other in elements[i + 1:]))
+        self.assertIsNotNone(spec.slit_width)
+
+    def test_thermal_sweep(self):
+        spectrometer = Spectrometer('Spec', options['channel']['Spec'],
+                                    options)
+        spectrometer.build()
+        sweep = spectrometer.thermal_sweep({'M1': [60, 80] * u.K,
+                                            'optics': [40, 50, 60] * u.K})
+        n_bins = len(spectrometer.table)
+        self.assertEqual(sweep['instrument_signal'].shape, (2, 3, n_bins))
+        self.assertEqual(sweep['surface_radiance']['M1'].shape,
+                         (2, spectrometer.opticalPath.wl.size))
+        self.assertEqual(sweep['signal']['optics'].shape, (3, n_bins))
+
+        # the nominal temperatures give the built signal
+        for col in ['instrument_signal', 'instrument_MaxSignal_inPixel']:
+            np.testing.assert_allclose(sweep[col][1, 2],
+                                       spectrometer.table[col], rtol=1e-12)
+
+        # any other point of the grid matches a payload built at its temperatures
+        payload = copy.deepcopy(options)
+        payload['optics']['opticalElement']['M1']['temperature'] = {
+            'value': 60 * u.K}
+        payload['channel']['Spec']['optics']['opticalElement']['optics'][
+            'temperature'] = {'value': 40 * u.K}
+        check = Spectrometer('Spec', payload['channel']['Spec'], payload)
+        check.build()
+        for col in ['instrument_signal', 'instrument_MaxSignal_inPixel']:
+            np.testing.assert_allclose(sweep[col][0, 0], check.table[col],
+                                       rtol=1e-10)
+
+        with self.assertRaises(KeyError):
+            spectrometer.thermal_sweep({'M0': 60 * u.K})
+
     def test_signal(self):
         setLogLevel(logging.INFO)
 
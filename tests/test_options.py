@@ -2,6 +2,9 @@ import logging
 import os
 import pathlib
 import unittest
+from copy import deepcopy
+
+import numpy as np
 
 from exorad.log import setLogLevel
 from exorad.tasks import GetChannelList
@@ -32,6 +35,37 @@ def payload_file(source=path.parent.absolute(), destination=test_dir,
     return tmp
 
 
+def assert_same_without_built(test, channel, entry, propagate):
+    """
+    Checks that a channel propagates the same columns with and without
+    a precomputed entry of its built_instr, as the star or foreground responses.
+
+    Parameters
+    ----------
+    test: unittest.TestCase
+        running test
+    channel: Instrument
+        built channel
+    entry: str
+        built_instr entry to remove
+    propagate: callable
+        propagation to compare, called with the channel
+    """
+    test.assertIn(entry, channel.built_instr)
+    out = propagate(channel)
+
+    reference = deepcopy(channel)
+    reference.built_instr.pop(entry)
+    reference._star_response = None
+    expected = propagate(reference)
+
+    test.assertListEqual(list(out.keys()), list(expected.keys()))
+    for key in expected.keys():
+        test.assertEqual(out[key].unit, expected[key].unit)
+        np.testing.assert_allclose(out[key].value, expected[key].value,
+                                   rtol=1e-10)
+
+
 class LoadOptionsTest(unittest.TestCase):
     loadOptions = LoadOptions()
 
@@ -64,6 +64,52 @@ class PipelineTest(unittest.TestCase):
                                    channels=self.channels,
                                    wl_range=(self.wl_min, self.wl_max))
 
+    def test_obsTargetBatch(self):
+        import numpy as np
+        from copy import deepcopy
+        observeTarget = tasks.ObserveTarget()
+        observeTargetBatch = tasks.ObserveTargetBatch()
+
+        single = [observeTarget(target=deepcopy(target), payload=self.payload,
+                                channels=self.channels,
+                                wl_range=(self.wl_min, self.wl_max))
+                  for target in self.targets.target]
+        batch = observeTargetBatch(targets=deepcopy(self.targets.target),
+                                   payload=self.payload,
+                                   channels=self.channels,
+                                   wl_range=(self.wl_min, self.wl_max))
+        self.assertEqual(len(single), len(batch))
+        for target, batch_target in zip(single, batch):
+            self.assertEqual(target.name, batch_target.name)
+            self.assertEqual(target.table.meta, batch_target.table.meta)
+            for key in target.table.keys():
+                # 'sky TR' is copied from the channel tables,
+                # where it is left by the last target observed
+                if key in ['chName', 'sky TR']:
+                    continue
+                np.testing.assert_allclose(
+                    batch_target.table[key], target.table[key], rtol=1e-9)
+
+    def test_obsTargetList_batch(self):
+        import numpy as np
+        observeTargetList = tasks.ObserveTargetlist()
+
+        serial = observeTargetList(targets=self.targets.target,
+                                   payload=self.payload,
+                                   channels=self.channels,
+                                   wl_range=(self.wl_min, self.wl_max),
+                                   plot=False, out_dir=None)
+        batch = observeTargetList(targets=self.targets.target,
+                                  payload=self.payload,
+                                  channels=self.channels,
+                                  wl_range=(self.wl_min, self.wl_max),
+                                  plot=False, out_dir=None, batch_size=2)
+        self.assertSetEqual(set(serial.keys()), set(batch.keys()))
+        for name in serial:
+            np.testing.assert_allclose(
+                serial[name].table['total_noise'].value,
+                batch[name].table['total_noise'].value)
+
     def test_obsTargetList(self):
         observeTargetList = tasks.ObserveTargetlist()
 
@@ -72,3 +118,244 @@ class PipelineTest(unittest.TestCase):
                                     channels=self.channels,
                                     wl_range=(self.wl_min, self.wl_max),
                                     plot=False, out_dir=None)
+
+    def test_obsTargetList_parallel(self):
+        import numpy as np
+        observeTargetList = tasks.ObserveTargetlist()
+
+        serial = observeTargetList(targets=self.targets.target,
+                                   payload=self.payload,
+                                   channels=self.channels,
+                                   wl_range=(self.wl_min, self.wl_max),
+                                   plot=False, out_dir=None)
+        parallel = observeTargetList(targets=self.targets.target,
+                                     payload=self.payload,
+                                     channels=self.channels,
+                                     wl_range=(self.wl_min, self.wl_max),
+                                     plot=False, out_dir=None, n_thread=2)
+        self.assertSetEqual(set(serial.keys()), set(parallel.keys()))
+        for name in serial:
+            np.testing.assert_allclose(
+                serial[name].table['total_noise'].value,
+                parallel[name].table['total_noise'].value)
+
+    def test_obsTargetList_profiling(self):
+        from exorad.utils import profiling
+
+        observeTargetList = tasks.ObserveTargetlist()
+        profiler = profiling.enable_profiling()
+        try:
+            observeTargetList(targets=self.targets.target,
+                              payload=self.payload,
+                              channels=self.channels,
+                              wl_range=(self.wl_min, self.wl_max),
+                              plot=False, out_dir=None, n_thread=2)
+        finally:
+            profiling.disable_profiling()
+        # the targets observed by the workers are nested in the target list
+        stats = profiler.stats[('ObserveTargetlist', 'ObserveTarget')]
+        self.assertEqual(stats[0], len(self.targets.target))
+        self.assertIn(('ObserveTargetlist', 'ObserveTarget', 'EstimateNoise'),
+                      profiler.stats)
+
+    def test_obsTargetList_code_profiling(self):
+        import pstats
+        import tempfile
+        from exorad.utils import profiling
+
+        observeTargetList = tasks.ObserveTargetlist()
+        with tempfile.TemporaryDirectory() as out_dir:
+            profiling.enable_code_profiling(out_dir)
+            try:
+                observeTargetList(targets=self.targets.target,
+                                  payload=self.payload,
+                                  channels=self.channels,
+                                  wl_range=(self.wl_min, self.wl_max),
+                                  plot=False, out_dir=None, n_thread=2)
+            finally:
+                profiling.disable_code_profiling()
+            files = profiling.merge_code_profiles(out_dir, top=10)
+
+            # the workers write their files when they exit
+            with open(files['hotspots']) as f:
+                self.assertIn('code profile of 3 processes', f.read())
+            stats = pstats.Stats(files['stats'])
+            self.assertTrue(any(func[2] == 'channel_noise'
+                                for func in stats.stats))
+            with open(files['stacks']) as f:
+                stacks = f.read().splitlines()
+            self.assertTrue(any('pipeline_in_worker' in stack
+                                for stack in stacks))
+            self.assertTrue(all(int(stack.rsplit(' ', 1)[1]) >= 0
+                                for stack in stacks))
+
+    def test_obsTargetList_writer(self):
+        import h5py
+        from exorad.output.hdf5 import HDF5TargetWriter
+
+        observeTargetList = tasks.ObserveTargetlist()
+        fname = os.path.join(path, 'output_test_writer.h5')
+        with HDF5TargetWriter(fname, append=False) as writer:
+            targets = observeTargetList(targets=self.targets.target,
+                                        payload=self.payload,
+                                        channels=self.channels,
+                                        wl_range=(self.wl_min, self.wl_max),
+                                        plot=False, out_dir=None,
+                                        writer=writer)
+        self.assertTrue(all(t is None for t in targets.values()))
+        with h5py.File(fname, 'r') as f:
+            self.assertSetEqual(set(f['targets'].keys()),
+                                {t.name for t in self.targets.target})
+        os.remove(fname)
+
+    def test_resume(self):
+        import tempfile
+        import h5py
+        from exorad import standard_pipeline
+
+        target_list = os.path.join(data_dir, 'test_target.csv')
+        names = {t.name for t in self.targets.target}
+        with tempfile.TemporaryDirectory() as out_dir:
+            fname = os.path.join(out_dir, 'output_test_resume.h5')
+            standard_pipeline(payload_file(), target_list, output=fname)
+
+            # simulate an interrupted run: a target was not completely written
+            with h5py.File(fname, 'a') as f:
+                first, second = sorted(f['targets'].keys())
+                f['targets'][first].attrs['kept'] = True
+                del f['targets'][second].attrs['completed']
+                f['targets'][second].attrs['kept'] = True
+
+            standard_pipeline(payload_file(), target_list, output=fname,
+                              resume=True)
+            with h5py.File(fname, 'r') as f:
+                self.assertSetEqual(set(f['targets'].keys()), names)
+                for name in names:
+                    self.assertTrue(f['targets'][name].attrs['completed'])
+                # only the incomplete target is observed again
+                self.assertTrue(f['targets'][first].attrs['kept'])
+                self.assertNotIn('kept', f['targets'][second].attrs)
+
+    def test_resume_unmarked(self):
+        import tempfile
+        import h5py
+        from exorad import standard_pipeline
+
+        target_list = os.path.join(data_dir, 'test_target.csv')
+        names = {t.name for t in self.targets.target}
+        with tempfile.TemporaryDirectory() as out_dir:
+            fname = os.path.join(out_dir, 'output_test_resume.h5')
+            standard_pipeline(payload_file(), target_list, output=fname)
+
+            # a file written before the targets were marked as completed
+            with h5py.File(fname, 'a') as f:
+                del f.attrs['exorad_writer']
+                first, second = sorted(f['targets'].keys())
+                del f['targets'][first]
+                del f['targets'][second].attrs['completed']
+                f['targets'][second].attrs['kept'] = True
+
+            standard_pipeline(payload_file(), target_list, output=fname,
+                              resume=True)
+            with h5py.File(fname, 'r') as f:
+                self.assertSetEqual(set(f['targets'].keys()), names)
+                # the old target is not observed again
+                self.assertTrue(f['targets'][second].attrs['kept'])
+                self.assertTrue(f['targets'][first].attrs['completed'])
+
+    def test_resume_first_target_interrupted(self):
+        import tempfile
+        import h5py
+        from exorad import standard_pipeline
+
+        target_list = os.path.join(data_dir, 'test_target.csv')
+        names = {t.name for t in self.targets.target}
+        with tempfile.TemporaryDirectory() as out_dir:
+            fname = os.path.join(out_dir, 'output_test_resume.h5')
+            standard_pipeline(payload_file(), target_list, output=fname)
+
+            # the run stopped while writing its first target
+            with h5py.File(fname, 'a') as f:
+                first, second = sorted(f['targets'].keys())
+                del f['targets'][first]
+                del f['targets'][second].attrs['completed']
+                f['targets'][second].attrs['kept'] = True
+
+            standard_pipeline(payload_file(), target_list, output=fname,
+                              resume=True)
+            with h5py.File(fname, 'r') as f:
+                self.assertSetEqual(set(f['targets'].keys()), names)
+                for name in names:
+                    self.assertTrue(f['targets'][name].attrs['completed'])
+                # the incomplete target is observed again
+                self.assertNotIn('kept', f['targets'][second].attrs)
+
+    def test_resume_other_payload(self):
+        import tempfile
+        import h5py
+        from exorad import standard_pipeline
+
+        target_list = os.path.join(data_dir, 'test_target.csv')
+        names = {t.name for t in self.targets.target}
+        with tempfile.TemporaryDirectory() as out_dir:
+            fname = os.path.join(out_dir, 'output_test_resume.h5')
+            standard_pipeline(payload_file(), target_list, output=fname)
+            with h5py.File(fname, 'a') as f:
+                first, second = sorted(f['targets'].keys())
+                del f['targets'][second].attrs['completed']
+
+            new_payload = os.path.join(out_dir, 'payload_resume.xml')
+            with open(payload_file()) as old, open(new_payload, 'w') as new:
+                for line in old:
+                    new.write(line.replace('>15</read_noise>',
+                                           '>30</read_noise>'))
+            with self.assertRaises(ValueError):
+                standard_pipeline(new_payload, target_list, output=fname,
+                                  resume=True)
+            # the file is left as it was
+            with h5py.File(fname, 'r') as f:
+                self.assertSetEqual(set(f['targets'].keys()), names)
+
+    def test_renoise(self):
+        import tempfile
+        import h5py
+        import numpy as np
+        from astropy.table import QTable
+        from exorad import renoise_pipeline
+        from exorad import standard_pipeline
+        from exorad.output.hdf5.util import load_table
+
+        def read_tables(fname):
+            with h5py.File(fname, 'r') as f:
+                return {name: QTable(load_table(f['targets'][name]['table'],
+                                                'table'))
+                        for name in f['targets']}
+
+        target_list = os.path.join(data_dir, 'test_target.csv')
+        with tempfile.TemporaryDirectory() as out_dir:
+            # a payload with new detector parameters
+            new_payload = os.path.join(out_dir, 'payload_renoise.xml')
+            with open(payload_file()) as old, open(new_payload, 'w') as new:
+                for line in old:
+                    new.write(line.replace('>15</read_noise>',
+                                           '>30</read_noise>'))
+
+            fname = os.path.join(out_dir, 'output_test.h5')
+            standard_pipeline(payload_file(), target_list, output=fname)
+            renoise_name = os.path.join(out_dir, 'output_test_renoise.h5')
+            renoise_pipeline(new_payload, fname, renoise_name, batch_size=1)
+            expected_name = os.path.join(out_dir, 'output_test_new.h5')
+            standard_pipeline(new_payload, target_list, output=expected_name)
+
+            renoise = read_tables(renoise_name)
+            expected = read_tables(expected_name)
+            self.assertSetEqual(set(renoise), set(expected))
+            for name in expected:
+                self.assertListEqual(renoise[name].colnames,
+                                     expected[name].colnames)
+                for key in ['read_noise', 'total_noise', 'frameTime']:
+                    np.testing.assert_allclose(renoise[name][key],
+                                               expected[name][key],
+                                               rtol=1e-12)
+            with self.assertRaises(ValueError):
+                renoise_pipeline(new_payload, fname, fname)
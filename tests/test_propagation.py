@@ -3,6 +3,9 @@ import os
 import pathlib
 import unittest
 
+import astropy.units as u
+import numpy as np
+from test_options import assert_same_without_built
 from test_options import payload_file
 
 from exorad.log import setLogLevel
@@ -13,6 +16,9 @@ from exorad.tasks import PreparePayload
 from exorad.tasks import PrepareTarget
 from exorad.tasks import PropagateForegroundLight
 from exorad.tasks import PropagateTargetLight
+from exorad.utils.binning import BinningPlan
+from exorad.utils.exolib import rebin
+from exorad.utils.exolib import rebin_matrix
 
 preparePayload = PreparePayload()
 loadTargetList = LoadTargetList()
@@ -46,6 +52,87 @@ class TargetPropagationTest(unittest.TestCase):
 
         print(target.table)
 
+    def test_star_response(self):
+        for name, channel in self.channels.items():
+            assert_same_without_built(
+                self, channel, "star_response",
+                lambda ch: ch.propagate_target(self.target))
+
+    def test_rebin_matrix(self):
+        from scipy.interpolate import interp1d
+        from scipy.stats import binned_statistic
+
+        xp = np.logspace(0, 1, 6000) * u.um
+        fp = np.random.random_sample((3, xp.size))
+
+        # binning
+        x = np.linspace(2, 8, 300) * u.um
+        bin_x = 0.5 * (x[1:] + x[:-1]).value
+        bin_x = np.concatenate([[x[0].value - (bin_x[0] - x[0].value) / 2],
+                                bin_x,
+                                [x[-1].value + (x[-1].value - bin_x[-1]) / 2]])
+        idx = np.logical_and(xp > 0.9 * x.min(), xp < 1.1 * x.max())
+        expected = binned_statistic(xp[idx].value, fp[:, idx], bins=bin_x,
+                                    statistic='mean')[0]
+        new_x, new_f = rebin(x, xp, fp)
+        matrix_x, matrix = rebin_matrix(x, xp)
+        np.testing.assert_array_equal(new_x, x)
+        np.testing.assert_array_equal(matrix_x, x)
+        np.testing.assert_allclose(new_f.value, expected, rtol=1e-12)
+        np.testing.assert_allclose((matrix @ fp.T).T, expected, rtol=1e-12)
+
+        # interpolation
+        x = np.logspace(0.1, 0.9, 20000) * u.um
+        expected = interp1d(xp.value, fp, fill_value=0.0,
+                            bounds_error=False)(x.value)
+        new_x, new_f = rebin(x, xp, fp)
+        np.testing.assert_allclose(new_f.value, expected, rtol=1e-12)
+
+        # empty bins and duplicates
+        xp = np.sort(np.concatenate([np.linspace(1, 2, 50), [1.5, 1.5]])) * u.um
+        x = np.linspace(1, 2, 20) * u.um
+        fp = np.ones(xp.size)
+        new_x, new_f = rebin(x, np.append(xp, 10 * u.um), np.append(fp, 1))
+        self.assertEqual(new_f.unit, u.dimensionless_unscaled)
+        np.testing.assert_array_equal(new_f, 1)
+
+    def test_binning_plan(self):
+        grid = np.random.permutation(np.linspace(1, 10, 1000)) * u.um
+        data = np.random.random_sample((2, grid.size)) * u.W
+        # edges on the grid samples
+        left = np.sort(grid)[[0, 111, 389, 400]]
+        right = np.sort(grid)[[111, 389, 400, 888]]
+        for closed, masks in (
+                ('left', [(grid >= l) & (grid < r) for l, r in zip(left, right)]),
+                ('right', [(grid > l) & (grid <= r) for l, r in zip(left, right)]),
+                ('neither', [(grid > l) & (grid < r) for l, r in zip(left, right)])):
+            plan = BinningPlan(grid, left, right, closed)
+            np.testing.assert_array_equal(plan.counts, [m.sum() for m in masks])
+            for method in ('sum', 'mean', 'max'):
+                expected = np.stack([getattr(data[:, m], method)(axis=-1).value
+                                     for m in masks], axis=-1)
+                binned = getattr(plan, method)(data)
+                self.assertEqual(binned.unit, u.W)
+                np.testing.assert_allclose(binned.value, expected, rtol=1e-12)
+            np.testing.assert_allclose(plan.matrix() @ data[0].value,
+                                       plan.sum(data[0]).value, rtol=1e-12)
+
+        # edges in a different unit
+        plan = BinningPlan(grid, [2000.0, 4500.0] * u.nm,
+                           [4500.0, 9000.0] * u.nm)
+        np.testing.assert_array_equal(
+            plan.counts, [np.sum((grid >= 2 * u.um) & (grid < 4.5 * u.um)),
+                          np.sum((grid >= 4.5 * u.um) & (grid < 9 * u.um))])
+
+        # empty and overlapping bins
+        plan = BinningPlan(grid, [1.0, 3.0, 20.0] * u.um,
+                           [5.0, 4.0, 30.0] * u.um)
+        self.assertEqual(plan.sum(data).shape, (2, 3))
+        np.testing.assert_array_equal(plan.sum(data)[:, 2], 0)
+        self.assertTrue(np.all(np.isnan(plan.mean(data)[:, 2])))
+        with self.assertRaises(ValueError):
+            plan.max(data)
+
 
 class BackgroundPropagationTest(unittest.TestCase):
     setLogLevel(logging.INFO)
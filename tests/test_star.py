@@ -116,6 +116,75 @@ class StarTest(unittest.TestCase):
     #     plt.legend()
     #     plt.show()
 
+    def test_phoenix_library(self):
+        import tempfile
+        from exorad.models.source import load_phoenix_library
+
+        names = ['lte030-4.5-0.0a+0.0.BT-Settl.spec.fits.gz',
+                 'lte031-4.5-0.0a+0.0.BT-Settl.spec.fits.gz',
+                 'lte030-5.0-0.0a+0.0.BT-Settl.spec.fits.gz']
+        with tempfile.TemporaryDirectory() as path:
+            for name in names:
+                open(os.path.join(path, name), 'w').close()
+
+            library = load_phoenix_library(path)
+            self.assertIs(library, load_phoenix_library(path))
+            self.assertEqual(len(library.files), 3)
+
+            ph_file = library.select(3016 * u.K, 4.6, 0.0)
+            self.assertEqual(os.path.basename(ph_file), names[0])
+            ph_file = library.select(3080 * u.K, 4.6, 0.0)
+            self.assertEqual(os.path.basename(ph_file), names[1])
+            with self.assertRaises(ValueError):
+                library.select(5000 * u.K, 4.5, 0.0)
+
+            # a modified directory is indexed again
+            os.remove(os.path.join(path, names[1]))
+            os.utime(path, ns=(0, 0))
+            library = load_phoenix_library(path)
+            self.assertEqual(len(library.files), 2)
+
+    def test_sed_cache(self):
+        import tempfile
+        from astropy.io import fits
+        from exorad.models.source import SedCache
+        from exorad.models.source import Star
+        from exorad.models.signal import Sed
+
+        wl = np.linspace(0.1, 10, 20000)
+        flux = 1e7 * np.exp(-((wl - 1.0) / 0.5) ** 2)
+        wl_grid = np.logspace(np.log10(0.5), np.log10(5), 1000) * u.um
+        target = {'D': 12.975 * u.pc, 'T': 3016 * u.K, 'R': 0.218 * u.Rsun}
+
+        with tempfile.TemporaryDirectory() as path:
+            hdu = fits.BinTableHDU.from_columns(
+                [fits.Column(name='Wavelength', format='D', array=wl,
+                             unit='um'),
+                 fits.Column(name='Flux', format='D', array=flux,
+                             unit='W / (m2 um)')])
+            hdu.header['PHXLUM'] = 1e24
+            hdu.writeto(os.path.join(
+                path, 'lte030-4.5-0.0a+0.0.BT-Settl.spec.fits.gz'))
+            cache = SedCache(os.path.join(path, 'cache'))
+
+            def star(sed_cache=None):
+                return Star(path, target['D'], target['T'], 4.5, 0.0,
+                            target['R'], wl_grid=wl_grid,
+                            sed_cache=sed_cache)
+
+            expected = star()
+            expected_sed = Sed(expected.sed.wl_grid, expected.sed.data)
+            expected_sed.spectral_rebin(wl_grid)
+            for i in range(2):
+                cached = star(cache)
+                self.assertEqual(len(os.listdir(cache.path)), 2)
+                np.testing.assert_array_equal(cached.sed.wl_grid, wl_grid)
+                np.testing.assert_allclose(cached.sed.data,
+                                           expected_sed.data, rtol=1e-12)
+                self.assertAlmostEqual(cached.luminosity / expected.luminosity,
+                                       1.0, places=12)
+                self.assertEqual(cached.model, expected.model)
+
     def test_BB_star(self):
         from exorad.models.source import Star
 
@@ -3,6 +3,7 @@ import unittest
 
 from exorad.log import setLogLevel
 from exorad.tasks.task import Task
+from exorad.utils import profiling
 
 setLogLevel(logging.DEBUG)
 
@@ -28,6 +29,16 @@ class TaskTestTask2(Task):
         pass
 
 
+class TaskTestTask3(Task):
+
+    def __init__(self):
+        self.addTaskParam('n', 'number of nested calls')
+
+    def execute(self):
+        for i in range(self.get_task_param('n')):
+            TaskTestTask1()(input1=1, input2=2)
+
+
 class TaskTest(unittest.TestCase):
     task1 = TaskTestTask1()
     task2 = TaskTestTask2()
@@ -44,3 +55,31 @@ class TaskTest(unittest.TestCase):
             self.task1(input1=1, input2=2)
         except ValueError:
             self.fail("TaskTest() raised ValueErros unexpectedly!")
+
+    def test_profiling(self):
+        profiler = profiling.enable_profiling(memory=True)
+        try:
+            TaskTestTask3()(n=3)
+            self.task1(input1=1, input2=2)
+        finally:
+            self.assertIs(profiling.disable_profiling(), profiler)
+        self.assertIsNone(profiling.active_profiler)
+        self.assertListEqual(list(profiler.stats.keys()),
+                             [('TaskTestTask3',),
+                              ('TaskTestTask3', 'TaskTestTask1'),
+                              ('TaskTestTask1',)])
+        self.assertEqual(profiler.stats[('TaskTestTask3', 'TaskTestTask1')][0],
+                         3)
+        table = profiler.table()
+        self.assertListEqual(list(table['calls']), [1, 3, 1])
+        self.assertIn('memory', table.keys())
+        self.assertTrue(table['wall_time'][0] >= table['wall_time'][1])
+
+        # the stats of a worker are nested in the given stage
+        worker = profiling.TaskProfiler()
+        with worker.stage('TaskTestTask1'):
+            pass
+        profiler.merge(worker.pop_stats(), prefix=('TaskTestTask3',))
+        self.assertEqual(profiler.stats[('TaskTestTask3', 'TaskTestTask1')][0],
+                         4)
+        self.assertDictEqual(worker.stats, {})